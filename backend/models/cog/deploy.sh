@@ -11,4 +11,5 @@ python /home/ubuntu/CogVideo/inference/inference.py \
     --prompt_path /home/ubuntu/text2vid-viewer/prompts.txt \
     --save_dir /home/ubuntu/data/cog \
     --model_path THUDM/CogVideoX-5b \
-    --generate_type "t2v"
\ No newline at end of file
+    --generate_type "t2v" \
+    ${SHARD:+--shard "$SHARD"}
\ No newline at end of file
@@ -1,6 +1,7 @@
 import argparse
 import os
 import re
+import sys
 from typing import List, Literal, Optional
 
 import torch
@@ -13,70 +14,314 @@ from diffusers import (
 )
 from diffusers.utils import export_to_video, load_image, load_video
 
+# Shared resume layer (skips prompts that were already generated)
+sys.path.insert(0, "/home/ubuntu/text2vid-viewer/backend/utils")
+from resume import ResumeIndex, clear_done_marker, mark_done, output_file_name, shard_prompts, unquote_prompt
+from embedding_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_GB, EmbeddingCache, encode_with_cache
+from offload import GB, OFFLOAD_POLICIES, apply_offload_policy
 
-def generate_video(
-    prompt: str,
+# Generation parameters a request of the service (--serve) can override
+SERVICE_OPTIONS = {"seed": int, "num_inference_steps": int, "guidance_scale": float}
+
+# Peak GPU memory of decoding 49 frames at 720x480 without VAE slicing and tiling
+VAE_DECODE_GB = 24
+
+# Length the CogVideoX pipelines pad the T5 prompt embeddings to (max_sequence_length)
+TEXT_MAX_LENGTH = 226
+
+
+# Function to get the seed of each video of a prompt (the i-th video is seeded with seed + i)
+def get_video_seeds(seed, num_videos_per_prompt):
+    return [seed + i for i in range(num_videos_per_prompt)]
+
+
+def get_prompt_embeds(pipe, prompts, num_videos_per_prompt, embedding_cache):
+    """
+    Embeddings of prompts and of the empty negative prompt, read from the embedding cache
+    when a prompt was already encoded with the same text encoder.
+
+    :param pipe: The pre-initialized pipeline object.
+    :param prompts: List of prompts.
+    :param num_videos_per_prompt: Number of videos generated for each prompt.
+    :param embedding_cache: EmbeddingCache.
+    :return: The prompt embeddings and the negative prompt embeddings, one row per video.
+    """
+    encoder_id = f"{pipe.name_or_path}/text_encoder:{pipe.text_encoder.dtype}"
+
+    def encode(prompts):
+        prompt_embeds, _ = pipe.encode_prompt(
+            prompt=prompts, do_classifier_free_guidance=False, num_videos_per_prompt=1, max_sequence_length=TEXT_MAX_LENGTH
+        )
+        return {"prompt_embeds": prompt_embeds}
+
+    embeds = encode_with_cache(
+        embedding_cache, encoder_id, TEXT_MAX_LENGTH, prompts + [""], encode, device=pipe._execution_device
+    )["prompt_embeds"]
+    return (
+        embeds[:-1].repeat_interleave(num_videos_per_prompt, dim=0),
+        embeds[-1:].repeat_interleave(len(prompts) * num_videos_per_prompt, dim=0),
+    )
+
+
+def generate_videos(
+    prompts: List[str],
     pipe,
-    output_path: str = "./output.mp4",
+    output_paths: List[str],
     image: Optional[torch.Tensor] = None,
     video: Optional[torch.Tensor] = None,
     num_inference_steps: int = 50,
     guidance_scale: float = 6.0,
     num_videos_per_prompt: int = 1,
     seed: int = 42,
+    embedding_cache: Optional[EmbeddingCache] = None,
 ):
     """
-    Generates a video based on the given prompt and saves it to the specified path.
+    Generates the videos of a batch of prompts in a single call of the pipeline and saves them to the specified paths.
 
     Parameters:
-    - prompt (str): The description of the video to be generated.
+    - prompts (List[str]): The descriptions of the videos to be generated.
     - pipe: The pre-initialized pipeline object.
-    - output_path (str): The path where the generated video will be saved.
+    - output_paths (List[str]): The paths where the generated videos will be saved, one per prompt.
     - image (Optional[torch.Tensor]): The image tensor for image-to-video generation.
     - video (Optional[torch.Tensor]): The video tensor for video-to-video generation.
     - num_inference_steps (int): Number of steps for the inference process. More steps can result in better quality.
     - guidance_scale (float): The scale for classifier-free guidance. Higher values can lead to better alignment with the prompt.
     - num_videos_per_prompt (int): Number of videos to generate per prompt.
     - seed (int): The seed for reproducibility.
+    - embedding_cache (Optional[EmbeddingCache]): Cache of the prompt embeddings, skips the text encoder for known prompts.
     """
 
-    # Generate the video frames based on the prompt.
+    # One generator per video, seeded with `seed` + its index within the prompt, so the videos of a prompt
+    # differ and a video does not depend on the other prompts of its batch
+    generators = []
+    for _ in prompts:
+        for video_seed in get_video_seeds(seed, num_videos_per_prompt):
+            generators.append(torch.Generator().manual_seed(video_seed))
+
+    # Pass the prompt embeddings instead of the prompts when they are cached. The pipeline does not
+    # repeat given embeddings, so they already hold one row per video.
+    if embedding_cache is not None:
+        prompt_embeds, negative_prompt_embeds = get_prompt_embeds(pipe, prompts, num_videos_per_prompt, embedding_cache)
+        prompt_kwargs = {"prompt_embeds": prompt_embeds, "negative_prompt_embeds": negative_prompt_embeds}
+        videos_per_call = 1
+    else:
+        prompt_kwargs = {"prompt": prompts}
+        videos_per_call = num_videos_per_prompt
+
+    # Generate the video frames based on the prompts.
     if image is not None:
-        video_generate = pipe(
-            prompt=prompt,
+        frames = pipe(
+            **prompt_kwargs,
             image=image,
-            num_videos_per_prompt=num_videos_per_prompt,
+            num_videos_per_prompt=videos_per_call,
             num_inference_steps=num_inference_steps,
             num_frames=49,
             use_dynamic_cfg=True,
             guidance_scale=guidance_scale,
-            generator=torch.Generator().manual_seed(seed),
-        ).frames[0]
+            generator=generators,
+        ).frames
     elif video is not None:
-        video_generate = pipe(
-            prompt=prompt,
+        frames = pipe(
+            **prompt_kwargs,
             video=video,
-            num_videos_per_prompt=num_videos_per_prompt,
+            num_videos_per_prompt=videos_per_call,
             num_inference_steps=num_inference_steps,
             # num_frames=49,
             use_dynamic_cfg=True,
             guidance_scale=guidance_scale,
-            generator=torch.Generator().manual_seed(seed),
-        ).frames[0]
+            generator=generators,
+        ).frames
     else:
-        video_generate = pipe(
-            prompt=prompt,
-            num_videos_per_prompt=num_videos_per_prompt,
+        frames = pipe(
+            **prompt_kwargs,
+            num_videos_per_prompt=videos_per_call,
             num_inference_steps=num_inference_steps,
             num_frames=49,
             use_dynamic_cfg=True,
             guidance_scale=guidance_scale,
-            generator=torch.Generator().manual_seed(seed),
-        ).frames[0]
+            generator=generators,
+        ).frames
+
+    # Export the first video of each prompt to its file. fps must be 8 for original video.
+    for index, output_path in enumerate(output_paths):
+        export_to_video(frames[index * num_videos_per_prompt], output_path, fps=8)
 
-    # Export the generated frames to a video file. fps must be 8 for original video.
-    export_to_video(video_generate, output_path, fps=8)
 
+def generate_video(prompt: str, pipe, output_path: str = "./output.mp4", **kwargs):
+    """
+    Generates a video based on the given prompt and saves it to the specified path.
+
+    Parameters:
+    - prompt (str): The description of the video to be generated.
+    - pipe: The pre-initialized pipeline object.
+    - output_path (str): The path where the generated video will be saved.
+    - kwargs: Generation options of `generate_videos` (image, video, num_inference_steps, guidance_scale, seed...).
+    """
+    generate_videos([prompt], pipe, [output_path], **kwargs)
+
+
+def generate_in_batches(jobs, pipe, batch_size, **kwargs):
+    """
+    Generates the videos of the jobs, `batch_size` prompts per call of the pipeline. When a batch
+    runs out of GPU memory, it is retried (and the following batches run) with half as many prompts.
+
+    Parameters:
+    - jobs (List[Tuple[str, str, dict]]): The prompt, output path and generation parameters of each video.
+    - pipe: The pre-initialized pipeline object.
+    - batch_size (int): Maximum number of prompts per call of the pipeline.
+    - kwargs: Generation options of `generate_videos`.
+    """
+    start = 0
+    while start < len(jobs):
+        batch = jobs[start:start + batch_size]
+        for _, output_path, _ in batch:
+            clear_done_marker(output_path)
+
+        out_of_memory = False
+        try:
+            generate_videos(
+                [prompt for prompt, _, _ in batch], pipe, [output_path for _, output_path, _ in batch], **kwargs
+            )
+        except torch.cuda.OutOfMemoryError:
+            if batch_size == 1:
+                raise
+            out_of_memory = True
+
+        # Freed outside of the except block: the exception's traceback holds the tensors of the failed call
+        if out_of_memory:
+            batch_size //= 2
+            torch.cuda.empty_cache()
+            print(f"Out of GPU memory, retrying with batches of {batch_size} prompts.")
+            continue
+
+        for _, output_path, params in batch:
+            mark_done(output_path, params)
+        start += len(batch)
+
+
+def get_generation_params(args, prompt, **overrides):
+    """
+    Generation parameters of a prompt, recorded with its video and used to name it.
+
+    :param args: Parsed command line arguments.
+    :param prompt: The prompt.
+    :param overrides: Values replacing the seed, number of steps or guidance scale of `args`.
+    :return: The parameters.
+    """
+    params = {
+        "model": "cog",
+        "model_path": args.model_path,
+        "generate_type": args.generate_type,
+        "image_or_video_path": args.image_or_video_path,
+        "lora_path": args.lora_path,
+        "lora_rank": args.lora_rank,
+        "dtype": args.dtype,
+        "prompt": unquote_prompt(prompt),
+        "seed": args.seed,
+        "num_inference_steps": args.num_inference_steps,
+        "guidance_scale": args.guidance_scale,
+        "num_videos_per_prompt": args.num_videos_per_prompt,
+    }
+    params.update(overrides)
+    params["video_seeds"] = get_video_seeds(params["seed"], params["num_videos_per_prompt"])
+    return params
+
+
+def load_pipeline(args):
+    """
+    Load the pipeline (and the input image or video of i2v/v2v generation).
+
+    :param args: Parsed command line arguments.
+    :return: The pipeline, the image and the video (None when unused).
+    """
+    dtype = torch.float16 if args.dtype == "float16" else torch.bfloat16
+
+    if args.generate_type == "i2v":
+        pipe = CogVideoXImageToVideoPipeline.from_pretrained(args.model_path, torch_dtype=dtype)
+        image = load_image(image=args.image_or_video_path)
+        video = None
+    elif args.generate_type == "t2v":
+        pipe = CogVideoXPipeline.from_pretrained(args.model_path, torch_dtype=dtype)
+        image = None
+        video = None
+    else:  # 'v2v'
+        pipe = CogVideoXVideoToVideoPipeline.from_pretrained(args.model_path, torch_dtype=dtype)
+        video = load_video(args.image_or_video_path)
+        image = None
+
+    # If using LoRA weights
+    if args.lora_path:
+        pipe.load_lora_weights(
+            args.lora_path, weight_name="pytorch_lora_weights.safetensors", adapter_name="test_1"
+        )
+        pipe.fuse_lora(lora_scale=1 / args.lora_rank)
+
+    # Set Scheduler.
+    pipe.scheduler = CogVideoXDPMScheduler.from_config(pipe.scheduler.config, timestep_spacing="trailing")
+
+    # Keep the whole pipeline on the GPU when it fits, else offload one component or one layer at a time;
+    # decode the latents in slices and tiles only when an untiled decode does not fit
+    apply_offload_policy(
+        pipe,
+        args.offload,
+        headroom_bytes=int(args.offload_headroom_gb * GB),
+        decode_bytes=int(args.vae_decode_gb * GB),
+        vae_tiling=args.vae_tiling,
+    )
+
+    return pipe, image, video
+
+
+def get_embedding_cache(args):
+    """
+    :param args: Parsed command line arguments.
+    :return: The embedding cache, or None if disabled.
+    """
+    if args.no_embedding_cache:
+        return None
+    return EmbeddingCache(args.embedding_cache_dir, max_bytes=int(args.embedding_cache_gb * 1024 ** 3))
+
+
+def serve(args, pipe, image=None, video=None):
+    """
+    Run the generation service: the pipeline stays loaded and jobs are submitted over HTTP.
+
+    :param args: Parsed command line arguments.
+    :param pipe: The loaded pipeline.
+    :param image: Input image of i2v generation.
+    :param video: Input video of v2v generation.
+    """
+    from generation_service import GenerationService, serve as serve_http
+
+    embedding_cache = get_embedding_cache(args)
+
+    def make_params(prompt, options):
+        unknown = set(options) - set(SERVICE_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown options: {', '.join(sorted(unknown))} (supported: {', '.join(SERVICE_OPTIONS)})")
+        return get_generation_params(args, prompt, **{key: SERVICE_OPTIONS[key](value) for key, value in options.items()})
+
+    def generate(prompt, output_path, params):
+        generate_video(
+            prompt=prompt,
+            pipe=pipe,
+            output_path=output_path,
+            image=image,
+            video=video,
+            num_inference_steps=params["num_inference_steps"],
+            guidance_scale=params["guidance_scale"],
+            num_videos_per_prompt=params["num_videos_per_prompt"],
+            seed=params["seed"],
+            embedding_cache=embedding_cache,
+        )
+
+    service = GenerationService(
+        "cog", generate, make_params,
+        output_path=lambda params: os.path.join(args.save_dir, output_file_name(params)),
+        max_queue=args.max_queue,
+        resume_index=None if args.overwrite else ResumeIndex("cog", check_s3=False),
+    )
+    serve_http(service, host=args.host, port=args.port)
 
 
 if __name__ == "__main__":
@@ -114,18 +359,59 @@ if __name__ == "__main__":
         "--dtype", type=str, choices=["float16", "bfloat16"], default="bfloat16", help="The data type for computation"
     )
     parser.add_argument("--seed", type=int, default=42, help="The seed for reproducibility")
+    parser.add_argument(
+        "--batch_size", type=int, default=1, help="Number of prompts generated per call of the pipeline (t2v only)"
+    )
+    parser.add_argument(
+        "--offload",
+        type=str,
+        choices=["auto", *OFFLOAD_POLICIES],
+        default="auto",
+        help="CPU offload of the pipeline: auto (from the free GPU memory), none, model or sequential",
+    )
+    parser.add_argument(
+        "--offload_headroom_gb", type=float, default=8, help="GPU memory kept for activations when choosing the offload policy"
+    )
+    parser.add_argument(
+        "--vae_tiling",
+        type=str,
+        choices=["auto", "on", "off"],
+        default="auto",
+        help="VAE slicing and tiling: auto (only when an untiled decode does not fit in GPU memory), on or off",
+    )
+    parser.add_argument(
+        "--vae_decode_gb", type=float, default=VAE_DECODE_GB, help="Peak GPU memory of an untiled VAE decode (--vae_tiling auto)"
+    )
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate videos that were already generated with the same parameters")
+    parser.add_argument("--shard", type=str, default=None, help="Only generate the prompts of a shard, <index>/<count> (e.g. 0/4)")
+    parser.add_argument("--serve", action="store_true", help="Keep the pipeline loaded and accept generation jobs over HTTP")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Address the service listens on (--serve)")
+    parser.add_argument("--port", type=int, default=5000, help="Port the service listens on (--serve)")
+    parser.add_argument("--max_queue", type=int, default=16, help="Maximum number of queued jobs of the service (--serve)")
+    parser.add_argument("--embedding_cache_dir", type=str, default=DEFAULT_CACHE_DIR, help="Directory of the prompt embedding cache")
+    parser.add_argument("--embedding_cache_gb", type=float, default=DEFAULT_MAX_GB, help="Maximum size of the prompt embedding cache in GB")
+    parser.add_argument("--no_embedding_cache", action="store_true", help="Always run the text encoder")
 
     args = parser.parse_args()
-    dtype = torch.float16 if args.dtype == "float16" else torch.bfloat16
 
     # Ensure at least one of --prompt or --prompt_path is provided
-    if not args.prompt and not args.prompt_path:
+    if not args.prompt and not args.prompt_path and not args.serve:
         parser.error("At least one of --prompt or --prompt_path must be provided.")
 
     # Ensure that image_or_video_path is provided for i2v or v2v generation
     if args.generate_type in ["i2v", "v2v"] and not args.image_or_video_path:
         parser.error(f"--image_or_video_path must be provided for generate_type '{args.generate_type}'")
 
+    # The input image or video of i2v/v2v generation is not repeated for a batch of prompts
+    if args.batch_size < 1 or (args.batch_size > 1 and args.generate_type != "t2v"):
+        parser.error("--batch_size must be 1 for i2v and v2v generation, and at least 1 for t2v")
+
+    # Service mode: the pipeline is loaded once for all the jobs
+    if args.serve:
+        os.makedirs(args.save_dir, exist_ok=True)
+        serve(args, *load_pipeline(args))
+        sys.exit(0)
+
     # Collect prompts
     prompts = []
 
@@ -136,6 +422,9 @@ if __name__ == "__main__":
         with open(args.prompt_path, 'r') as f:
             prompts.extend([line.strip() for line in f if line.strip()])
 
+    # Only keep the prompts of this node when the prompt set is split across nodes
+    prompts = shard_prompts(prompts, args.shard)
+
     # Create the save directory if it doesn't exist
     os.makedirs(args.save_dir, exist_ok=True)
 
@@ -143,51 +432,43 @@ if __name__ == "__main__":
     if len(prompts) > 1 and args.output_path:
         print("Warning: Multiple prompts detected. The '--output_path' argument will be ignored.")
 
-    # Initialize the pipeline once
-    if args.generate_type == "i2v":
-        pipe = CogVideoXImageToVideoPipeline.from_pretrained(args.model_path, torch_dtype=dtype)
-        image = load_image(image=args.image_or_video_path)
-        video = None
-    elif args.generate_type == "t2v":
-        pipe = CogVideoXPipeline.from_pretrained(args.model_path, torch_dtype=dtype)
-        image = None
-        video = None
-    else:  # 'v2v'
-        pipe = CogVideoXVideoToVideoPipeline.from_pretrained(args.model_path, torch_dtype=dtype)
-        video = load_video(args.image_or_video_path)
-        image = None
+    # Skip the prompts whose video was already generated (locally or in S3) with the same parameters
+    resume_index = ResumeIndex("cog")
+    jobs = []
+    for prompt in prompts:
+        params = get_generation_params(args, prompt)
 
-    # If using LoRA weights
-    if args.lora_path:
-        pipe.load_lora_weights(
-            args.lora_path, weight_name="pytorch_lora_weights.safetensors", adapter_name="test_1"
-        )
-        pipe.fuse_lora(lora_scale=1 / args.lora_rank)
+        # Videos are named after their parameters, so editing or reordering the prompts keeps their identity
+        if len(prompts) == 1 and args.output_path:
+            output_path = args.output_path
+        else:
+            output_path = os.path.join(args.save_dir, output_file_name(params))
 
-    # Set Scheduler.
-    pipe.scheduler = CogVideoXDPMScheduler.from_config(pipe.scheduler.config, timestep_spacing="trailing")
+        if args.overwrite or not resume_index.is_done(output_path, params):
+            jobs.append((prompt, output_path, params))
 
-    # Enable CPU offload for the model.
-    pipe.enable_sequential_cpu_offload()
+    if not jobs:
+        print("All videos were already generated.")
+        sys.exit(0)
+    print(f"Generating {len(jobs)} of {len(prompts)} videos.")
 
-    pipe.vae.enable_slicing()
-    pipe.vae.enable_tiling()
+    # Initialize the pipeline once
+    pipe, image, video = load_pipeline(args)
+    embedding_cache = get_embedding_cache(args)
 
-    # Loop over prompts and generate videos
-    for prompt_i, prompt in enumerate(prompts):
-        if len(prompts) == 1 and args.output_path:
-            output_path = args.output_path
-        else:
-            output_path = os.path.join(args.save_dir, f"sample_{prompt_i}.mp4")
+    # Generate the videos, several prompts per call of the pipeline with --batch_size
+    generate_in_batches(
+        jobs,
+        pipe,
+        args.batch_size,
+        image=image,
+        video=video,
+        num_inference_steps=args.num_inference_steps,
+        guidance_scale=args.guidance_scale,
+        num_videos_per_prompt=args.num_videos_per_prompt,
+        seed=args.seed,
+        embedding_cache=embedding_cache,
+    )
 
-        generate_video(
-            prompt=prompt,
-            pipe=pipe,
-            output_path=output_path,
-            image=image,
-            video=video,
-            num_inference_steps=args.num_inference_steps,
-            guidance_scale=args.guidance_scale,
-            num_videos_per_prompt=args.num_videos_per_prompt,
-            seed=args.seed,
-        )
+    if embedding_cache is not None:
+        print(embedding_cache.summary())
@@ -5,7 +5,7 @@ pip install uv
 
 uv venv .venv
 source .venv/bin/activate
-uv pip install setuptools torch==2.4.1 huggingface_hub[cli] python-dotenv
+uv pip install setuptools torch==2.4.1 huggingface_hub[cli] python-dotenv boto3
 uv pip install -e . --no-build-isolation
 
 # Patch the inference script
@@ -19,4 +19,5 @@ python3 /home/ubuntu/text2vid-viewer/backend/models/mochi/dl_weights.py --model_
 python3 /home/ubuntu/mochi/src/mochi_preview/inference.py \
     --prompt_path /home/ubuntu/text2vid-viewer/prompts.txt \
     --save_dir /home/ubuntu/data/mochi \
-    --model_path $MODEL_PATH
\ No newline at end of file
+    --model_path $MODEL_PATH \
+    ${SHARD:+--shard "$SHARD"}
\ No newline at end of file
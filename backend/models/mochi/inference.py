@@ -1,5 +1,6 @@
 import json
 import os
+import sys
 import tempfile
 import time
 
@@ -13,6 +14,10 @@ import torch
 
 from mochi_preview.handler import MochiWrapper
 
+# Shared resume layer (skips prompts that were already generated)
+sys.path.insert(0, "/home/ubuntu/text2vid-viewer/backend/utils")
+from resume import ResumeIndex, clear_done_marker, mark_done, output_file_name, shard_prompts, unquote_prompt
+
 model = None
 model_path = None
 
@@ -62,8 +67,7 @@ def linear_quadratic_schedule(num_steps, threshold_noise, linear_steps=None):
 
 def generate_video(
     prompt,
-    save_dir,
-    prompt_idx,
+    output_path,
     negative_prompt,
     width,
     height,
@@ -109,8 +113,7 @@ def generate_video(
     final_frames = rearrange(final_frames, "t b h w c -> b t h w c")
     final_frames = final_frames[0]
 
-    os.makedirs(save_dir, exist_ok=True)
-    output_path = os.path.join(save_dir, f"sample_{prompt_idx}.mp4")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
     with tempfile.TemporaryDirectory() as tmpdir:
         frame_paths = []
@@ -226,6 +229,12 @@ def load_prompts(prompt_path, start_idx=None, end_idx=None):
 @click.option(
     "--num_steps", default=64, type=int, help="Number of inference steps."
 )
+@click.option(
+    "--overwrite", is_flag=True, help="Regenerate videos that were already generated with the same parameters."
+)
+@click.option(
+    "--shard", default=None, help="Only generate the prompts of a shard, <index>/<count> (e.g. 0/4)."
+)
 def generate_cli(
     prompt_path,
     model_path,
@@ -238,17 +247,46 @@ def generate_cli(
     seed,
     cfg_scale,
     num_steps,
+    overwrite,
+    shard,
 ):
-    prompts = load_prompts(prompt_path)
+    # Only keep the prompts of this node when the prompt set is split across nodes
+    prompts = shard_prompts(load_prompts(prompt_path), shard)
+
+    # Skip the prompts whose video was already generated (locally or in S3) with the same parameters
+    resume_index = ResumeIndex("mochi")
+    jobs = []
+    for prompt in prompts:
+        params = {
+            "model": "mochi",
+            "prompt": unquote_prompt(prompt),
+            "negative_prompt": negative_prompt,
+            "width": width,
+            "height": height,
+            "num_frames": num_frames,
+            "seed": seed,
+            "cfg_scale": cfg_scale,
+            "num_steps": num_steps,
+        }
+        # Videos are named after their parameters, so editing or reordering the prompts keeps their identity
+        output_path = os.path.join(save_dir, output_file_name(params))
+        if overwrite or not resume_index.is_done(output_path, params):
+            jobs.append((prompt, output_path, params))
+
+    if not jobs:
+        click.echo("All videos were already generated.")
+        return
+    click.echo(f"Generating {len(jobs)} of {len(prompts)} videos.")
+
     set_model_path(model_path)
     load_model()
 
-    for prompt_idx, prompt in enumerate(prompts):
+    for prompt, output_path, params in jobs:
 
+        clear_done_marker(output_path)
         output = generate_video(
             prompt,
-            save_dir,
-            prompt_idx,
+            output_path,
             negative_prompt,
             width,
             height,
@@ -257,6 +295,8 @@ def generate_cli(
             cfg_scale,
             num_steps,
         )
+        if os.path.exists(output) and os.path.getsize(output) > 0:
+            mark_done(output, params)
         click.echo(f"Video generated at: {output}")
 
 
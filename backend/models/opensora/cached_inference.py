@@ -0,0 +1,61 @@
+import inspect
+import os
+import runpy
+import sys
+
+import torch
+from opensora.models.text_encoder.t5 import T5Encoder
+
+from embedding_cache import DEFAULT_MAX_GB, EmbeddingCache, encode_with_cache
+
+# Launcher of the OpenSora inference script with a disk cache of the T5 embeddings:
+#   python /app/cached_inference.py scripts/inference.py <config> [args...]
+# Every OpenSora config uses the same T5-XXL encoder, so the prompts encoded for one config
+# are read from the cache (EMBEDDING_CACHE_DIR) by the next ones instead of being encoded again.
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "/embedding_cache")
+EMBEDDING_CACHE_GB = float(os.getenv("EMBEDDING_CACHE_GB", DEFAULT_MAX_GB))
+
+
+def patch_text_encoder(embedding_cache):
+    """
+    Make T5Encoder.encode read the embeddings of known prompts from the cache.
+
+    :param embedding_cache: EmbeddingCache.
+    """
+    init, encode = T5Encoder.__init__, T5Encoder.encode
+    signature = inspect.signature(init)
+
+    def cached_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        # Arguments passed by position or left to their default are part of the cache key too
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        self.cache_encoder_id = f"{arguments['from_pretrained']}:{arguments.get('dtype', torch.float)}"
+        self.cache_max_length = arguments["model_max_length"]
+        self.cache_device = arguments.get("device", "cuda")
+
+    def cached_encode(self, text):
+        # encode returns dict(y=[batch, 1, max_length, dim], mask=[batch, max_length])
+        return encode_with_cache(
+            embedding_cache, self.cache_encoder_id, self.cache_max_length, list(text),
+            lambda prompts: encode(self, prompts), device=self.cache_device,
+        )
+
+    T5Encoder.__init__ = cached_init
+    T5Encoder.encode = cached_encode
+
+
+if __name__ == "__main__":
+    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, max_bytes=int(EMBEDDING_CACHE_GB * 1024 ** 3))
+    patch_text_encoder(embedding_cache)
+
+    # Run the script as if it had been started directly
+    script = sys.argv[1]
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        print(embedding_cache.summary())
@@ -71,13 +71,19 @@ if sudo docker ps -a --format '{{.Names}}' | grep -Eq "^opensora-inference$"; th
     sudo docker rm -f opensora-inference || { echo "Failed to remove existing opensora-inference Docker container"; exit 1; }
 fi
 
-# Run the inference
+# Run the inference, on the GPUs selected by the orchestrator if any
+GPUS="all"
+if [ -n "$CUDA_VISIBLE_DEVICES" ]; then
+    GPUS="\"device=${CUDA_VISIBLE_DEVICES}\""
+fi
 sudo docker run \
     --rm \
-    --gpus all \
+    --gpus "$GPUS" \
     --env-file /home/ubuntu/text2vid-viewer/.env \
     -v /home/ubuntu/data/opensora:/data \
     -v /home/ubuntu/logs:/app/logs \
+    -v /home/ubuntu/data/embedding_cache:/embedding_cache \
     --name opensora_inference \
     opensora-inference:latest \
-    --model ${MODEL}
\ No newline at end of file
+    --model ${MODEL} \
+    ${SHARD:+--shard "$SHARD"}
\ No newline at end of file
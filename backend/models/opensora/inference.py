@@ -1,10 +1,11 @@
 import argparse
+import hashlib
+import shutil
 import subprocess
 import os
 import logging
 import glob
-import boto3
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from resume import ResumeIndex, mark_done, output_file_name, shard_prompts, unquote_prompt
 
 # Configure logging to file
 logging.basicConfig(filename='/app/logs/inference.log',
@@ -13,68 +14,75 @@ logging.basicConfig(filename='/app/logs/inference.log',
 logger = logging.getLogger(__name__)
 
 
-def get_cmd_list(config_file):
+# The OpenSora script names its outputs sample_<index>; they are written to a staging
+# directory (not watched by the uploader) and then moved to their content-addressed names
+STAGING_DIR = "/data/staging"
+PENDING_PROMPT_PATH = "/data/staging/prompts.txt"
+
+
+def get_cmd_list(config_file, embedding_cache=True):
     """Prepare the command list for image generation."""
-    cmd = [
-        'python', 'scripts/inference.py', config_file,
-        '--save-dir', "/data",
-        '--prompt-path', "/app/prompts.txt"]
+    # The launcher reads the T5 embeddings of prompts encoded by a previous config from the cache
+    launcher = ['python', '/app/cached_inference.py'] if embedding_cache else ['python']
+    cmd = launcher + [
+        'scripts/inference.py', config_file,
+        '--save-dir', STAGING_DIR,
+        '--prompt-path', PENDING_PROMPT_PATH]
 
     logger.debug(f"Running command: {' '.join(cmd)}")
     return cmd
 
 
-def upload_file_to_s3(file_name, bucket_name, object_name, metadata):
+def get_generation_params(config_file, prompts):
+    """
+    Generation parameters of each prompt for a config. The config file holds the seed,
+    number of steps and resolution, so its content is part of the parameters.
+
+    :param config_file: Path to the config file.
+    :param prompts: List of prompts (lines of prompts.txt).
+    :return: List of (prompt, output path, parameters) tuples, indexed like the prompts.
+    """
+    with open(config_file, 'rb') as f:
+        config_hash = hashlib.sha256(f.read()).hexdigest()
+    config = os.path.basename(config_file).split('.py')[0]
+
+    outputs = []
+    for prompt in prompts:
+        params = {"model": "opensora", "config": config, "config_hash": config_hash, "prompt": unquote_prompt(prompt)}
+        outputs.append((prompt, os.path.join("/data", output_file_name(params)), params))
+    return outputs
+
+
+def collect_outputs(pending):
     """
-    Uploads a file to an S3 bucket.
+    Move the videos generated in the staging directory to their content-addressed names.
 
-    :param file_name: Path to the file to upload.
-    :param bucket_name: Name of the S3 bucket.
-    :param object_name: S3 object name. If not specified, file_name is used.
-    :return: The S3 object name if the file was uploaded successfully, else None.
+    :param pending: List of (prompt, output path, parameters) tuples, in the order of the staged prompt file.
+    :return: Number of videos moved.
     """
+    moved = 0
+    for file_path in glob.glob(os.path.join(STAGING_DIR, '*.mp4')):
+        try:
+            index = int(os.path.basename(file_path).split('_')[-1].split('.mp4')[0])
+            _, output_path, params = pending[index]
+        except (ValueError, IndexError):
+            logger.error(f"Could not map {file_path} to a prompt")
+            continue
 
-    # Create an S3 client
-    # Get AWS credentials from environment variables
-    aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-    aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-    aws_region = os.getenv('AWS_REGION', 'us-east-1')
-
-    # Initialize S3 client
-    s3_client = boto3.client(
-        's3',
-        region_name=aws_region,
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key
-    )
-
-    try:
-        # Prepare ExtraArgs
-        extra_args = {}
-        if metadata is not None:
-            extra_args['Metadata'] = metadata
-
-        # Upload the file
-        s3_client.upload_file(file_name, bucket_name, object_name, ExtraArgs=extra_args)
-        logger.debug(f"File {file_name} uploaded to {bucket_name}/{object_name}.")
-        return object_name
-    except FileNotFoundError:
-        logger.debug(f"The file {file_name} was not found.")
-        return None
-    except NoCredentialsError:
-        logger.debug("Credentials not available.")
-        return None
-    except PartialCredentialsError:
-        logger.debug("Incomplete credentials provided.")
-        return None
-    except Exception as e:
-        logger.debug(f"An error occurred: {e}")
-        return None
+        if os.path.getsize(file_path) == 0:
+            continue
+        os.replace(file_path, output_path)
+        mark_done(output_path, params)
+        moved += 1
+    return moved
 
 
 def main():
     parser = argparse.ArgumentParser(description="Inference script for OpenSora")
     parser.add_argument('--model', type=str, required=True, help='Name of the model configuration to use')
+    parser.add_argument('--overwrite', action='store_true', help='Regenerate videos that were already generated with the same config')
+    parser.add_argument('--shard', type=str, default=None, help='Only generate the prompts of a shard, <index>/<count> (e.g. 0/4)')
+    parser.add_argument('--no_embedding_cache', action='store_true', help='Always run the text encoder')
     args = parser.parse_args()
 
     logger.debug(f"args.model: {args.model}")
@@ -89,23 +97,46 @@ def main():
             raise ValueError(f"Config file for model {args.model} does not exist: {config_file}")
         config_files = [config_file]
 
+    with open("/app/prompts.txt", "r") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+    prompts = shard_prompts(prompts, args.shard)  # Prompts of this node when the prompt set is split across nodes
+
+    # The videos of every config are uploaded to the same opensora/<prompt>.mp4 objects and s3_export only
+    # keeps the latest one, so S3 cannot tell whether the other configs were generated: only check locally
+    if len(config_files) > 1:
+        logger.warning(f"Running {len(config_files)} configs: only the videos of the last generated config are kept in S3")
+    resume_index = ResumeIndex("opensora", check_s3=len(config_files) == 1)
+
     # Loop over all config files to run inference for
     for config_file in config_files:
 
         # # Set model name to current model (otherwise can be saved as 'all')
         # model = os.path.basename(config_file.strip()).split('.py')[0]
-        
-        # Remove any existing files with the pattern `*.mp4` in the save directory
-        for file_path in glob.glob(os.path.join("/data", '*.mp4')):
-            os.remove(file_path)
-            logger.debug(f"Removed file: {file_path}")
+
+        # Only the prompts that were not already generated with this config (locally or in S3) are staged
+        outputs = get_generation_params(config_file, prompts)
+        pending = [output for output in outputs if args.overwrite or not resume_index.is_done(output[1], output[2])]
+        if not pending:
+            logger.info(f"Skipping {config_file}: all videos were already generated with this config")
+            continue
+        logger.info(f"Generating {len(pending)} of {len(outputs)} videos with {config_file}")
+
+        # Start from an empty staging directory
+        shutil.rmtree(STAGING_DIR, ignore_errors=True)
+        os.makedirs(STAGING_DIR)
+        with open(PENDING_PROMPT_PATH, "w") as f:
+            f.write("".join(f"{prompt}\n" for prompt, _, _ in pending))
 
         # Run inference for current model config
-        cmd_list = get_cmd_list(config_file)
+        cmd_list = get_cmd_list(config_file, embedding_cache=not args.no_embedding_cache)
         result = subprocess.run(cmd_list, capture_output=True, text=True)
         logger.debug(f"Command output: {result.stdout}")
         logger.error(f"Command error output: {result.stderr}")
 
+        # Keep the videos that were generated, even if the script failed before the end
+        moved = collect_outputs(pending)
+        logger.info(f"Generated {moved} of {len(pending)} videos with {config_file}")
+
         # Skip to next model if error occurred
         if result.returncode != 0:
             logger.error("Image generation failed")
@@ -26,8 +26,9 @@ source ~/.bashrc
 conda create -n pyramid python=3.8.10 -y
 source activate pyramid
 pip install -r requirements.txt
-pip install pandas
+pip install pandas boto3
 
 
 python /home/ubuntu/Pyramid-Flow/inference.py \
-    --prompt_path /home/ubuntu/text2vid-viewer/prompts.txt
\ No newline at end of file
+    --prompt_path /home/ubuntu/text2vid-viewer/prompts.txt \
+    ${SHARD:+--shard "$SHARD"}
\ No newline at end of file
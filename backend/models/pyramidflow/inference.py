@@ -1,8 +1,29 @@
+import os
+import sys
 import torch
 from PIL import Image
 from pyramid_dit import PyramidDiTForVideoGeneration
 from diffusers.utils import load_image, export_to_video
 
+# Shared resume layer (skips prompts that were already generated)
+sys.path.insert(0, "/home/ubuntu/text2vid-viewer/backend/utils")
+from resume import ResumeIndex, clear_done_marker, mark_done, output_file_name, shard_prompts, unquote_prompt
+
+SAVE_DIR = "/home/ubuntu/data/pyramidflow"
+
+# Generation settings, also recorded with each video to detect prompts that were already generated
+GENERATION_PARAMS = {
+    "model": "pyramidflow",
+    "model_variant": "diffusion_transformer_768p",
+    "num_inference_steps": [20, 20, 20],
+    "video_num_inference_steps": [10, 10, 10],
+    "height": 768,
+    "width": 1280,
+    "temp": 16,
+    "guidance_scale": 9.0,
+    "video_guidance_scale": 5.0,
+}
+
 def load_prompts(prompt_path, start_idx=None, end_idx=None):
     with open(prompt_path, "r") as f:
         prompts = [line.strip() for line in f.readlines()]
@@ -16,7 +37,24 @@ def dl_model():
     snapshot_download("rain1011/pyramid-flow-sd3", local_dir=model_path, local_dir_use_symlinks=False, repo_type='model')
 
 
-def run_inference(prompts):
+def get_jobs(prompts, overwrite=False):
+    """
+    :param prompts: List of prompts.
+    :param overwrite: Regenerate videos that were already generated with the same parameters.
+    :return: List of (prompt, output path, generation parameters) of the videos to generate.
+    """
+    resume_index = ResumeIndex("pyramidflow")
+    jobs = []
+    for prompt in prompts:
+        params = dict(GENERATION_PARAMS, prompt=unquote_prompt(prompt))
+        # Videos are named after their parameters, so editing or reordering the prompts keeps their identity
+        output_path = os.path.join(SAVE_DIR, output_file_name(params))
+        if overwrite or not resume_index.is_done(output_path, params):
+            jobs.append((prompt, output_path, params))
+    return jobs
+
+
+def run_inference(jobs):
     torch.cuda.set_device(0)
     model_dtype, torch_dtype = 'bf16', torch.bfloat16   # Use bf16 (not support fp16 yet)
 
@@ -24,7 +62,7 @@ def run_inference(prompts):
     model = PyramidDiTForVideoGeneration(
         MODEL_PATH,
         model_dtype,
-        model_variant='diffusion_transformer_768p',     # 'diffusion_transformer_384p'
+        model_variant=GENERATION_PARAMS["model_variant"],     # 'diffusion_transformer_384p'
     )
 
     model.vae.to("cuda")
@@ -33,25 +71,27 @@ def run_inference(prompts):
     model.vae.enable_tiling()
 
 
-    for prompt_i, prompt in enumerate(prompts):
+    for prompt, output_path, params in jobs:
 
         print("Prompt:", prompt)
+        clear_done_marker(output_path)
 
         with torch.no_grad(), torch.cuda.amp.autocast(enabled=True, dtype=torch_dtype):
             frames = model.generate(
                 prompt=prompt,
-                num_inference_steps=[20, 20, 20],
-                video_num_inference_steps=[10, 10, 10],
-                height=768,     
-                width=1280,
-                temp=16,                    # temp=16: 5s, temp=31: 10s
-                guidance_scale=9.0,         # The guidance for the first frame, set it to 7 for 384p variant
-                video_guidance_scale=5.0,   # The guidance for the other video latent
+                num_inference_steps=params["num_inference_steps"],
+                video_num_inference_steps=params["video_num_inference_steps"],
+                height=params["height"],
+                width=params["width"],
+                temp=params["temp"],                            # temp=16: 5s, temp=31: 10s
+                guidance_scale=params["guidance_scale"],        # The guidance for the first frame, set it to 7 for 384p variant
+                video_guidance_scale=params["video_guidance_scale"],  # The guidance for the other video latent
                 output_type="pil",
                 save_memory=True,           # If you have enough GPU memory, set it to `False` to improve vae decoding speed
             )
 
-        export_to_video(frames, f"/home/ubuntu/data/pyramidflow/sample_{prompt_i}.mp4", fps=24)
+        export_to_video(frames, output_path, fps=24)
+        mark_done(output_path, params)
 
         
 
@@ -60,9 +100,19 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--prompt_path", type=str, default=None)
-    prompt_path = parser.parse_args().prompt_path
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate videos that were already generated with the same parameters")
+    parser.add_argument("--shard", type=str, default=None, help="Only generate the prompts of a shard, <index>/<count> (e.g. 0/4)")
+    args = parser.parse_args()
+
+    # Only keep the prompts of this node when the prompt set is split across nodes
+    prompts = shard_prompts(load_prompts(args.prompt_path), args.shard)
 
-    prompts = load_prompts(prompt_path)
+    # Skip the prompts whose video was already generated (locally or in S3) with the same parameters
+    jobs = get_jobs(prompts, overwrite=args.overwrite)
+    if not jobs:
+        print("All videos were already generated.")
+        sys.exit(0)
+    print(f"Generating {len(jobs)} of {len(prompts)} videos.")
 
     dl_model()
-    run_inference(prompts)
\ No newline at end of file
+    run_inference(jobs)
\ No newline at end of file
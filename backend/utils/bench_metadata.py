@@ -0,0 +1,85 @@
+import argparse
+import logging
+import os
+import time
+
+# Benchmark of serial vs. concurrent metadata fetching against a local S3 stand-in.
+#
+# Requires moto (`pip install "moto[server]"`). The stand-in is started in-process and
+# the shared s3_utils client is pointed at it through S3_ENDPOINT_URL. A loopback server
+# answers in well under a millisecond, so a fixed delay is added to every HEAD request
+# to stand in for the round trip to S3.
+
+
+def start_local_s3(port):
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=port)
+    server.start()
+
+    os.environ["S3_ENDPOINT_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    return server
+
+
+def add_latency(s3_client, latency_ms):
+    def delay(**kwargs):
+        time.sleep(latency_ms / 1000)
+
+    s3_client.meta.events.register('before-send.s3.HeadObject', delay)
+
+
+def populate_bucket(bucket_name, num_objects):
+    from s3_utils import get_s3_client
+
+    s3_client = get_s3_client()
+    s3_client.create_bucket(Bucket=bucket_name)
+
+    object_names = []
+    for i in range(num_objects):
+        object_name = f"cog/prompt {i}.mp4"
+        s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=b"",
+                             Metadata={"base_prompt": f"base prompt {i}"})
+        object_names.append(object_name)
+    return object_names
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark metadata fetching against a local S3 stand-in")
+    parser.add_argument("--num_objects", type=int, default=500, help="Number of objects to create")
+    parser.add_argument("--max_workers", type=int, default=16, help="Number of concurrent metadata requests")
+    parser.add_argument("--latency_ms", type=float, default=20, help="Simulated round trip per HEAD request")
+    parser.add_argument("--port", type=int, default=5055, help="Port of the local S3 stand-in")
+    args = parser.parse_args()
+
+    server = start_local_s3(args.port)
+
+    # Import after the endpoint is configured
+    from s3_utils import configure_s3_client, get_s3_client, get_s3_object_metadata, get_s3_objects_metadata
+    configure_s3_client(max_pool_connections=args.max_workers)
+
+    bucket_name = "text2videoviewer-bench"
+    object_names = populate_bucket(bucket_name, args.num_objects)
+    add_latency(get_s3_client(), args.latency_ms)
+
+    try:
+        start = time.perf_counter()
+        serial = [get_s3_object_metadata(bucket_name, object_name) for object_name in object_names]
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent = get_s3_objects_metadata(bucket_name, object_names, max_workers=args.max_workers)
+        concurrent_time = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    assert serial == concurrent, "Concurrent fetch returned different metadata or order"
+
+    print(f"Objects:    {args.num_objects}")
+    print(f"Serial:     {serial_time:.2f}s ({args.num_objects / serial_time:.0f} objects/s)")
+    print(f"Concurrent: {concurrent_time:.2f}s ({args.num_objects / concurrent_time:.0f} objects/s, {args.max_workers} workers)")
+    print(f"Speedup:    {serial_time / concurrent_time:.1f}x")
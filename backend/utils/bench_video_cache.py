@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from bench_metadata import start_local_s3
+
+# Exercise the /video/ proxy of the frontend server against a local S3 stand-in.
+#
+# Requires moto (`pip install "moto[server]"`). Checks that concurrent requests for a
+# cold video trigger a single download and that Range requests return the right bytes,
+# then replays a skewed access pattern and reports the hit ratio of the LRU cache.
+
+
+def populate_bucket(bucket_name, num_objects, object_size):
+    from s3_utils import get_s3_client
+
+    s3_client = get_s3_client()
+    s3_client.create_bucket(Bucket=bucket_name)
+
+    objects = {}
+    for i in range(num_objects):
+        object_name = f"cog/prompt {i}.mp4"
+        body = os.urandom(object_size)
+        s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=body)
+        objects[object_name] = body
+    return objects
+
+
+def fetch(port, object_name, byte_range=None):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/video/{quote(object_name)}")
+    if byte_range is not None:
+        request.add_header("Range", f"bytes={byte_range[0]}-{byte_range[1]}")
+    with urllib.request.urlopen(request) as response:
+        return response.status, response.read()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the video cache of the frontend server against a local S3 stand-in")
+    parser.add_argument("--num_objects", type=int, default=50, help="Number of videos in the bucket")
+    parser.add_argument("--object_size_kb", type=int, default=512, help="Size of each video")
+    parser.add_argument("--cache_objects", type=int, default=20, help="Capacity of the cache, in videos")
+    parser.add_argument("--num_requests", type=int, default=500, help="Number of requests of the replayed access pattern")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument("--port", type=int, default=5056, help="Port of the local S3 stand-in")
+    parser.add_argument("--server_port", type=int, default=8050, help="Port of the frontend server")
+    args = parser.parse_args()
+
+    s3_server = start_local_s3(args.port)
+
+    # Import after the endpoint is configured
+    from frontend_server import FrontendServer
+    from video_cache import VideoCache
+
+    bucket_name = "text2videoviewer-bench"
+    object_size = args.object_size_kb * 1024
+    objects = populate_bucket(bucket_name, args.num_objects, object_size)
+    names = list(objects)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = VideoCache(os.path.join(directory, "cache"), bucket_name=bucket_name, max_bytes=args.cache_objects * object_size)
+        server = FrontendServer(("127.0.0.1", args.server_port), directory, video_cache=cache)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                # Concurrent requests for one cold video share a single download
+                results = list(executor.map(lambda _: fetch(args.server_port, names[0]), range(args.concurrency)))
+                assert all(body == objects[names[0]] for _, body in results), "Proxy returned wrong content"
+                assert cache.stats()["fetches"] == 1, f"Expected 1 download, got {cache.stats()['fetches']}"
+                print(f"{args.concurrency} concurrent requests for a cold video: 1 download.")
+
+                # Range requests, on a cold video (passed through to S3) and on a cached one
+                for object_name in [names[1], names[0]]:
+                    status, body = fetch(args.server_port, object_name, (100, 1123))
+                    assert status == 206 and body == objects[object_name][100:1124], "Range request returned wrong bytes"
+                print("Range requests: OK.")
+
+                # Skewed access pattern: a few videos are watched much more than the others
+                random.seed(0)
+                weights = [1 / (rank + 1) for rank in range(len(names))]
+                pattern = random.choices(names, weights=weights, k=args.num_requests)
+                start = time.perf_counter()
+                for status, body in executor.map(lambda name: fetch(args.server_port, name), pattern):
+                    assert status == 200 and len(body) == object_size
+                seconds = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+            s3_server.stop()
+
+        stats = cache.stats()
+
+    print(f"Requests:   {args.num_requests} in {seconds:.2f}s ({args.num_requests / seconds:.0f} requests/s)")
+    print(f"Hit ratio:  {stats['hit_ratio']:.1%} ({stats['hits']} hits, {stats['misses']} misses)")
+    print(f"Downloads:  {stats['fetches']} ({stats['fetched_bytes'] / 1e6:.1f} MB), {stats['evictions']} evictions")
+    print(f"Cache:      {stats['objects']} videos, {stats['bytes'] / 1e6:.1f} of {stats['max_bytes'] / 1e6:.1f} MB")
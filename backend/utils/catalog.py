@@ -0,0 +1,164 @@
+import csv
+import os
+import subprocess
+import threading
+import time
+from viewer_index import INDEX_COLUMNS, build_viewer_index
+
+MAX_PAGE_SIZE = 100
+
+
+class Catalog:
+    """
+    In-memory, read-only view of db.csv indexed for the viewer queries.
+
+    Built once from the CSV; queries only touch the rows of the requested page.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.rows = index["rows"]
+
+    @classmethod
+    def from_csv(cls, csv_fpath):
+        with open(csv_fpath, newline="", encoding="utf-8") as f:
+            return cls(build_viewer_index(csv.DictReader(f)))
+
+    def row(self, row_id):
+        return dict(zip(INDEX_COLUMNS, self.rows[row_id]))
+
+    def facets(self):
+        """
+        :return: A dict with the lists of 'models' and 'prompts', in catalog order.
+        """
+        return {"models": list(self.index["models"]), "prompts": list(self.index["prompts"])}
+
+    def videos(self, model=None, prompt=None, page=1, page_size=4):
+        """
+        One page of the videos of a model and/or prompt.
+
+        :param model: Only return videos of this model.
+        :param prompt: Only return videos of this prompt.
+        :param page: 1-based page number.
+        :param page_size: Number of videos per page (at most MAX_PAGE_SIZE).
+        :return: A page dict with 'page', 'page_size', 'total' and 'items'.
+        """
+        if model is not None and prompt is not None:
+            prompt_ids = set(self.index["prompts"].get(prompt, []))
+            row_ids = [i for i in self.index["models"].get(model, []) if i in prompt_ids]
+        elif model is not None:
+            row_ids = self.index["models"].get(model, [])
+        elif prompt is not None:
+            row_ids = self.index["prompts"].get(prompt, [])
+        else:
+            row_ids = range(len(self.rows))
+
+        return self._page(row_ids, page, page_size, self.row)
+
+    def pairs(self, model, page=1, page_size=2):
+        """
+        One page of the prompt/base_prompt pairs of a model.
+
+        :param model: Name of the model.
+        :param page: 1-based page number.
+        :param page_size: Number of pairs per page (at most MAX_PAGE_SIZE).
+        :return: A page dict whose items have the two videos 'a' and 'b'.
+        """
+        pairs = self.index["pairs"].get(model, [])
+        return self._page(pairs, page, page_size, lambda pair: {"a": self.row(pair[0]), "b": self.row(pair[1])})
+
+    @staticmethod
+    def _page(items, page, page_size, render):
+        page = max(page, 1)
+        page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+        start = (page - 1) * page_size
+        return {
+            "page": page,
+            "page_size": page_size,
+            "total": len(items),
+            "items": [render(item) for item in items[start:start + page_size]],
+        }
+
+
+class CatalogStore:
+    """
+    Holds the current Catalog of a db.csv file and reloads it when the file changes.
+
+    Readers get a reference to an immutable Catalog, so a reload never exposes
+    a partially built index.
+    """
+
+    def __init__(self, csv_fpath):
+        self.csv_fpath = csv_fpath
+        self._catalog = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        :return: The current Catalog, or None if db.csv does not exist yet.
+        """
+        try:
+            stat = os.stat(self.csv_fpath)
+        except FileNotFoundError:
+            return self._catalog
+
+        version = (stat.st_mtime_ns, stat.st_size)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._catalog = Catalog.from_csv(self.csv_fpath)
+                    self._version = version
+        return self._catalog
+
+
+class CatalogRefresher(threading.Thread):
+    """
+    Background thread that rebuilds db.csv on a schedule while the server keeps serving.
+
+    Each refresh runs `command` (refresh_db.py) in a subprocess, so its memory
+    and CPU use stay out of the server process. refresh_db.py replaces db_index.json
+    and then db.csv atomically; `on_refresh` is then called to swap the
+    in-memory index ahead of the next request.
+    """
+
+    def __init__(self, command, interval, on_refresh=None):
+        """
+        :param command: Command line of the refresh (list of arguments).
+        :param interval: Seconds between the start of two refreshes. The first one starts immediately.
+        :param on_refresh: Optional callable run after each successful refresh.
+        """
+        super().__init__(name="catalog-refresher", daemon=True)
+        self.command = command
+        self.interval = interval
+        self.on_refresh = on_refresh
+        self.last_success = None  # Time of the last successful refresh
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            start = time.time()
+            self.refresh()
+            self._stopped.wait(max(self.interval - (time.time() - start), 0))
+
+    def refresh(self):
+        """
+        :return: True if the catalog was refreshed.
+        """
+        start = time.time()
+        result = subprocess.run(self.command, stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        if result.returncode != 0:
+            output = (result.stderr or result.stdout).strip().splitlines()[-10:]
+            print(f"Catalog refresh failed (exit code {result.returncode}), still serving the previous catalog:")
+            for line in output:
+                print(f"\t{line}")
+            return False
+
+        if self.on_refresh is not None:
+            self.on_refresh()
+        self.last_success = time.time()
+        print(f"Refreshed the catalog in {self.last_success - start:.1f}s.")
+        return True
+
+    def stop(self):
+        self._stopped.set()
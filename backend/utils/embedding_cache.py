@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+
+# Disk cache of text-encoder embeddings shared by the model runners.
+#
+# Most runs encode the same prompts with the same T5 encoder several times (every OpenSora
+# config, every rerun after an edit of the generation parameters). The embeddings of a
+# prompt are stored under the SHA-256 of (encoder id, max length, prompt), one .npy file
+# per tensor:
+#   <cache_dir>/<key[:2]>/<key>/meta.json    encoder, max length, prompt and tensor dtypes
+#   <cache_dir>/<key[:2]>/<key>/<name>.npy   tensor of the prompt (without the batch axis)
+# Entries are read memory-mapped and written atomically (rename of a complete directory),
+# so several runners can share a cache. The cache is capped at `max_bytes`: the least
+# recently used entries are evicted when a write makes it outgrow the cap.
+
+DEFAULT_CACHE_DIR = "/home/ubuntu/data/embedding_cache"
+DEFAULT_MAX_GB = 20
+
+
+def embedding_key(encoder_id, max_length, prompt):
+    """
+    :param encoder_id: Id of the text encoder (e.g. "DeepFloyd/t5-v1_1-xxl:torch.float32").
+    :param max_length: Number of tokens the prompt is padded or truncated to.
+    :param prompt: The prompt.
+    :return: The SHA-256 of the encoder id, max length and prompt.
+    """
+    return hashlib.sha256(json.dumps([encoder_id, max_length, prompt]).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, size-capped disk cache of prompt embeddings.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_GB * 1024 ** 3):
+        """
+        :param cache_dir: Directory of the cache.
+        :param max_bytes: Maximum size of the cache; least recently used entries are evicted beyond it.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # Size of the cache as last measured, plus the entries written since
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, encoder_id, max_length, prompt):
+        """
+        :param encoder_id: Id of the text encoder.
+        :param max_length: Number of tokens the prompt is padded or truncated to.
+        :param prompt: The prompt.
+        :return: Dict of tensor name -> memory-mapped array and the dict of tensor name -> dtype
+            name, or None if the prompt is not cached.
+        """
+        entry_dir = self.entry_dir(embedding_key(encoder_id, max_length, prompt))
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+                dtypes = json.load(f)["dtypes"]
+            arrays = {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r") for name in dtypes}
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        # The modification time of the entry is its last use (for the eviction)
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        self.hits += 1
+        return arrays, dtypes
+
+    def put(self, encoder_id, max_length, prompt, arrays, dtypes=None):
+        """
+        Store the embeddings of a prompt, then evict the least recently used entries beyond the size cap.
+
+        :param encoder_id: Id of the text encoder.
+        :param max_length: Number of tokens the prompt is padded or truncated to.
+        :param prompt: The prompt.
+        :param arrays: Dict of tensor name -> numpy array.
+        :param dtypes: Dict of tensor name -> dtype name to restore (e.g. "bfloat16", which numpy lacks).
+        """
+        entry_dir = self.entry_dir(embedding_key(encoder_id, max_length, prompt))
+        tmp_dir = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+            meta = {"encoder_id": encoder_id, "max_length": max_length, "prompt": prompt,
+                    "dtypes": {name: (dtypes or {}).get(name, str(array.dtype)) for name, array in arrays.items()}}
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            size = sum(f.stat().st_size for f in os.scandir(tmp_dir))
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another runner stored the same prompt first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        # The cache is only scanned again when it may have outgrown its cap
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self.entries())
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """
+        :return: List of (last use, size in bytes, path) of the entries of the cache.
+        """
+        entries = []
+        for prefix in os.scandir(self.cache_dir):
+            if not prefix.is_dir() or prefix.name.startswith("."):
+                continue
+            for entry in os.scandir(prefix.path):
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except OSError:
+                    continue  # Evicted by another runner
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_bytes`.
+
+        :return: Number of bytes freed.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        excess = total - self.max_bytes
+        freed = 0
+        for _, size, path in entries:
+            if freed >= excess:
+                break
+            # Arrays already mapped by a reader stay valid after their removal
+            shutil.rmtree(path, ignore_errors=True)
+            freed += size
+        self._size = total - freed
+        return freed
+
+    def summary(self):
+        return f"Embedding cache: {self.hits} hits, {self.misses} misses."
+
+
+def encode_with_cache(cache, encoder_id, max_length, prompts, encode, device):
+    """
+    Encode prompts, only running the text encoder on the prompts missing from the cache.
+
+    :param cache: EmbeddingCache.
+    :param encoder_id: Id of the text encoder.
+    :param max_length: Number of tokens the prompts are padded or truncated to.
+    :param prompts: List of prompts.
+    :param encode: Function encoding a list of prompts to a dict of tensor name -> torch tensor
+        whose first axis is the prompt (the tensors of every prompt have the same shape).
+    :param device: Device of the returned tensors, usually the device of the text encoder. Required, since
+        `encode` is not called when every prompt is cached.
+    :return: Dict of tensor name -> torch tensor of the prompts, like `encode(prompts)`.
+    """
+    import torch
+
+    cached = [cache.get(encoder_id, max_length, prompt) for prompt in prompts]
+    missing = [prompt for prompt, entry in zip(prompts, cached) if entry is None]
+
+    encoded = {}
+    if missing:
+        tensors = encode(missing)
+        for index, prompt in enumerate(missing):
+            prompt_tensors = {name: tensor[index].detach() for name, tensor in tensors.items()}
+            encoded[prompt] = prompt_tensors
+            cache.put(
+                encoder_id, max_length, prompt,
+                # numpy has no bfloat16: such tensors are stored as float32 and cast back when read
+                {name: (tensor.float() if tensor.dtype == torch.bfloat16 else tensor).cpu().numpy()
+                 for name, tensor in prompt_tensors.items()},
+                dtypes={name: str(tensor.dtype).replace("torch.", "") for name, tensor in prompt_tensors.items()},
+            )
+
+    stacked = {}
+    for prompt, entry in zip(prompts, cached):
+        if entry is None:
+            prompt_tensors = encoded[prompt]
+        else:
+            arrays, dtypes = entry
+            prompt_tensors = {name: torch.from_numpy(np.array(array)).to(getattr(torch, dtypes[name]))
+                              for name, array in arrays.items()}
+        for name, tensor in prompt_tensors.items():
+            stacked.setdefault(name, []).append(tensor.to(device))
+    return {name: torch.stack(tensors) for name, tensors in stacked.items()}
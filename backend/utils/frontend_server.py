@@ -0,0 +1,520 @@
+import argparse
+import email.utils
+import fnmatch
+import gzip
+import io
+import json
+import os
+import shlex
+import sys
+import threading
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from botocore.exceptions import ClientError
+from catalog import CatalogRefresher, CatalogStore
+from s3_utils import get_s3_client
+from video_cache import VideoCache
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Files worth compressing (db.csv, index.html, db_index.json, ...)
+COMPRESSIBLE_EXTENSIONS = {".html", ".csv", ".json", ".js", ".css", ".svg", ".txt"}
+
+# Objects served through /video/: videos, posters and HLS playlists and segments (not the manifests)
+VIDEO_EXTENSIONS = {".mp4", ".jpg", ".webp", ".m3u8", ".ts", ".m4s"}
+
+# Cache-Control per file pattern, first match wins. The catalog and the page are
+# revalidated on every load (cheap with ETags); static assets are cached.
+DEFAULT_CACHE_CONTROL = [
+    ("*.html", "no-cache"),
+    ("*.csv", "no-cache"),
+    ("*.json", "no-cache"),
+    ("*", "public, max-age=86400"),
+]
+
+
+class CompressedCache:
+    """
+    In-memory cache of the gzip and brotli encodings of the compressible files.
+
+    Entries are keyed by path and invalidated when the file's mtime or size
+    changes, so a refreshed db.csv is recompressed once, on first request.
+    """
+
+    def __init__(self, min_size=1024):
+        self.min_size = min_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def is_compressible(self, path, stat, encoding):
+        if encoding is None or (encoding == "br" and brotli is None):
+            return False
+        return stat.st_size >= self.min_size and os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS
+
+    def get(self, path, stat, encoding):
+        """
+        :param path: Path to the file.
+        :param stat: os.stat result of the file.
+        :param encoding: "br" or "gzip".
+        :return: The encoded bytes, or None if the file is not worth compressing.
+        """
+        if not self.is_compressible(path, stat, encoding):
+            return None
+
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry["version"] != version:
+                entry = {"version": version}
+                self._entries[path] = entry
+            if encoding not in entry:
+                with open(path, "rb") as f:
+                    data = f.read()
+                if encoding == "br":
+                    entry[encoding] = brotli.compress(data, quality=11)
+                else:
+                    entry[encoding] = gzip.compress(data, compresslevel=9)
+            return entry[encoding]
+
+    def warm(self, directory):
+        """Compress the compressible files at the top of `directory` ahead of the first request."""
+        encodings = ["gzip"] + (["br"] if brotli is not None else [])
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                for encoding in encodings:
+                    self.get(path, stat, encoding)
+
+
+class RangeFile:
+    """File wrapper that reads at most `length` bytes starting at `start`."""
+
+    def __init__(self, f, start, length):
+        self.f = f
+        self.remaining = length
+        f.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range "bytes=" header.
+
+    :param header: Value of the Range header.
+    :param size: Size of the file.
+    :return: An inclusive (start, end) tuple, None if the header should be
+        ignored (unsupported form), or False if the range cannot be satisfied.
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None
+
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start == "":
+            # Suffix range: the last N bytes
+            length = int(end)
+            if length == 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class FrontendRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler with precompressed responses, ETag/Last-Modified
+    revalidation, single Range requests and configurable Cache-Control.
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    timeout = 30  # Drop idle or stalled clients instead of holding a thread forever
+
+    cache_control = DEFAULT_CACHE_CONTROL
+    compressed_cache = CompressedCache()
+
+    # HLS playlists and segments, which mimetypes does not know (or guesses wrong)
+    extensions_map = {
+        **SimpleHTTPRequestHandler.extensions_map,
+        ".m3u8": "application/vnd.apple.mpegurl",
+        ".ts": "video/mp2t",
+    }
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path.startswith("/api/"):
+            self.handle_api()
+        elif path.startswith("/video/") and self.server.video_cache is not None:
+            self.handle_video()
+        else:
+            super().do_GET()
+
+    def do_HEAD(self):
+        path = urlsplit(self.path).path
+        if path.startswith("/api/"):
+            self.handle_api(head=True)
+        elif path.startswith("/video/") and self.server.video_cache is not None:
+            self.handle_video(head=True)
+        else:
+            super().do_HEAD()
+
+    def handle_video(self, head=False):
+        """
+        Serve /video/<object_name> from the local cache of the S3 bucket.
+
+        A cached object is served like a static file. A missing object is
+        downloaded into the cache first, except for Range requests (players
+        seeking or probing the moov box), which are passed through to S3 while
+        the cache is filled in the background. Only videos and their renditions
+        (VIDEO_EXTENSIONS) are served.
+        """
+        cache = self.server.video_cache
+        object_name = unquote(urlsplit(self.path).path[len("/video/"):])
+        if os.path.splitext(object_name)[1].lower() not in VIDEO_EXTENSIONS:
+            self.send_error(HTTPStatus.NOT_FOUND, "Video not found")
+            return
+
+        path = cache.lookup(object_name)
+        if path is None:
+            range_header = self.headers.get("Range")
+            if range_header and not head:
+                cache.fill_async(object_name)
+                self.proxy_range(object_name, range_header)
+                return
+            try:
+                path = cache.fill(object_name)
+            except FileNotFoundError:
+                self.send_error(HTTPStatus.NOT_FOUND, "Video not found")
+                return
+            except Exception as e:
+                self.send_error(HTTPStatus.BAD_GATEWAY, f"Error fetching the video: {e}")
+                return
+
+        f = self.send_file(path)
+        if f:
+            try:
+                if not head:
+                    self.copyfile(f, self.wfile)
+            finally:
+                f.close()
+
+    def proxy_range(self, object_name, range_header):
+        try:
+            response = get_s3_client().get_object(Bucket=self.server.video_cache.bucket_name, Key=object_name, Range=range_header)
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in ("404", "NoSuchKey"):
+                self.send_error(HTTPStatus.NOT_FOUND, "Video not found")
+            elif code == "InvalidRange":
+                self.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            else:
+                self.send_error(HTTPStatus.BAD_GATEWAY, f"Error fetching the video: {code}")
+            return
+
+        body = response["Body"]
+        try:
+            self.send_response(HTTPStatus.PARTIAL_CONTENT if "ContentRange" in response else HTTPStatus.OK)
+            self.send_header("Content-Type", self.guess_type(object_name))
+            self.send_header("Content-Length", str(response["ContentLength"]))
+            if "ContentRange" in response:
+                self.send_header("Content-Range", response["ContentRange"])
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            self.copyfile(body, self.wfile)
+        finally:
+            body.close()
+
+    def handle_api(self, head=False):
+        """
+        Paginated queries on the in-memory catalog built from db.csv:
+        - /api/facets: lists of models and prompts.
+        - /api/videos?model=&prompt=&page=&page_size=: videos of a model and/or prompt.
+        - /api/pairs?model=&page=&page_size=: prompt/base_prompt pairs of a model.
+        - /api/config: whether videos are served through /video/.
+        - /api/cache_stats: hit ratio and size of the video cache.
+        """
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == "/api/config":
+            self.send_json(HTTPStatus.OK, {"video_proxy": self.server.video_cache is not None}, head)
+            return
+
+        if url.path == "/api/cache_stats":
+            if self.server.video_cache is None:
+                self.send_json(HTTPStatus.NOT_FOUND, {"error": "The video cache is disabled"}, head)
+            else:
+                self.send_json(HTTPStatus.OK, self.server.video_cache.stats(), head)
+            return
+
+        catalog = self.server.catalog_store.get()
+        if catalog is None:
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Catalog not available yet"}, head)
+            return
+
+        try:
+            page = int(query.get("page", 1))
+            page_size = int(query.get("page_size", 0)) or None
+        except ValueError:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": "page and page_size must be integers"}, head)
+            return
+        page_args = {"page": page} if page_size is None else {"page": page, "page_size": page_size}
+
+        if url.path == "/api/facets":
+            body = catalog.facets()
+        elif url.path == "/api/videos":
+            body = catalog.videos(model=query.get("model"), prompt=query.get("prompt"), **page_args)
+        elif url.path == "/api/pairs":
+            if "model" not in query:
+                self.send_json(HTTPStatus.BAD_REQUEST, {"error": "model is required"}, head)
+                return
+            body = catalog.pairs(query["model"], **page_args)
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": "Unknown endpoint"}, head)
+            return
+
+        self.send_json(HTTPStatus.OK, body, head)
+
+    def send_json(self, status, body, head=False):
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if not head:
+            self.wfile.write(data)
+
+    def get_cache_control(self, path):
+        name = os.path.basename(path)
+        for pattern, value in self.cache_control:
+            if fnmatch.fnmatch(name, pattern):
+                return value
+        return None
+
+    def select_encoding(self):
+        accepted = {
+            token.split(";")[0].strip()
+            for token in self.headers.get("Accept-Encoding", "").split(",")
+        }
+        if "br" in accepted and brotli is not None:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        return self.send_file(path)
+
+    def send_file(self, path):
+        """
+        Send the headers of a file response.
+
+        :param path: Path to the file.
+        :return: A file-like object positioned at the body to send, or None if there is no body.
+        """
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        try:
+            stat = os.fstat(f.fileno())
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+
+            encoding = self.select_encoding()
+            if not self.compressed_cache.is_compressible(path, stat, encoding):
+                encoding = None
+            encoded_etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{encoding}"' if encoding else etag
+
+            if self.is_not_modified(etag, stat):
+                f.close()
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_common_headers(path, encoded_etag, last_modified)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+
+            # Ranges are served from the identity encoding
+            range_header = self.headers.get("Range")
+            if range_header and self.headers.get("If-Range", etag) in (etag, last_modified):
+                byte_range = parse_range(range_header, stat.st_size)
+                if byte_range is False:
+                    f.close()
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header("Content-Range", f"bytes */{stat.st_size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return None
+                if byte_range is not None:
+                    start, end = byte_range
+                    self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                    self.send_common_headers(path, etag, last_modified)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+                    self.send_header("Content-Length", str(end - start + 1))
+                    self.end_headers()
+                    return RangeFile(f, start, end - start + 1)
+
+            data = self.compressed_cache.get(path, stat, encoding) if encoding else None
+            if data is not None:
+                f.close()
+                self.send_response(HTTPStatus.OK)
+                self.send_common_headers(path, encoded_etag, last_modified)
+                self.send_header("Content-Encoding", encoding)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                return io.BytesIO(data)
+
+            self.send_response(HTTPStatus.OK)
+            self.send_common_headers(path, etag, last_modified)
+            self.send_header("Content-Length", str(stat.st_size))
+            self.end_headers()
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def send_common_headers(self, path, etag, last_modified):
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Vary", "Accept-Encoding")
+        cache_control = self.get_cache_control(path)
+        if cache_control:
+            self.send_header("Cache-Control", cache_control)
+
+    def is_not_modified(self, etag, stat):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # Compare weakly and ignore the encoding suffix of compressed variants
+            base = etag.strip('"')
+            for candidate in if_none_match.split(","):
+                candidate = candidate.strip()
+                if candidate == "*":
+                    return True
+                if candidate.startswith("W/"):
+                    candidate = candidate[2:]
+                candidate = candidate.strip('"')
+                if candidate == base or candidate.rsplit("-", 1)[0] == base:
+                    return True
+            return False
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(stat.st_mtime) <= since
+        return False
+
+
+class FrontendServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, directory, verbose=False, video_cache=None):
+        self.directory = directory
+        self.verbose = verbose
+        self.video_cache = video_cache
+        self.catalog_store = CatalogStore(os.path.join(directory, "db.csv"))
+        super().__init__(address, self.make_handler())
+
+    def make_handler(self):
+        directory = self.directory
+
+        class Handler(FrontendRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=directory, **kwargs)
+
+        return Handler
+
+
+def parse_cache_control(values):
+    """
+    :param values: List of "PATTERN=VALUE" strings (e.g. "*.csv=no-cache").
+    :return: Cache-Control rules, followed by the defaults.
+    """
+    rules = []
+    for value in values:
+        pattern, sep, header = value.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid --cache_control rule (expected PATTERN=VALUE): {value}")
+        rules.append((pattern, header))
+    return rules + DEFAULT_CACHE_CONTROL
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve the frontend")
+    parser.add_argument("--directory", type=str, default="/home/ubuntu/text2vid-viewer/frontend", help="Directory to serve")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Address to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--cache_control", type=str, action="append", default=[], help="Cache-Control rule PATTERN=VALUE, e.g. '*.png=public, max-age=604800' (repeatable)")
+    parser.add_argument("--refresh_interval", type=float, default=0, help="Rebuild db.csv with refresh_db.py every N seconds in the background (0: never)")
+    parser.add_argument("--refresh_args", type=str, default="", help="Extra arguments of refresh_db.py, e.g. '--incremental --use_model_manifests'")
+    parser.add_argument("--video_cache_dir", type=str, default=None, help="Serve /video/<object_name> from a local cache of the bucket kept in this directory")
+    parser.add_argument("--video_cache_max_gb", type=float, default=20, help="Maximum size of the video cache")
+    parser.add_argument("--bucket_name", type=str, default="text2videoviewer", help="Name of the S3 bucket behind the video cache")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    FrontendRequestHandler.cache_control = parse_cache_control(args.cache_control)
+
+    FrontendRequestHandler.compressed_cache.warm(args.directory)
+    video_cache = None
+    if args.video_cache_dir:
+        video_cache = VideoCache(args.video_cache_dir, bucket_name=args.bucket_name, max_bytes=int(args.video_cache_max_gb * 1024 ** 3))
+        print(f"Caching the videos of {args.bucket_name} in {args.video_cache_dir} (up to {args.video_cache_max_gb:g} GB).")
+
+    server = FrontendServer((args.host, args.port), args.directory, verbose=args.verbose, video_cache=video_cache)
+    server.catalog_store.get()  # Build the catalog index before the first request
+    print(f"Serving {args.directory} on http://{args.host}:{args.port} (brotli: {'on' if brotli else 'off'})")
+
+    if args.refresh_interval > 0:
+        # Serve the last known catalog while refresh_db.py rebuilds it, then swap in the new one
+        def on_refresh():
+            server.catalog_store.get()
+            FrontendRequestHandler.compressed_cache.warm(args.directory)
+
+        refresh_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), "refresh_db.py")
+        command = [sys.executable, refresh_db, "--csv_fpath", os.path.join(args.directory, "db.csv")] + shlex.split(args.refresh_args)
+        refresher = CatalogRefresher(command, args.refresh_interval, on_refresh=on_refresh)
+        refresher.start()
+        print(f"Refreshing the catalog every {args.refresh_interval:.0f}s.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,239 @@
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from resume import clear_done_marker, mark_done
+
+# Long-lived generation service for the model runners (`inference.py --serve`).
+#
+# The runner loads its pipeline once and hands a `generate` function to the service.
+# Jobs are submitted over HTTP and queued in a bounded queue; a single worker thread
+# runs them one after the other on the loaded pipeline:
+#   POST /generate     {"model": "cog", "prompt": ["...", ...], "seed": 42, ...}
+#                      -> {"job_id", "status", "outputs": [paths]} (503 if the queue is full)
+#   GET  /jobs/<id>    -> status of the job and of each of its outputs
+#   GET  /health       -> number of queued jobs and the job being run
+#
+# Only the standard library is required, so the service can be tested with a stub
+# `generate` function on a CPU-only machine.
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class GenerationService:
+    """
+    Bounded queue of generation jobs, run one at a time by a worker thread.
+    """
+
+    def __init__(self, model, generate, make_params, output_path, max_queue=16, max_jobs=1000, resume_index=None):
+        """
+        :param model: Name of the model served.
+        :param generate: Function (prompt, output_path, params) writing the video of a prompt.
+        :param make_params: Function (prompt, options) returning the generation parameters of a prompt;
+            `options` are the extra fields of the request. Raises ValueError for invalid options.
+        :param output_path: Function (params) returning the path of the video.
+        :param max_queue: Maximum number of queued jobs; further submissions are rejected.
+        :param max_jobs: Number of finished jobs kept for GET /jobs/<id>.
+        :param resume_index: Optional ResumeIndex; outputs already generated with the same parameters are reused.
+        """
+        self.model = model
+        self.generate = generate
+        self.make_params = make_params
+        self.output_path = output_path
+        self.max_jobs = max_jobs
+        self.resume_index = resume_index
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()  # job id -> job, oldest first
+        self._lock = threading.Lock()
+        self._running = None
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, prompts, options=None):
+        """
+        Queue a generation job.
+
+        :param prompts: List of prompts.
+        :param options: Generation options of the request (e.g. seed), passed to `make_params`.
+        :return: The job (see `get`).
+        :raises ValueError: Invalid prompts or options.
+        :raises QueueFullError: The queue is full.
+        """
+        if not prompts or not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts):
+            raise ValueError("'prompt' must be a non-empty string or list of non-empty strings")
+
+        outputs = []
+        for prompt in prompts:
+            params = self.make_params(prompt, options or {})
+            outputs.append({"prompt": prompt, "path": self.output_path(params), "params": params, "status": "queued"})
+
+        job = {"job_id": uuid.uuid4().hex, "model": self.model, "status": "queued", "outputs": outputs,
+               "error": None, "submitted_at": time.time(), "started_at": None, "finished_at": None}
+
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError(f"The queue is full ({self._queue.maxsize} jobs)")
+            self._jobs[job["job_id"]] = job
+            self._trim()
+        return self.describe(job)
+
+    def get(self, job_id):
+        """
+        :param job_id: Id of a job.
+        :return: The 'job_id', 'status' (queued, running, succeeded or failed), 'outputs' (prompt, path
+            and status of each video) and timestamps of the job, or None if it is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else self.describe(job)
+
+    def stats(self):
+        with self._lock:
+            return {"model": self.model, "queued": self._queue.qsize(), "max_queue": self._queue.maxsize,
+                    "running": self._running}
+
+    def describe(self, job):
+        description = {key: value for key, value in job.items() if key != "outputs"}
+        description["outputs"] = [{key: output[key] for key in ("prompt", "path", "status")} for output in job["outputs"]]
+        return description
+
+    def _trim(self):
+        # Called with the lock held: forget the oldest finished jobs
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("succeeded", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run_job(job)
+            except Exception as e:
+                # Any error (e.g. in the resume check or a done marker) fails the job, not the worker
+                print(f"Error running job {job['job_id']}: {e}")
+                job["error"] = job["error"] or str(e)
+                for output in job["outputs"]:
+                    if output["status"] in ("queued", "running"):
+                        output["status"] = "failed"
+            finally:
+                with self._lock:
+                    job["status"] = "failed" if job["error"] else "succeeded"
+                    job["finished_at"] = time.time()
+                    self._running = None
+                    self._trim()
+                self._queue.task_done()
+
+    def _run_job(self, job):
+        with self._lock:
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            self._running = job["job_id"]
+
+        for output in job["outputs"]:
+            if self.resume_index is not None and self.resume_index.find_completed(output["path"], output["params"]) == "local":
+                output["status"] = "cached"
+                continue
+            output["status"] = "running"
+            try:
+                clear_done_marker(output["path"])
+                self.generate(output["prompt"], output["path"], output["params"])
+                mark_done(output["path"], output["params"])
+                output["status"] = "succeeded"
+            except Exception as e:
+                print(f"Error generating {output['prompt']!r}: {e}")
+                output["status"] = "failed"
+                job["error"] = str(e)
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        service = self.server.service
+
+        if path == "/health":
+            self.send_json(HTTPStatus.OK, service.stats())
+        elif path.startswith("/jobs/"):
+            job = service.get(path[len("/jobs/"):])
+            if job is None:
+                self.send_json(HTTPStatus.NOT_FOUND, {"error": "unknown job"})
+            else:
+                self.send_json(HTTPStatus.OK, job)
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/generate":
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+            return
+
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("the body must be a JSON object")
+            if request.get("model", service.model) != service.model:
+                raise ValueError(f"this service runs {service.model}, not {request['model']}")
+            prompts = request.get("prompt")
+            prompts = [prompts] if isinstance(prompts, str) else prompts
+            options = {key: value for key, value in request.items() if key not in ("model", "prompt")}
+            job = service.submit(prompts if isinstance(prompts, list) else [], options)
+        except (ValueError, TypeError) as e:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+        except QueueFullError as e:
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)})
+            return
+
+        self.send_json(HTTPStatus.OK, job)
+
+
+class GenerationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+        super().__init__(address, GenerationRequestHandler)
+
+
+def serve(service, host="0.0.0.0", port=5000, verbose=False):
+    """
+    Serve a generation service over HTTP until interrupted.
+
+    :param service: GenerationService.
+    :param host: Address to listen on.
+    :param port: Port to listen on.
+    :param verbose: Log every request.
+    """
+    server = GenerationServer((host, port), service, verbose=verbose)
+    print(f"Serving {service.model} generation on http://{host}:{port} (POST /generate, GET /jobs/<id>).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
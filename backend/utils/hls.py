@@ -0,0 +1,128 @@
+import mimetypes
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from previews import run_ffmpeg
+
+# Adaptive bitrate renditions of a video, packaged as HLS next to the original:
+#   <model>/hls/<prompt>/master.m3u8         master playlist, one entry per rung
+#   <model>/hls/<prompt>/<rung>/index.m3u8   media playlist of a rung
+#   <model>/hls/<prompt>/<rung>/seg_000.ts   segments
+#
+# The player picks the rung that fits the viewer's bandwidth and switches at segment boundaries.
+
+# Rendition ladder: (name, height, video bitrate). A height of None keeps the source resolution;
+# rungs are never upscaled.
+HLS_LADDER = [
+    ("240p", 240, "400k"),
+    ("480p", 480, "1200k"),
+    ("native", None, "3000k"),
+]
+
+# Python guesses .ts as a Qt translation file
+mimetypes.add_type("video/mp2t", ".ts")
+
+
+def hls_master_name(object_name):
+    """
+    :param object_name: S3 object name of the original video ("<model>/<prompt>.mp4").
+    :return: The S3 object name of its HLS master playlist ("<model>/hls/<prompt>/master.m3u8").
+    """
+    model, filename = object_name.rsplit("/", 1)
+    return f"{model}/hls/{os.path.splitext(filename)[0]}/master.m3u8"
+
+
+def make_hls(video_path, output_dir, ladder=HLS_LADDER, segment_seconds=2):
+    """
+    Transcode a video into an HLS rendition ladder with a single ffmpeg run.
+
+    Keyframes are forced at every segment boundary so that all rungs are
+    aligned and the player can switch between them at any segment.
+
+    :param video_path: Path to the video.
+    :param output_dir: Directory of the master playlist; each rung gets a sub-directory.
+        It is emptied first, so it only holds the files of this run (not the segments or
+        rungs of an earlier ladder or an interrupted run).
+    :param ladder: List of (name, height, bitrate) rungs.
+    :param segment_seconds: Duration of a segment.
+    """
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+
+    # Split the decoded video once per rung and scale each copy
+    outputs = [f"[v{i}]" for i in range(len(ladder))]
+    filters = [f"[0:v]split={len(ladder)}{''.join(outputs)}"]
+    args = ["-i", video_path]
+    for i, (name, height, bitrate) in enumerate(ladder):
+        if height is not None:
+            filters.append(f"[v{i}]scale=-2:'min({height},ih)'[s{i}]")
+            outputs[i] = f"[s{i}]"
+        args += [
+            "-map", outputs[i],
+            f"-c:v:{i}", "libx264", f"-b:v:{i}", bitrate, f"-maxrate:v:{i}", bitrate, f"-bufsize:v:{i}", bitrate,
+        ]
+
+    args += [
+        "-filter_complex", ";".join(filters),
+        "-an",
+        "-preset", "veryfast", "-pix_fmt", "yuv420p",
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})", "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", str(segment_seconds),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(output_dir, "%v", "seg_%03d.ts"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(f"v:{i},name:{name}" for i, (name, _, _) in enumerate(ladder)),
+        os.path.join(output_dir, "%v", "index.m3u8"),
+    ]
+    run_ffmpeg(args)
+
+
+def make_hls_jobs(job, output_dir, ladder=HLS_LADDER, segment_seconds=2):
+    """
+    Generate the HLS renditions of an upload job's video.
+
+    The name of the master playlist is recorded in the job as 'hls_name'.
+
+    :param job: Upload job of the video (see s3_export.get_upload_job).
+    :param output_dir: Directory the renditions of all videos are written to.
+    :param ladder: List of (name, height, bitrate) rungs.
+    :param segment_seconds: Duration of a segment.
+    :return: Upload jobs of the playlists and segments, or an empty list if ffmpeg failed.
+    """
+    stem = os.path.splitext(os.path.basename(job["file_name"]))[0]
+    video_dir = os.path.join(output_dir, stem)
+
+    try:
+        make_hls(job["file_name"], video_dir, ladder=ladder, segment_seconds=segment_seconds)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error generating HLS renditions of {job['file_name']}: {e}")
+        return []
+
+    job["hls_name"] = hls_master_name(job["object_name"])
+    prefix = job["hls_name"].rsplit("/", 1)[0]
+
+    jobs = []
+    for root, _, files in os.walk(video_dir):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            relative_path = os.path.relpath(path, video_dir).replace(os.sep, "/")
+            jobs.append({"file_name": path, "object_name": f"{prefix}/{relative_path}", "metadata": {}, "source": job["object_name"]})
+
+    return jobs
+
+
+def make_hls_renditions(jobs, output_dir, max_workers=4, **options):
+    """
+    Generate the HLS renditions of several videos in parallel (one ffmpeg process per video).
+
+    :param jobs: Upload jobs of the videos.
+    :param output_dir: Directory the renditions are written to.
+    :param max_workers: Number of videos processed at the same time.
+    :param options: Keyword arguments of `make_hls_jobs`.
+    :return: Upload jobs of all playlists and segments.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda job: make_hls_jobs(job, output_dir, **options), jobs)
+        return [hls_job for hls_jobs in results for hls_job in hls_jobs]
@@ -0,0 +1,229 @@
+import argparse
+import os
+import struct
+
+# Pure-Python check and fix of the "faststart" layout of mp4 files.
+#
+# An mp4 is a sequence of boxes (size, type, payload). Players need the `moov` box
+# (sample tables) before they can decode anything, so when it is written after the
+# `mdat` box (media data), as most encoders do by default, playback only starts once
+# the whole file has been downloaded. Moving `moov` in front of `mdat` fixes that
+# without re-encoding; the chunk offsets of the sample tables (`stco`/`co64`) are
+# shifted by the size of `moov`.
+
+# Boxes on the path from `moov` to the chunk offset tables
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+def read_boxes(f, start, end):
+    """
+    List the boxes of a file region.
+
+    :param f: File opened in binary mode.
+    :param start: Offset of the first box.
+    :param end: Offset of the end of the region.
+    :return: List of (type, offset, size, header_size) tuples.
+    """
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]  # 64-bit size
+            header_size = 16
+        elif size == 0:
+            size = end - offset  # Box extends to the end of the file
+        if size < header_size or offset + size > end:
+            raise ValueError(f"Invalid {box_type!r} box at offset {offset}")
+        boxes.append((box_type, offset, size, header_size))
+        offset += size
+    return boxes
+
+
+def analyze_mp4(path):
+    """
+    Describe the top-level layout of an mp4 file.
+
+    :param path: Path to the mp4 file.
+    :return: A dict with:
+        - 'faststart': whether `moov` comes before the media data.
+        - 'fragmented': whether the file is a fragmented mp4 (always streamable).
+        - 'file_size', 'moov_offset', 'moov_size', 'mdat_offset'.
+        - 'startup_bytes': bytes a player must download before the first frame can be
+          decoded (up to the end of `moov`, and to the first media data).
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        boxes = read_boxes(f, 0, file_size)
+
+    offsets = {}
+    for box_type, offset, size, _ in boxes:
+        offsets.setdefault(box_type, (offset, size))
+
+    if b"moov" not in offsets:
+        raise ValueError(f"No moov box in {path}")
+
+    moov_offset, moov_size = offsets[b"moov"]
+    mdat_offset = offsets.get(b"mdat", (None, None))[0]
+    faststart = mdat_offset is None or moov_offset < mdat_offset
+    moov_end = moov_offset + moov_size
+    startup_bytes = moov_end if mdat_offset is None else max(moov_end, mdat_offset + 16)
+
+    return {
+        "faststart": faststart,
+        "fragmented": b"moof" in offsets,
+        "file_size": file_size,
+        "moov_offset": moov_offset,
+        "moov_size": moov_size,
+        "mdat_offset": mdat_offset,
+        "startup_bytes": min(startup_bytes, file_size),
+    }
+
+
+def shift_chunk_offsets(moov, shift, start, end):
+    """
+    Add `shift` to every chunk offset of the `stco`/`co64` tables of a `moov` box
+    that points into [start, end).
+
+    :param moov: bytearray holding the whole `moov` box (modified in place).
+    :param shift: Number of bytes the media data moves by.
+    :param start: First file offset that moves.
+    :param end: End of the file offsets that move.
+    """
+    def walk(offset, end_offset):
+        while offset + 8 <= end_offset:
+            size, box_type = struct.unpack_from(">I4s", moov, offset)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", moov, offset + 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = end_offset - offset
+            if size < header_size or offset + size > end_offset:
+                raise ValueError(f"Invalid {box_type!r} box in moov")
+
+            if box_type in CONTAINER_BOXES:
+                walk(offset + header_size, offset + size)
+            elif box_type in (b"stco", b"co64"):
+                # Full box: version and flags, entry count, then the offsets
+                count = struct.unpack_from(">I", moov, offset + header_size + 4)[0]
+                entry_format = ">I" if box_type == b"stco" else ">Q"
+                entry_size = struct.calcsize(entry_format)
+                table = offset + header_size + 8
+                for i in range(count):
+                    position = table + i * entry_size
+                    chunk_offset = struct.unpack_from(entry_format, moov, position)[0]
+                    if start <= chunk_offset < end:
+                        chunk_offset += shift
+                        if box_type == b"stco" and chunk_offset > 0xFFFFFFFF:
+                            raise ValueError("Chunk offset overflows stco after moving moov")
+                        struct.pack_into(entry_format, moov, position, chunk_offset)
+            elif box_type == b"cmov":
+                raise ValueError("Compressed moov boxes are not supported")
+            offset += size
+
+    box_size, _ = struct.unpack_from(">I4s", moov, 0)
+    header_size = 16 if box_size == 1 else 8
+    walk(header_size, len(moov))
+
+
+def make_faststart(src_path, dst_path):
+    """
+    Write a copy of an mp4 file with `moov` moved in front of the media data.
+
+    The media data is copied as is; only the chunk offsets are rewritten.
+
+    :param src_path: Path to the input mp4.
+    :param dst_path: Path to the output mp4 (written through a temporary file).
+    :return: True if the file was rewritten, False if it already was faststart
+        (or fragmented), in which case `dst_path` is not written.
+    """
+    info = analyze_mp4(src_path)
+    if info["faststart"] or info["fragmented"]:
+        return False
+
+    with open(src_path, "rb") as src:
+        boxes = read_boxes(src, 0, info["file_size"])
+        src.seek(info["moov_offset"])
+        moov = bytearray(src.read(info["moov_size"]))
+
+        # moov goes right before the first mdat; everything between there and the old
+        # position of moov moves forward by its size
+        insert_at = info["mdat_offset"]
+        shift_chunk_offsets(moov, info["moov_size"], insert_at, info["moov_offset"])
+
+        tmp_path = f"{dst_path}.tmp"
+        with open(tmp_path, "wb") as dst:
+            for box_type, offset, size, _ in boxes:
+                if offset == insert_at:
+                    dst.write(moov)
+                if box_type == b"moov":
+                    continue
+                src.seek(offset)
+                copy_bytes(src, dst, size)
+        os.replace(tmp_path, dst_path)
+
+    return True
+
+
+def copy_bytes(src, dst, length, chunk_size=1024 * 1024):
+    while length > 0:
+        data = src.read(min(chunk_size, length))
+        if not data:
+            raise ValueError("Unexpected end of file")
+        dst.write(data)
+        length -= len(data)
+
+
+def prepare_faststart(job, output_dir):
+    """
+    Make sure the video of an upload job is faststart before it is uploaded.
+
+    Non-faststart videos are remuxed into `output_dir` and the job is pointed at
+    the remuxed file; the original is left untouched. The layout statistics
+    (see `analyze_mp4`), with 'remuxed' and the 'startup_bytes' of the uploaded
+    file, are recorded in the job as 'faststart'.
+
+    :param job: Upload job of the video (see s3_export.get_upload_job).
+    :param output_dir: Directory of the remuxed videos.
+    :return: The statistics, or None if the file could not be parsed (it is then uploaded as is).
+    """
+    path = job["file_name"]
+    try:
+        stats = analyze_mp4(path)
+        stats["remuxed"] = False
+        if not stats["faststart"] and not stats["fragmented"]:
+            os.makedirs(output_dir, exist_ok=True)
+            remuxed_path = os.path.join(output_dir, os.path.basename(path))
+            make_faststart(path, remuxed_path)
+            stats["startup_bytes_before"] = stats["startup_bytes"]
+            stats["startup_bytes"] = analyze_mp4(remuxed_path)["startup_bytes"]
+            stats["remuxed"] = True
+            job["file_name"] = remuxed_path
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Error checking the mp4 layout of {path}: {e}")
+        return None
+
+    job["faststart"] = stats
+    if stats["remuxed"]:
+        print(f"Moved moov to the front of {os.path.basename(path)}: playback can start after "
+              f"{stats['startup_bytes'] / 1e3:.0f} kB instead of {stats['startup_bytes_before'] / 1e3:.0f} kB.")
+    return stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check the faststart layout of mp4 files and fix them without re-encoding")
+    parser.add_argument("paths", type=str, nargs="+", help="mp4 files to check")
+    parser.add_argument("--fix", action="store_true", help="Move moov to the front of non-faststart files (in place)")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        info = analyze_mp4(path)
+        status = "faststart" if info["faststart"] else "fragmented" if info["fragmented"] else "NOT faststart"
+        print(f"{path}: {status}, moov at {info['moov_offset']} ({info['moov_size']} bytes), "
+              f"{info['startup_bytes']} of {info['file_size']} bytes before the first frame")
+        if args.fix and make_faststart(path, path):
+            print(f"{path}: fixed, {analyze_mp4(path)['startup_bytes']} bytes before the first frame")
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from s3_utils import (clean_prompt, copy_s3_object, delete_s3_objects, get_s3_json, iter_s3_bucket_objects,
+                      parse_object_name, put_s3_json)
+
+
+# Sub-prefixes of the renditions stored next to a "<model>/<prompt>.mp4" video (see previews.py and hls.py)
+RENDITION_KINDS = ("poster", "preview")
+HLS_KIND = "hls"
+
+# Model and shard manifests written by s3_export (see s3_utils.model_manifest_name and shard_manifest_name)
+MANIFEST_PATTERN = re.compile(r"[^/]+/_manifest(\.shard-\d+-of-\d+)?\.json")
+
+
+def index_renditions(object_names):
+    """
+    Group the rendition keys by the video they belong to.
+
+    "<model>/poster/<prompt>.<ext>" and "<model>/preview/<prompt>.<ext>" belong to
+    "<model>/<prompt>", and so does every key under "<model>/hls/<prompt>/".
+
+    :param object_names: Iterable of object keys.
+    :return: A dict of (model, prompt) -> list of (key, prefix, suffix), where
+        prefix + prompt + suffix is the key.
+    """
+    renditions = {}
+    for key in object_names:
+        parts = key.split('/')
+        if len(parts) == 3 and parts[1] in RENDITION_KINDS:
+            stem, dot, extension = parts[2].rpartition('.')
+            if not dot:
+                stem, extension = parts[2], ""
+            suffix = f"{dot}{extension}"
+        elif len(parts) >= 4 and parts[1] == HLS_KIND:
+            stem = parts[2]
+            suffix = "/" + "/".join(parts[3:])
+        else:
+            continue
+        renditions.setdefault((parts[0], stem), []).append((key, f"{parts[0]}/{parts[1]}/", suffix))
+    return renditions
+
+
+def plan_renames(object_names):
+    """
+    Build the plan that gives every "<model>/<prompt>.<ext>" key a cleaned prompt.
+
+    The prompt part is cleaned with `clean_prompt`; the extension is kept. The
+    poster, preview and HLS renditions of a video are renamed together with it.
+    Keys whose cleaned name already exists (or is claimed by an earlier key of
+    the plan) are only deleted, so every cleaned key ends up with exactly one object.
+    The manifests of the models with renamed keys are rewritten to the new keys.
+
+    :param object_names: Iterable of object keys, from a single listing.
+    :return: A list of steps, dicts with 'old_key', 'new_key' and 'action'
+        ("rename" for copy + delete, "delete" for an existing target, "manifest"
+        for a manifest to rewrite in place).
+    """
+    existing = set(object_names)
+    renditions = index_renditions(existing)
+    claimed = set()
+    plan = []
+
+    def add_step(old_key, new_key):
+        if new_key in existing or new_key in claimed:
+            plan.append({"old_key": old_key, "new_key": new_key, "action": "delete"})
+        else:
+            plan.append({"old_key": old_key, "new_key": new_key, "action": "rename"})
+            claimed.add(new_key)
+
+    for old_key in sorted(existing):
+        parts = old_key.split('/')
+        if len(parts) != 2:
+            continue  # Not a "<model>/<prompt>" key; renditions are planned with their video
+
+        model_name, filename = parts
+        stem, dot, extension = filename.rpartition('.')
+        if not dot:
+            stem, extension = filename, ""
+        cleaned = clean_prompt(stem)
+        new_key = f"{model_name}/{cleaned}{dot}{extension}"
+
+        if new_key == old_key:
+            continue
+
+        add_step(old_key, new_key)
+        for rendition_key, prefix, suffix in sorted(renditions.get((model_name, stem), [])):
+            add_step(rendition_key, f"{prefix}{cleaned}{suffix}")
+
+    renamed_models = {step["old_key"].split('/')[0] for step in plan}
+    for key in sorted(existing):
+        if MANIFEST_PATTERN.fullmatch(key) and key.split('/')[0] in renamed_models:
+            plan.append({"old_key": key, "new_key": key, "action": "manifest"})
+
+    return plan
+
+
+def rewrite_manifest(manifest, steps):
+    """
+    Point the entries of a model manifest at the renamed keys.
+
+    The entry key, 'object_name', 'prompt' and the poster, preview and HLS names
+    of every renamed video are updated. The entries of duplicates (keys that are
+    only deleted) are dropped, since the object kept under the new key has its own.
+
+    :param manifest: Manifest dict, as written by s3_export.update_model_manifest.
+    :param steps: Rename and delete steps of the plan whose new key exists.
+    :return: The number of entries that were renamed or dropped.
+    """
+    new_keys = {step["old_key"]: step["new_key"] for step in steps}
+    renamed = {step["old_key"] for step in steps if step["action"] == "rename"}
+
+    videos = {}
+    changed = 0
+    for object_name, video in manifest["videos"].items():
+        if object_name not in new_keys:
+            videos[object_name] = video
+            continue
+
+        changed += 1
+        if object_name not in renamed:
+            continue  # Duplicate, dropped with its object
+
+        new_name = new_keys[object_name]
+        video = dict(video, object_name=new_name)
+        parsed = parse_object_name(new_name)
+        if parsed is not None:
+            video["prompt"] = parsed[1]
+        for field in ("poster_name", "preview_name", "hls_name"):
+            if video.get(field):
+                video[field] = new_keys.get(video[field], video[field])
+        videos[new_name] = video
+
+    manifest["videos"] = videos
+    return changed
+
+
+def load_state(state_fpath, bucket_name):
+    """
+    Load the state of a previous run, if any.
+
+    :param state_fpath: Path to the state file.
+    :param bucket_name: Name of the S3 bucket the state must belong to.
+    :return: The state dict, or None if there is no previous run.
+    """
+    if not os.path.exists(state_fpath):
+        return None
+
+    with open(state_fpath, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state["bucket_name"] != bucket_name:
+        raise ValueError(f"State file {state_fpath} belongs to bucket {state['bucket_name']}, not {bucket_name}")
+    return state
+
+
+def save_state(state_fpath, state):
+    tmp_fpath = f"{state_fpath}.tmp"
+    with open(tmp_fpath, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_fpath, state_fpath)
+
+
+def execute_plan(bucket_name, state, state_fpath, max_workers=16):
+    """
+    Run a rename plan: parallel server-side copies, then the manifest rewrites, then batched deletes.
+
+    Progress is saved to `state_fpath` after the copies, after every manifest and
+    after every delete batch, so an interrupted run resumes where it stopped. An
+    old key is only deleted once its copy exists and the manifests of its model
+    point at the new keys.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param state: Dict with 'bucket_name', 'plan', 'copied', 'rewritten' and 'deleted'.
+    :param state_fpath: Path to the state file.
+    :param max_workers: Number of copies in flight.
+    :return: The old keys and manifests that are left, empty once the plan is done.
+    """
+    copied = set(state["copied"])
+    rewritten = set(state.setdefault("rewritten", []))
+    deleted = set(state["deleted"])
+    steps = [step for step in state["plan"] if step["action"] != "manifest"]
+    manifests = [step["old_key"] for step in state["plan"] if step["action"] == "manifest"]
+
+    to_copy = [step for step in steps if step["action"] == "rename" and step["old_key"] not in copied]
+    print(f"Copying {len(to_copy)} objects.")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda step: copy_s3_object(bucket_name, step["old_key"], step["new_key"]), to_copy)
+        for step, ok in zip(to_copy, results):
+            if ok:
+                copied.add(step["old_key"])
+    state["copied"] = sorted(copied)
+    save_state(state_fpath, state)
+
+    # A manifest is done once every key of its model is copied; until then it is rewritten again on resume
+    done_steps = [step for step in steps if step["action"] == "delete" or step["old_key"] in copied]
+    pending_models = {step["old_key"].split('/')[0] for step in steps if step["action"] == "rename" and step["old_key"] not in copied}
+    for manifest_name in manifests:
+        if manifest_name in rewritten:
+            continue
+        model = manifest_name.split('/')[0]
+        manifest = get_s3_json(bucket_name, manifest_name)
+        if manifest is None:
+            continue
+        changed = rewrite_manifest(manifest, [step for step in done_steps if step["old_key"].split('/')[0] == model])
+        if put_s3_json(bucket_name, manifest_name, manifest) is None:
+            continue
+        print(f"Rewrote {changed} entries of {manifest_name}.")
+        if model not in pending_models:
+            rewritten.add(manifest_name)
+            state["rewritten"] = sorted(rewritten)
+            save_state(state_fpath, state)
+
+    # Keys are only deleted once the manifests of their model no longer point at them
+    unrewritten_models = {name.split('/')[0] for name in manifests if name not in rewritten}
+    to_delete = [
+        step["old_key"] for step in done_steps
+        if step["old_key"] not in deleted and step["old_key"].split('/')[0] not in unrewritten_models
+    ]
+    print(f"Deleting {len(to_delete)} objects.")
+
+    for batch in delete_s3_objects(bucket_name, to_delete):
+        deleted.update(batch)
+        state["deleted"] = sorted(deleted)
+        save_state(state_fpath, state)
+
+    failed = [step["old_key"] for step in steps if step["old_key"] not in deleted]
+    failed += [name for name in manifests if name not in rewritten]
+    print(f"Normalized {len(deleted)} of {len(steps)} keys and rewrote {len(rewritten)} of {len(manifests)} manifests.")
+    if failed:
+        print(f"{len(failed)} keys and manifests are left; run again to resume.")
+    return failed
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Normalize the prompt part of the object keys with clean_prompt")
+    parser.add_argument("--bucket_name", type=str, default="text2videoviewer", help="Name of the S3 bucket")
+    parser.add_argument("--state_fpath", type=str, default="normalize_keys_state.json", help="Plan and progress file, used to resume")
+    parser.add_argument("--max_workers", type=int, default=16, help="Number of copies in flight")
+    parser.add_argument("--dry_run", action="store_true", help="Print the plan without changing the bucket")
+    args = parser.parse_args()
+
+    state = load_state(args.state_fpath, args.bucket_name)
+    if state is None:
+        plan = plan_renames(obj["Key"] for obj in iter_s3_bucket_objects(args.bucket_name))
+        state = {"bucket_name": args.bucket_name, "plan": plan, "copied": [], "rewritten": [], "deleted": []}
+    else:
+        print(f"Resuming from {args.state_fpath}.")
+
+    if args.dry_run:
+        for step in state["plan"]:
+            if step["action"] == "rename":
+                print(f"Rename {step['old_key']} -> {step['new_key']}")
+            elif step["action"] == "manifest":
+                print(f"Rewrite the renamed entries of {step['old_key']}")
+            else:
+                print(f"Delete {step['old_key']} ({step['new_key']} exists)")
+        print(f"{len(state['plan'])} keys and manifests to normalize.")
+    else:
+        save_state(args.state_fpath, state)
+        failed = execute_plan(args.bucket_name, state, args.state_fpath, max_workers=args.max_workers)
+
+        # The plan is done: the next run lists the bucket again and plans the keys uploaded since
+        if not failed:
+            os.remove(args.state_fpath)
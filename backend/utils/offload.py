@@ -0,0 +1,118 @@
+# Placement policy of diffusers pipelines on the GPU.
+#
+# Sequential CPU offload lets any pipeline run on a small GPU but makes every denoising
+# step several times slower; model offload keeps one component (e.g. the transformer)
+# on the GPU at a time; large GPUs hold the whole pipeline. The policy is chosen from the
+# free device memory and the measured size of the pipeline components, plus headroom for
+# the activations of a step. VAE slicing and tiling (slower decoding with a bounded peak)
+# are only enabled when an untiled decode would not fit next to the weights left on the
+# device. The decisions only need numbers, so they can be checked with mocked memory and
+# size probes; torch is only imported by the functions touching the device.
+
+OFFLOAD_POLICIES = ("none", "model", "sequential")
+GB = 1024 ** 3
+
+
+def choose_offload_policy(free_bytes, component_bytes, headroom_bytes):
+    """
+    :param free_bytes: Free memory of the device.
+    :param component_bytes: Dict of component name -> size of its weights in bytes.
+    :param headroom_bytes: Memory needed on top of the weights on the device (activations, VAE decoding).
+    :return: The policy ("none": whole pipeline on the device, "model": one component at a time,
+        "sequential": one layer at a time) and the reason of the choice.
+    """
+    total = sum(component_bytes.values())
+    largest_name, largest = max(component_bytes.items(), key=lambda item: item[1], default=(None, 0))
+
+    if total + headroom_bytes <= free_bytes:
+        return "none", f"pipeline {total / GB:.1f} GB + {headroom_bytes / GB:.1f} GB headroom fit in {free_bytes / GB:.1f} GB free"
+    if largest + headroom_bytes <= free_bytes:
+        return "model", (f"pipeline {total / GB:.1f} GB + {headroom_bytes / GB:.1f} GB headroom do not fit in {free_bytes / GB:.1f} GB free, "
+                         f"its largest component ({largest_name}, {largest / GB:.1f} GB) does")
+    return "sequential", (f"largest component ({largest_name}, {largest / GB:.1f} GB) + {headroom_bytes / GB:.1f} GB "
+                          f"headroom do not fit in {free_bytes / GB:.1f} GB free")
+
+
+def choose_vae_tiling(policy, free_bytes, component_bytes, decode_bytes):
+    """
+    :param policy: Offload policy of the pipeline (see `choose_offload_policy`).
+    :param free_bytes: Free memory of the device before placing the pipeline.
+    :param component_bytes: Dict of component name -> size of its weights in bytes.
+    :param decode_bytes: Peak memory of an untiled VAE decode, or None if unknown.
+    :return: Whether to enable VAE slicing and tiling, and the reason of the choice.
+    """
+    if policy == "sequential" or decode_bytes is None:
+        return True, "memory is tight" if policy == "sequential" else "decoding peak unknown"
+
+    # Weights on the device while decoding: all of them, or only the VAE with model offload
+    resident = sum(component_bytes.values()) if policy == "none" else component_bytes.get("vae", 0)
+    if resident + decode_bytes <= free_bytes:
+        return False, f"untiled decoding ({decode_bytes / GB:.1f} GB) fits next to {resident / GB:.1f} GB of weights"
+    return True, f"untiled decoding ({decode_bytes / GB:.1f} GB) does not fit next to {resident / GB:.1f} GB of weights"
+
+
+def free_device_memory(device=0):
+    """
+    :param device: Index of the CUDA device.
+    :return: Free memory of the device in bytes.
+    """
+    import torch
+    free, _ = torch.cuda.mem_get_info(device)
+    return free
+
+
+def pipeline_component_bytes(pipe):
+    """
+    :param pipe: A diffusers pipeline.
+    :return: Dict of component name -> size of its parameters and buffers in bytes.
+    """
+    import torch
+    sizes = {}
+    for name, component in pipe.components.items():
+        if isinstance(component, torch.nn.Module):
+            tensors = list(component.parameters()) + list(component.buffers())
+            sizes[name] = sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+    return sizes
+
+
+def apply_offload_policy(pipe, requested="auto", headroom_bytes=8 * GB, decode_bytes=None, vae_tiling="auto",
+                         memory_probe=free_device_memory, size_probe=pipeline_component_bytes):
+    """
+    Place a pipeline on the GPU according to an offload policy, and enable VAE slicing and tiling if needed.
+
+    :param pipe: A diffusers pipeline, loaded on the CPU.
+    :param requested: "auto" to choose from the free memory, or one of OFFLOAD_POLICIES.
+    :param headroom_bytes: Memory needed on top of the weights on the device.
+    :param decode_bytes: Peak memory of an untiled VAE decode (None: always tile).
+    :param vae_tiling: "auto" to choose from the free memory, "on" or "off".
+    :param memory_probe: Function returning the free memory of the device in bytes.
+    :param size_probe: Function returning the dict of component name -> size in bytes of a pipeline.
+    :return: The policy applied and whether VAE tiling is enabled.
+    """
+    if requested not in ("auto", *OFFLOAD_POLICIES):
+        raise ValueError(f"Unknown offload policy: {requested} (expected auto or one of {', '.join(OFFLOAD_POLICIES)})")
+
+    free_bytes, component_bytes = memory_probe(), size_probe(pipe)
+    if requested == "auto":
+        policy, reason = choose_offload_policy(free_bytes, component_bytes, headroom_bytes)
+    else:
+        policy, reason = requested, "set on the command line"
+    print(f"Offload policy: {policy} ({reason}).")
+
+    if vae_tiling == "auto":
+        tiling, reason = choose_vae_tiling(policy, free_bytes, component_bytes, decode_bytes)
+    else:
+        tiling, reason = vae_tiling == "on", "set on the command line"
+    print(f"VAE slicing and tiling: {'on' if tiling else 'off'} ({reason}).")
+
+    if policy == "none":
+        pipe.to("cuda")
+    elif policy == "model":
+        pipe.enable_model_cpu_offload()
+    else:
+        pipe.enable_sequential_cpu_offload()
+
+    if tiling:
+        pipe.vae.enable_slicing()
+        pipe.vae.enable_tiling()
+    return policy, tiling
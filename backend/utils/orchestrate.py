@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+# Number of GPUs each model runs on. Models not listed get DEFAULT_GPUS.
+MODEL_GPUS = {
+    "cog": 1,
+    "pyramidflow": 1,  # torch.cuda.set_device(0): the first visible GPU
+    "opensora": 1,
+    "mochi": 4,  # One worker per visible GPU, needs at least 4
+}
+DEFAULT_GPUS = 1
+
+DEFAULT_COMMAND = "bash /home/ubuntu/text2vid-viewer/backend/utils/run_model.sh {model}"
+
+
+def detect_gpus():
+    """
+    :return: The indices of the GPUs of the machine, or an empty list if nvidia-smi is not available.
+    """
+    try:
+        result = subprocess.run(["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    return [int(line) for line in result.stdout.split()]
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def load_state(state_fpath, models, model_gpus, rerun=False):
+    """
+    Load the job state of a previous run and add the jobs of new models.
+
+    Jobs that were running when the previous run stopped are pending again.
+    Succeeded jobs are kept, so an interrupted run resumes where it stopped.
+
+    :param state_fpath: Path to the state file.
+    :param models: Models to run, in order.
+    :param model_gpus: Dict of model -> number of GPUs.
+    :param rerun: Run every model again, including the ones that succeeded.
+    :return: The state, a dict of model -> job.
+    """
+    previous = {}
+    if os.path.exists(state_fpath):
+        with open(state_fpath, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    state = {}
+    for model in models:
+        job = previous.get(model)
+        if job is None or rerun or job["status"] != "succeeded":
+            job = {
+                "model": model,
+                "status": "pending",
+                "gpus": None,
+                "attempts": job["attempts"] if job is not None else 0,
+                "returncode": None,
+                "started_at": None,
+                "finished_at": None,
+                "log": None,
+            }
+        job["num_gpus"] = model_gpus.get(model, DEFAULT_GPUS)
+        state[model] = job
+    return state
+
+
+# Function to save the job state (written to a temporary file, then renamed)
+def save_state(state_fpath, state):
+    tmp_fpath = f"{state_fpath}.tmp"
+    with open(tmp_fpath, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_fpath, state_fpath)
+
+
+def pick_gpus(free_gpus, num_gpus):
+    """
+    :param free_gpus: Sorted list of free GPU indices.
+    :param num_gpus: Number of GPUs needed.
+    :return: The GPUs to use, or None if there are not enough free GPUs.
+    """
+    if num_gpus > len(free_gpus):
+        return None
+    return free_gpus[:num_gpus]
+
+
+def run_jobs(state, state_fpath, gpus, command, log_dir, poll_interval=5):
+    """
+    Run the pending jobs, packing them onto disjoint sets of GPUs.
+
+    Each job runs `command` in its own process with CUDA_VISIBLE_DEVICES set to
+    its GPUs. Jobs needing the most GPUs are started first, so single-GPU jobs
+    do not keep a multi-GPU job waiting; the others fill the remaining GPUs and
+    start as soon as GPUs are released. A failed job only fails itself.
+
+    :param state: Dict of model -> job (see `load_state`), updated in place.
+    :param state_fpath: Path to the state file, saved after every change.
+    :param gpus: Indices of the GPUs to schedule on.
+    :param command: Command template; "{model}" is replaced by the name of the model.
+    :param log_dir: Directory of the per-job logs.
+    :param poll_interval: Seconds between two checks of the running jobs.
+    :return: The final state.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    pending = sorted((job for job in state.values() if job["status"] == "pending"), key=lambda job: -job["num_gpus"])
+    free_gpus = sorted(gpus)
+    running = {}  # model -> (Popen, log file)
+
+    for job in pending:
+        if job["num_gpus"] > len(gpus):
+            print(f"{job['model']} needs {job['num_gpus']} GPUs but only {len(gpus)} are available, skipping it.")
+            job["status"] = "failed"
+            job["finished_at"] = now()
+    pending = [job for job in pending if job["status"] == "pending"]
+    save_state(state_fpath, state)
+
+    while pending or running:
+        # Start every pending job that fits on the free GPUs
+        for job in list(pending):
+            job_gpus = pick_gpus(free_gpus, job["num_gpus"])
+            if job_gpus is None:
+                continue
+
+            free_gpus = [gpu for gpu in free_gpus if gpu not in job_gpus]
+            pending.remove(job)
+
+            env = dict(os.environ, CUDA_VISIBLE_DEVICES=",".join(str(gpu) for gpu in job_gpus))
+            log_fpath = os.path.join(log_dir, f"inference_{job['model']}.log")
+            log_file = open(log_fpath, "a", encoding="utf-8")
+            job.update(status="running", gpus=job_gpus, started_at=now(), finished_at=None, returncode=None, log=log_fpath)
+            job["attempts"] += 1
+            try:
+                process = subprocess.Popen(shlex.split(command.format(model=job["model"])), env=env,
+                                           stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT)
+            except OSError as e:
+                print(f"Failed to start {job['model']}: {e}")
+                log_file.close()
+                free_gpus = sorted(free_gpus + job_gpus)
+                job.update(status="failed", finished_at=now())
+                save_state(state_fpath, state)
+                continue
+            running[job["model"]] = (process, log_file)
+            save_state(state_fpath, state)
+            print(f"Started {job['model']} on GPU(s) {env['CUDA_VISIBLE_DEVICES']} (log: {log_fpath}).")
+
+        time.sleep(poll_interval)
+
+        # Release the GPUs of the jobs that finished
+        for model, (process, log_file) in list(running.items()):
+            returncode = process.poll()
+            if returncode is None:
+                continue
+
+            log_file.close()
+            del running[model]
+            job = state[model]
+            free_gpus = sorted(free_gpus + job["gpus"])
+            job.update(status="succeeded" if returncode == 0 else "failed", returncode=returncode, finished_at=now())
+            save_state(state_fpath, state)
+            print(f"{model} {job['status']} (exit code {returncode}).")
+
+    return state
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run the inference of several models concurrently on the GPUs of the machine")
+    parser.add_argument("--models", type=str, nargs="+", required=True, help="Models to run")
+    parser.add_argument("--command", type=str, default=DEFAULT_COMMAND, help="Command run for each model; {model} is replaced by the model name")
+    parser.add_argument("--gpus", type=str, action="append", default=[], help="GPUs of a model, MODEL=N, e.g. mochi=8 (repeatable)")
+    parser.add_argument("--num_gpus", type=int, default=None, help="Number of GPUs to schedule on (default: detected with nvidia-smi)")
+    parser.add_argument("--state_fpath", type=str, default="/home/ubuntu/logs/inference_state.json", help="Path to the job state file")
+    parser.add_argument("--log_dir", type=str, default="/home/ubuntu/logs", help="Directory of the per-model logs")
+    parser.add_argument("--poll_interval", type=float, default=5, help="Seconds between two checks of the running jobs")
+    parser.add_argument("--rerun", action="store_true", help="Run models that succeeded in a previous run again")
+    args = parser.parse_args()
+
+    model_gpus = dict(MODEL_GPUS)
+    for value in args.gpus:
+        model, sep, num_gpus = value.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid --gpus value (expected MODEL=N): {value}")
+        model_gpus[model] = int(num_gpus)
+
+    gpus = list(range(args.num_gpus)) if args.num_gpus is not None else detect_gpus()
+    if not gpus:
+        raise RuntimeError("No GPUs found; set --num_gpus to schedule anyway")
+
+    state = load_state(args.state_fpath, args.models, model_gpus, rerun=args.rerun)
+    skipped = [model for model, job in state.items() if job["status"] == "succeeded"]
+    if skipped:
+        print(f"Skipping models that already succeeded: {', '.join(skipped)} (use --rerun to run them again).")
+
+    state = run_jobs(state, args.state_fpath, gpus, args.command, args.log_dir, poll_interval=args.poll_interval)
+
+    failed = [model for model, job in state.items() if job["status"] == "failed"]
+    print(f"{len(state) - len(failed)} of {len(state)} models succeeded.")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
@@ -0,0 +1,125 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Lightweight renditions uploaded next to each video, so the viewer grid can show
+# a poster immediately and play a small looping preview instead of the full video:
+#   <model>/<prompt>.mp4          original
+#   <model>/poster/<prompt>.jpg   first frame (or .webp)
+#   <model>/preview/<prompt>.mp4  low resolution, low frame rate, no audio
+#
+# Everything runs on the CPU with ffmpeg (override the binary with FFMPEG_BINARY).
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+
+POSTER_FORMATS = ["jpg", "webp"]
+
+
+def derived_object_name(object_name, kind, extension):
+    """
+    Name of a rendition stored next to a video, e.g. ("cog/a cat.mp4", "poster", "jpg") -> "cog/poster/a cat.jpg".
+
+    :param object_name: S3 object name of the original video ("<model>/<prompt>.mp4").
+    :param kind: Sub-prefix of the rendition ("poster", "preview").
+    :param extension: File extension of the rendition, without the dot.
+    :return: The S3 object name of the rendition.
+    """
+    model, filename = object_name.rsplit("/", 1)
+    return f"{model}/{kind}/{os.path.splitext(filename)[0]}.{extension}"
+
+
+def make_poster(video_path, poster_path, width=480):
+    """
+    Extract the first frame of a video as a JPEG or WebP image (chosen by the extension of `poster_path`).
+
+    :param video_path: Path to the video.
+    :param poster_path: Path to the output image.
+    :param width: Width of the image; the height keeps the aspect ratio.
+    """
+    if poster_path.endswith(".webp"):
+        codec_args = ["-c:v", "libwebp", "-quality", "75"]
+    else:
+        codec_args = ["-q:v", "4"]
+
+    run_ffmpeg(["-i", video_path, "-frames:v", "1", "-vf", f"scale={width}:-2"] + codec_args + [poster_path])
+
+
+def make_preview(video_path, preview_path, width=320, fps=12, crf=32, max_seconds=None):
+    """
+    Encode a small, silent H.264 preview of a video.
+
+    :param video_path: Path to the video.
+    :param preview_path: Path to the output mp4.
+    :param width: Width of the preview; the height keeps the aspect ratio.
+    :param fps: Frame rate of the preview.
+    :param crf: x264 constant rate factor (higher is smaller).
+    :param max_seconds: Only keep the first seconds of the video.
+    """
+    args = ["-i", video_path]
+    if max_seconds is not None:
+        args += ["-t", str(max_seconds)]
+    args += [
+        "-an",
+        "-vf", f"fps={fps},scale={width}:-2",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf), "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+        preview_path,
+    ]
+    run_ffmpeg(args)
+
+
+def run_ffmpeg(args):
+    subprocess.run([FFMPEG_BINARY, "-y", "-loglevel", "error"] + args, check=True, stdin=subprocess.DEVNULL)
+
+
+def make_preview_jobs(job, output_dir, poster_format="jpg", poster_width=480, preview_width=320):
+    """
+    Generate the poster and preview of an upload job's video.
+
+    The names of the renditions are recorded in the job as 'poster_name' and
+    'preview_name'.
+
+    :param job: Upload job of the video (see s3_export.get_upload_job).
+    :param output_dir: Directory the renditions are written to.
+    :param poster_format: "jpg" or "webp".
+    :param poster_width: Width of the poster.
+    :param preview_width: Width of the preview.
+    :return: Upload jobs of the renditions, or an empty list if ffmpeg failed.
+    """
+    if poster_format not in POSTER_FORMATS:
+        raise ValueError(f"Unknown poster format {poster_format!r}, expected one of {POSTER_FORMATS}")
+
+    stem = os.path.splitext(os.path.basename(job["file_name"]))[0]
+    poster_path = os.path.join(output_dir, f"{stem}.poster.{poster_format}")
+    preview_path = os.path.join(output_dir, f"{stem}.preview.mp4")
+    os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        make_poster(job["file_name"], poster_path, width=poster_width)
+        make_preview(job["file_name"], preview_path, width=preview_width)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error generating previews of {job['file_name']}: {e}")
+        return []
+
+    job["poster_name"] = derived_object_name(job["object_name"], "poster", poster_format)
+    job["preview_name"] = derived_object_name(job["object_name"], "preview", "mp4")
+
+    return [
+        {"file_name": poster_path, "object_name": job["poster_name"], "metadata": job["metadata"], "source": job["object_name"]},
+        {"file_name": preview_path, "object_name": job["preview_name"], "metadata": job["metadata"], "source": job["object_name"]},
+    ]
+
+
+def make_previews(jobs, output_dir, max_workers=4, **options):
+    """
+    Generate the renditions of several videos in parallel (one ffmpeg process per video).
+
+    :param jobs: Upload jobs of the videos.
+    :param output_dir: Directory the renditions are written to.
+    :param max_workers: Number of videos processed at the same time.
+    :param options: Keyword arguments of `make_preview_jobs`.
+    :return: Upload jobs of all renditions.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda job: make_preview_jobs(job, output_dir, **options), jobs)
+        return [preview_job for preview_jobs in results for preview_job in preview_jobs]
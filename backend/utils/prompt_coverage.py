@@ -0,0 +1,141 @@
+import argparse
+import json
+import pandas as pd
+from s3_utils import iter_s3_bucket_objects, parse_object_name
+
+
+def list_coverage_records(bucket_name, models):
+    """
+    List the videos of the given models in a single pass over their prefixes.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param models: List of model names (S3 prefixes).
+    :return: A DataFrame with 'model' and 'prompt' columns.
+    """
+    records = []
+    for obj in iter_s3_bucket_objects(bucket_name, prefixes=[f"{model}/" for model in models]):
+        parsed = parse_object_name(obj["Key"])
+        if parsed is None or "/" in parsed[0]:
+            continue  # Not a video, or a preview or HLS file of a video ("<model>/preview/<prompt>.mp4")
+        records.append(parsed)
+
+    return pd.DataFrame(records, columns=["model", "prompt"])
+
+
+def build_coverage_matrix(df, models=None, prompts=None):
+    """
+    Build a boolean model x prompt presence matrix.
+
+    :param df: DataFrame with 'model' and 'prompt' columns, one row per video.
+    :param models: Models to use as rows (default: every model in `df`).
+    :param prompts: Prompts to use as columns (default: every prompt in `df`).
+        Prompts missing from `df` get an all-False column.
+    :return: A boolean DataFrame indexed by model with one column per prompt.
+    """
+    models = df["model"].unique() if models is None else models
+    prompts = df["prompt"].unique() if prompts is None else prompts
+
+    present = pd.crosstab(df["model"], df["prompt"]) > 0
+    return present.reindex(index=pd.Index(models, name="model"), columns=pd.Index(prompts, name="prompt"), fill_value=False)
+
+
+def missing_cells(matrix):
+    """
+    List every (model, prompt) pair that has no video.
+
+    :param matrix: Presence matrix from `build_coverage_matrix`.
+    :return: A DataFrame with 'model' and 'prompt' columns.
+    """
+    cells = matrix.stack()
+    return cells[~cells].index.to_frame(index=False)
+
+
+def pairwise_diff(matrix, model_a, model_b):
+    """
+    Compare the prompts covered by two models.
+
+    :param matrix: Presence matrix from `build_coverage_matrix`.
+    :param model_a: Name of the first model.
+    :param model_b: Name of the second model.
+    :return: A dict with the prompts 'only_in_a' and 'only_in_b'.
+    """
+    a = matrix.loc[model_a].to_numpy()
+    b = matrix.loc[model_b].to_numpy()
+    return {
+        "only_in_a": matrix.columns[a & ~b].tolist(),
+        "only_in_b": matrix.columns[b & ~a].tolist(),
+    }
+
+
+def completeness(matrix):
+    """
+    Summarize how many prompts each model covers.
+
+    :param matrix: Presence matrix from `build_coverage_matrix`.
+    :return: A DataFrame with 'model', 'present', 'total' and 'ratio' columns.
+    """
+    present = matrix.sum(axis=1)
+    total = matrix.shape[1]
+    return pd.DataFrame({
+        "model": matrix.index,
+        "present": present.to_numpy(),
+        "total": total,
+        "ratio": (present / total if total else present * 0.0).to_numpy(),
+    })
+
+
+def write_report(matrix, report_fpath):
+    """
+    Write a coverage report. The format follows the file extension:
+    ".json" writes completeness, missing cells and all pairwise diffs,
+    ".csv" writes the presence matrix (one row per model).
+
+    :param matrix: Presence matrix from `build_coverage_matrix`.
+    :param report_fpath: Path to the report.
+    """
+    if report_fpath.endswith(".csv"):
+        matrix.astype(int).to_csv(report_fpath, encoding='utf-8')
+        return
+
+    models = matrix.index.tolist()
+    report = {
+        "completeness": completeness(matrix).to_dict(orient="records"),
+        "missing": missing_cells(matrix).to_dict(orient="records"),
+        "pairwise": [
+            {"model_a": a, "model_b": b, **pairwise_diff(matrix, a, b)}
+            for i, a in enumerate(models) for b in models[i + 1:]
+        ],
+    }
+    with open(report_fpath, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Audit which prompts have a video for each model")
+    parser.add_argument("--bucket_name", type=str, default="text2videoviewer", help="Name of the S3 bucket")
+    parser.add_argument("--models", type=str, nargs="+", default=["cog", "pyramidflow", "opensora", "mochi"], help="Models to audit")
+    parser.add_argument("--prompts_csv", type=str, default=None, help="Audit against the prompts of this CSV instead of every prompt found in S3")
+    parser.add_argument("--compare", type=str, nargs=2, default=None, metavar=("MODEL_A", "MODEL_B"), help="Print the prompt differences of two models")
+    parser.add_argument("--report", type=str, default=None, help="Write a JSON or CSV report to this path")
+    args = parser.parse_args()
+
+    df = list_coverage_records(args.bucket_name, args.models)
+    prompts = pd.read_csv(args.prompts_csv)["prompt"].unique() if args.prompts_csv else None
+    matrix = build_coverage_matrix(df, models=args.models, prompts=prompts)
+
+    print(completeness(matrix).to_string(index=False))
+
+    if args.compare:
+        model_a, model_b = args.compare
+        diff = pairwise_diff(matrix, model_a, model_b)
+        print(f"\nPrompts in {model_a} but not in {model_b} ({len(diff['only_in_a'])}):")
+        for prompt in diff["only_in_a"]:
+            print(f"\t{prompt}")
+        print(f"\nPrompts in {model_b} but not in {model_a} ({len(diff['only_in_b'])}):")
+        for prompt in diff["only_in_b"]:
+            print(f"\t{prompt}")
+
+    if args.report:
+        write_report(matrix, args.report)
+        print(f"Wrote coverage report to {args.report}.")
@@ -1,36 +1,77 @@
 import pandas as pd
-from s3_utils import list_s3_bucket_items, get_s3_object_metadata
+from s3_utils import configure_s3_client, iter_s3_bucket_objects, get_s3_json, get_s3_objects_metadata, model_manifest_name, parse_object_name
+from prompt_coverage import build_coverage_matrix
+from previews import POSTER_FORMATS, derived_object_name
+from hls import hls_master_name
+from viewer_index import build_viewer_index, write_viewer_index
+import argparse
 import csv
+import json
+import os
 from tqdm import tqdm
 
+# Models shown in the viewer; each one is listed under its own "<model>/" prefix
+SOTA_MODELS = ["cog", "pyramidflow", "opensora", "mochi"]
+
 # Function to update CSV with model and prompt derived from object_name
-def update_csv(csv_fpath, bucket_name="text2videoviewer"):
-    all_objects = list_s3_bucket_items(bucket_name)  # List of object names in the bucket
+def update_csv(csv_fpath, bucket_name="text2videoviewer", max_workers=16, manifest_fpath=None, use_model_manifests=False):
+    """
+    Rebuild the frontend catalog from the objects in the bucket.
+
+    :param csv_fpath: Path to the output db.csv.
+    :param bucket_name: Name of the S3 bucket.
+    :param max_workers: Number of concurrent metadata requests.
+    :param manifest_fpath: Path to a listing manifest. When set, the refresh is
+        incremental: only objects that are new or changed since the last run are
+        HEADed, and deleted objects are dropped from the manifest.
+    :param use_model_manifests: Read the videos of each model from the manifest
+        written by s3_export (one GET per model). Models without a manifest are
+        listed and HEADed as usual.
+
+    The pre-indexed viewer catalog (see viewer_index.py) is written next to the
+    CSV as db_index.json.
+    """
+    if use_model_manifests:
+        manifest_records, listed_models = load_model_manifests(bucket_name, SOTA_MODELS)
+    else:
+        manifest_records, listed_models = [], SOTA_MODELS
+    known_base_prompts = {record["object_name"]: record["base_prompt"] for record in manifest_records}
+    known_renditions = {record["object_name"]: record for record in manifest_records}
+
+    # Stream the objects of the model prefixes as listing pages arrive
+    if listed_models:
+        listing = iter_s3_bucket_objects(bucket_name, prefixes=[f"{model}/" for model in listed_models])
+    else:
+        listing = iter([])
+
+    if manifest_fpath is not None:
+        manifest = sync_manifest(load_manifest(manifest_fpath), listing)
+        all_objects = manifest.keys()
+    else:
+        manifest = None
+        all_objects = (obj["Key"] for obj in listing)  # Object names in the bucket
+
+    listed = set()  # Every listed object, to look up the posters and previews of the videos
     records = []
-    
     for obj in all_objects:
-        # Split the object name into model and prompt using the provided pattern
-        parts = obj.rsplit("/", 1)
-        if len(parts) != 2:
-            continue  # Skip if the object name doesn't match the expected pattern
-        
-        model = parts[0]  # model is before the "/"
-        prompt_with_extension = parts[1]  # prompt with the ".mp4" extension
-        
-        # Remove the file extension (.mp4) to extract the prompt
-        if prompt_with_extension.endswith(".mp4"):
-            prompt = prompt_with_extension[:-4]  # Remove the ".mp4" extension
-        else:
-            continue  # Skip if the object name doesn't end with .mp4
+        listed.add(obj)
+        parsed = parse_object_name(obj)
+        if parsed is None:
+            continue
+
+        model, prompt = parsed
+        if "/" in model:
+            continue  # Preview or HLS file of a video ("<model>/preview/<prompt>.mp4")
 
         records.append({
             "model": model, 
             "prompt": prompt, 
             "object_name": obj
         })
+    records.extend({key: record[key] for key in ["model", "prompt", "object_name"]} for record in manifest_records)
 
     # Create DataFrame
-    df = pd.DataFrame(records)
+    df = pd.DataFrame(records, columns=["model", "prompt", "object_name"])
     print(f"Found a total of {len(records)} videos in S3.")
 
     # Filter models
@@ -45,23 +86,157 @@ def update_csv(csv_fpath, bucket_name="text2videoviewer"):
     # Update name "opensora" to "opensora-v1.2"
     df["model"] = df["model"].replace({"opensora": "opensora-v1.2"})
 
-    # Add base_prompt metadata after filtering
-    df = add_base_prompt_metadata(df, bucket_name)
+    # Add base_prompt metadata after filtering (videos read from model manifests already have it)
+    known = df["object_name"].isin(known_base_prompts.keys())
+    fetched = df[~known].copy()
+    if manifest is not None:
+        fetched = add_base_prompt_metadata_incremental(fetched, bucket_name, manifest, max_workers=max_workers)
+        save_manifest(manifest_fpath, manifest)
+    else:
+        fetched = add_base_prompt_metadata(fetched, bucket_name, max_workers=max_workers)
+
+    df["base_prompt"] = df["object_name"].map(known_base_prompts).astype(object)  # All NaN (float) when nothing is known
+    df.loc[~known, "base_prompt"] = fetched["base_prompt"]
+
+    # Add the posters and previews uploaded by `s3_export.py --previews`
+    df["poster_name"] = [
+        known_renditions[obj]["poster_name"] if obj in known_renditions else find_rendition(obj, "poster", POSTER_FORMATS, listed)
+        for obj in df["object_name"]
+    ]
+    df["preview_name"] = [
+        known_renditions[obj]["preview_name"] if obj in known_renditions else find_rendition(obj, "preview", ["mp4"], listed)
+        for obj in df["object_name"]
+    ]
+
+    # Add the HLS master playlists uploaded by `s3_export.py --hls`
+    df["hls_name"] = [
+        known_renditions[obj]["hls_name"] if obj in known_renditions else (hls_master_name(obj) if hls_master_name(obj) in listed else "")
+        for obj in df["object_name"]
+    ]
+
+    # Write the pre-indexed catalog loaded by the viewer first: readers key off db.csv (the server reloads
+    # its catalog when db.csv changes), so a new db.csv is never paired with the previous index
+    index_fpath = os.path.join(os.path.dirname(csv_fpath), "db_index.json")
+    write_viewer_index(build_viewer_index(df.to_dict(orient="records")), index_fpath)
+    print(f"Wrote viewer index to {index_fpath}.")
+
+    # Written next to its final path and then renamed, so the server never reads a half-written catalog
+    tmp_fpath = f"{csv_fpath}.tmp"
+    df.to_csv(tmp_fpath, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8')
+    os.replace(tmp_fpath, csv_fpath)
+
+
+# Function to read the per-model manifests written by s3_export
+def load_model_manifests(bucket_name, models):
+    """
+    :param bucket_name: Name of the S3 bucket.
+    :param models: Model names (S3 prefixes).
+    :return: The video records (model, prompt, object_name, base_prompt, poster_name, preview_name, hls_name) of the
+        models that have a manifest, and the list of models that do not.
+    """
+    records = []
+    missing_models = []
+
+    for model in models:
+        manifest = get_s3_json(bucket_name, model_manifest_name(model))
+        if manifest is None:
+            missing_models.append(model)
+            continue
+
+        for video in manifest["videos"].values():
+            records.append({
+                "model": model,
+                "prompt": video["prompt"],
+                "object_name": video["object_name"],
+                "base_prompt": video["base_prompt"],
+                "poster_name": video.get("poster_name", ""),
+                "preview_name": video.get("preview_name", ""),
+                "hls_name": video.get("hls_name", ""),
+            })
+        print(f"Read {len(manifest['videos'])} videos from {model_manifest_name(model)}.")
+
+    if missing_models:
+        print(f"No manifest for {', '.join(missing_models)}; listing these models instead.")
+
+    return records, missing_models
+
+
+# Function to find the rendition of a video among the listed objects
+def find_rendition(object_name, kind, extensions, listed):
+    for extension in extensions:
+        name = derived_object_name(object_name, kind, extension)
+        if name in listed:
+            return name
+    return ""
+
+
+# Function to load the listing manifest (object key -> ETag, LastModified, base_prompt)
+def load_manifest(manifest_fpath):
+    if not os.path.exists(manifest_fpath):
+        print(f"No manifest found at {manifest_fpath}, starting from scratch.")
+        return {}
+
+    with open(manifest_fpath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Function to save the listing manifest (written to a temporary file, then renamed)
+def save_manifest(manifest_fpath, manifest):
+    tmp_fpath = f"{manifest_fpath}.tmp"
+    with open(tmp_fpath, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_fpath, manifest_fpath)
+
+
+# Function to reconcile the manifest with a fresh bucket listing
+def sync_manifest(manifest, listing):
+    """
+    Keep manifest entries whose ETag and LastModified are unchanged, reset
+    entries for new or changed objects and drop objects that were deleted.
+
+    :param manifest: Previous manifest (object key -> entry).
+    :param listing: Iterable of object dicts from `iter_s3_bucket_objects`.
+    :return: The updated manifest. Entries whose `base_prompt` is None still
+        need to be fetched.
+    """
+    synced = {}
+    new, changed = 0, 0
+
+    for obj in listing:
+        key = obj["Key"]
+        previous = manifest.get(key)
+        if previous is not None and previous["etag"] == obj["ETag"] and previous["last_modified"] == obj["LastModified"]:
+            synced[key] = previous
+            continue
+
+        if previous is None:
+            new += 1
+        else:
+            changed += 1
+        synced[key] = {"etag": obj["ETag"], "last_modified": obj["LastModified"], "base_prompt": None}
+
+    deleted = len(set(manifest) - set(synced))
+    print(f"Manifest: {new} new, {changed} changed, {deleted} deleted, {len(synced) - new - changed} unchanged objects.")
+
+    return synced
 
-    df.to_csv(csv_fpath, index=False, quoting=csv.QUOTE_ALL, encoding='utf-8')
 
 # Function to filter DataFrame based on records in prompts.csv
 def filter_records_based_on_prompts(df, prompts_csv_fpath):
     prompts_df = pd.read_csv(prompts_csv_fpath)
     filtered_df = df[df["prompt"].isin(prompts_df["prompt"])]
 
+    # Model x prompt presence matrix of the kept videos
+    matrix = build_coverage_matrix(filtered_df, models=filtered_df["model"].unique(), prompts=prompts_df["prompt"].unique())
+
     # Print information about kept and excluded prompts
-    for model in filtered_df["model"].unique():
-        print(f"Kept prompts for model {model} ({len(filtered_df[filtered_df['model'] == model]['prompt'].unique())} videos):")
-        for prompt in filtered_df[filtered_df["model"] == model]["prompt"].unique():
+    for model, present in matrix.iterrows():
+        kept_prompts = matrix.columns[present.to_numpy()]
+        print(f"Kept prompts for model {model} ({len(kept_prompts)} videos):")
+        for prompt in kept_prompts:
             print(f"\t{prompt}")
-        
-        excluded_prompts = set(prompts_df["prompt"]) - set(filtered_df[filtered_df["model"] == model]["prompt"].unique())
+
+        excluded_prompts = matrix.columns[~present.to_numpy()]
         print(f"Excluded prompts for model {model} ({len(excluded_prompts)} prompts):")
         for prompt in excluded_prompts:
             print(f"\t{prompt}")
@@ -69,7 +244,7 @@ def filter_records_based_on_prompts(df, prompts_csv_fpath):
     return filtered_df
 
 # Function to filter DataFrame based on model
-def filter_records_based_on_model(df, sota_models=["cog", "pyramidflow", "opensora", "mochi"]):
+def filter_records_based_on_model(df, sota_models=SOTA_MODELS):
     filtered_df = df[df["model"].isin(sota_models)]
     
     # Print filtering result for models
@@ -79,20 +254,16 @@ def filter_records_based_on_model(df, sota_models=["cog", "pyramidflow", "openso
 
 
 # Function to add base_prompt metadata to the DataFrame
-def add_base_prompt_metadata(df, bucket_name):
-    base_prompts = []
-    
-    # Iterate over the DataFrame rows with a progress bar
-    for index, row in tqdm(df.iterrows(), total=len(df), desc="Fetching Metadata", unit="object"):
-        object_name = row["object_name"]
-        
-        # Get metadata for the object
-        metadata = get_s3_object_metadata(bucket_name, object_name)
-        
-        # Extract base_prompt from metadata (assuming it's part of the metadata)
-        base_prompt = metadata.get("base_prompt", "")
-        base_prompts.append(base_prompt)
-    
+def add_base_prompt_metadata(df, bucket_name, max_workers=16):
+    # Fetch metadata for all objects concurrently (results keep the row order)
+    with tqdm(total=len(df), desc="Fetching Metadata", unit="object") as pbar:
+        metadata = get_s3_objects_metadata(
+            bucket_name, df["object_name"].tolist(), max_workers=max_workers, progress=pbar.update
+        )
+
+    # Extract base_prompt from metadata (assuming it's part of the metadata)
+    base_prompts = [m.get("base_prompt", "") for m in metadata]
+
     # Add base_prompt as a new column in the DataFrame
     df["base_prompt"] = base_prompts
     print("Added base_prompt metadata to DataFrame.")
@@ -100,7 +271,35 @@ def add_base_prompt_metadata(df, bucket_name):
     return df
 
 
+# Function to add base_prompt metadata, fetching it only for objects missing from the manifest
+def add_base_prompt_metadata_incremental(df, bucket_name, manifest, max_workers=16):
+    stale = [obj for obj in df["object_name"] if manifest[obj]["base_prompt"] is None]
+
+    if stale:
+        with tqdm(total=len(stale), desc="Fetching Metadata", unit="object") as pbar:
+            metadata = get_s3_objects_metadata(bucket_name, stale, max_workers=max_workers, progress=pbar.update)
+        for obj, m in zip(stale, metadata):
+            manifest[obj]["base_prompt"] = m.get("base_prompt", "")
+    print(f"Fetched metadata for {len(stale)} of {len(df)} videos.")
+
+    df["base_prompt"] = [manifest[obj]["base_prompt"] for obj in df["object_name"]]
+    print("Added base_prompt metadata to DataFrame.")
+
+    return df
+
+
 if __name__ == "__main__":
 
-    csv_fpath = "/home/ubuntu/text2vid-viewer/frontend/db.csv"
-    update_csv(csv_fpath)
+    parser = argparse.ArgumentParser(description="Refresh the frontend video catalog from S3")
+    parser.add_argument("--csv_fpath", type=str, default="/home/ubuntu/text2vid-viewer/frontend/db.csv", help="Path to the output db.csv")
+    parser.add_argument("--max_workers", type=int, default=16, help="Number of concurrent metadata requests")
+    parser.add_argument("--incremental", action="store_true", help="Only fetch metadata for new or changed objects")
+    parser.add_argument("--manifest_fpath", type=str, default="/home/ubuntu/text2vid-viewer/backend/db_manifest.json", help="Path to the listing manifest used by --incremental")
+    parser.add_argument("--use_model_manifests", action="store_true", help="Read each model's videos from the manifest written by s3_export")
+    args = parser.parse_args()
+
+    # Size the shared S3 connection pool to the number of concurrent requests
+    configure_s3_client(max_pool_connections=args.max_workers)
+
+    manifest_fpath = args.manifest_fpath if args.incremental else None
+    update_csv(args.csv_fpath, max_workers=args.max_workers, manifest_fpath=manifest_fpath, use_model_manifests=args.use_model_manifests)
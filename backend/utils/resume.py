@@ -0,0 +1,203 @@
+import csv
+import hashlib
+import json
+import os
+import re
+
+# Resume layer shared by the model runners (backend/models/*/inference.py).
+#
+# Videos are named after the fingerprint of their generation parameters (model, config,
+# prompt, seed, steps...), so a video keeps its identity when prompts.csv is edited or
+# reordered. When a runner has written a video, it saves a `<video>.done` marker next to
+# it with the parameters and their fingerprint; s3_export reads the prompt from it.
+# The upload watcher of s3_export treats the marker as "fully written" and records the
+# fingerprint in the model manifest (<model>/_manifest.json). Before spending GPU time on
+# a prompt, a runner checks both places and skips the prompt if a video generated with the
+# same parameters already exists, so an interrupted run restarts where it stopped.
+#
+# Only the standard library is required: the runners live in their own environments.
+# boto3 is optional; without it (or without credentials) only local outputs are checked.
+
+
+def generation_fingerprint(params):
+    """
+    :param params: JSON-serializable generation parameters.
+    :return: The SHA-256 of the parameters (independent of the key order).
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def output_file_name(params, extension=".mp4"):
+    """
+    :param params: Generation parameters of a video.
+    :return: The content-addressed file name of the video ("<fingerprint[:16]>.mp4").
+    """
+    return generation_fingerprint(params)[:16] + extension
+
+
+# Function to tell content-addressed videos (written by the runners with a `.done` marker) from legacy sample_<index>.mp4 ones
+def is_output_file_name(filename):
+    return re.fullmatch(r"[0-9a-f]{16}\.mp4", filename) is not None
+
+
+def done_marker_path(output_path):
+    return f"{output_path}.done"
+
+
+def read_done_marker(output_path):
+    """
+    :param output_path: Path to a generated video.
+    :return: The content of its `.done` marker ('params' and 'fingerprint'), or None if it has none.
+    """
+    try:
+        with open(done_marker_path(output_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def mark_done(output_path, params):
+    """
+    Record that a video was fully written with the given generation parameters.
+
+    :param output_path: Path to the generated video.
+    :param params: Generation parameters of the video.
+    """
+    marker_path = done_marker_path(output_path)
+    tmp_path = f"{marker_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "fingerprint": generation_fingerprint(params)}, f, indent=2, default=str)
+    os.replace(tmp_path, marker_path)
+
+
+# Function to remove the marker of a video about to be regenerated (the watcher would upload it half-written)
+def clear_done_marker(output_path):
+    try:
+        os.remove(done_marker_path(output_path))
+    except FileNotFoundError:
+        pass
+
+
+def unquote_prompt(prompt):
+    """
+    :param prompt: Prompt as read from prompts.txt (quoted CSV field) or prompts.csv.
+    :return: The prompt as in prompts.csv.
+    """
+    return next(csv.reader([prompt]), [prompt])[0] if prompt.startswith('"') else prompt
+
+
+def prompt_object_name(model, prompt):
+    """
+    :param model: Name of the model (S3 prefix).
+    :param prompt: Prompt as read from prompts.txt or prompts.csv.
+    :return: The S3 object name s3_export uploads the video of the prompt to.
+    """
+    return f"{model}/{unquote_prompt(prompt)}.mp4"
+
+
+def parse_shard(shard):
+    """
+    :param shard: Shard of the prompts, "<index>/<count>" with 0 <= index < count (e.g. "0/4"), or None.
+    :return: The (index, count) tuple, (0, 1) if `shard` is None.
+    """
+    if shard is None:
+        return 0, 1
+    try:
+        index, count = (int(value) for value in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard (expected <index>/<count>, e.g. 0/4): {shard}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard (expected 0 <= index < count): {shard}")
+    return index, count
+
+
+def shard_prompts(prompts, shard):
+    """
+    Select the prompts of a shard. Prompts are dealt round-robin, so shards differ by at most one prompt.
+
+    :param prompts: List of prompts.
+    :param shard: Shard of the prompts ("<index>/<count>"), or None for all of them.
+    :return: The prompts of the shard.
+    """
+    index, count = parse_shard(shard)
+    return prompts[index::count]
+
+
+class ResumeIndex:
+    """
+    Completed outputs of a model, found locally (`.done` markers) or in S3 (model manifest).
+    """
+
+    def __init__(self, model, bucket_name="text2videoviewer", check_s3=True):
+        """
+        :param model: Name of the model (S3 prefix).
+        :param bucket_name: Name of the S3 bucket.
+        :param check_s3: Also skip prompts whose video is only in S3.
+        """
+        self.model = model
+        self.bucket_name = bucket_name
+        self.check_s3 = check_s3
+        self._s3_fingerprints = None
+
+    def s3_fingerprints(self):
+        """
+        :return: Dict of object name -> fingerprint of the videos recorded in the model manifest
+            (read once; empty if S3 cannot be reached).
+        """
+        if self._s3_fingerprints is not None:
+            return self._s3_fingerprints
+
+        self._s3_fingerprints = {}
+        if not self.check_s3:
+            return self._s3_fingerprints
+
+        try:
+            from dotenv import load_dotenv
+            load_dotenv("/home/ubuntu/text2vid-viewer/.env")  # The runners do not inherit the AWS credentials
+        except ImportError:
+            pass
+
+        try:
+            import boto3
+            s3_client = boto3.client("s3", region_name=os.getenv("AWS_REGION", "us-east-1"),
+                                     endpoint_url=os.getenv("S3_ENDPOINT_URL") or None)
+            response = s3_client.get_object(Bucket=self.bucket_name, Key=f"{self.model}/_manifest.json")
+            manifest = json.loads(response["Body"].read())
+        except ImportError:
+            print("boto3 is not installed, only local outputs are checked for completed prompts.")
+            return self._s3_fingerprints
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return self._s3_fingerprints  # Nothing uploaded yet
+            print(f"Could not read the manifest of {self.model} in S3 ({e}), only local outputs are checked.")
+            return self._s3_fingerprints
+
+        for object_name, video in manifest.get("videos", {}).items():
+            if video.get("fingerprint"):
+                self._s3_fingerprints[object_name] = video["fingerprint"]
+        return self._s3_fingerprints
+
+    def find_completed(self, output_path, params):
+        """
+        :param output_path: Path the runner writes the video to.
+        :param params: Generation parameters of the video, including its 'prompt'.
+        :return: "local" or "s3" if a video generated with the same parameters exists, else None.
+        """
+        fingerprint = generation_fingerprint(params)
+
+        marker = read_done_marker(output_path)
+        if marker is not None and marker.get("fingerprint") == fingerprint and os.path.exists(output_path) \
+                and os.path.getsize(output_path) > 0:
+            return "local"
+
+        if self.s3_fingerprints().get(prompt_object_name(self.model, params["prompt"])) == fingerprint:
+            return "s3"
+
+        return None
+
+    def is_done(self, output_path, params):
+        completed = self.find_completed(output_path, params)
+        if completed is not None:
+            print(f"Skipping {os.path.basename(output_path)}: already generated with the same parameters ({completed}).")
+            return True
+        return False
@@ -0,0 +1,39 @@
+#!/bin/bash
+
+# Run inference for a single model (and export to S3)
+# Videos are uploaded by a watcher while the model is still generating.
+# Used by run_inference.sh and orchestrate.py; the GPUs the model runs on are set with CUDA_VISIBLE_DEVICES.
+# When SHARD (<index>/<count>) is set, only that shard of the prompts is generated and exported.
+
+MODEL="$1"
+PROMPT_CSV_PATH="/home/ubuntu/text2vid-viewer/prompts.csv"
+
+if [ -z "$MODEL" ] || [ ! -d "/home/ubuntu/text2vid-viewer/backend/models/$MODEL" ]; then
+    echo "Usage: run_model.sh MODEL"
+    echo "Available models: $(ls /home/ubuntu/text2vid-viewer/backend/models)"
+    exit 1
+fi
+
+echo "Running inference for model: $MODEL (GPUs: ${CUDA_VISIBLE_DEVICES:-all})"
+DEPLOY_SCRIPT="/home/ubuntu/text2vid-viewer/backend/models/$MODEL/deploy.sh"
+DATA_DIR="/home/ubuntu/data/$MODEL"
+STOP_FILE="$DATA_DIR/.inference_done"
+mkdir -p "$DATA_DIR"
+rm -f "$STOP_FILE"
+
+cd /home/ubuntu
+
+python /home/ubuntu/text2vid-viewer/backend/utils/s3_export.py --model "$MODEL" --prompt_csv "$PROMPT_CSV_PATH" --watch --stop_file "$STOP_FILE" ${SHARD:+--shard "$SHARD"} &
+EXPORT_PID=$!
+
+/bin/bash "${DEPLOY_SCRIPT}"
+DEPLOY_STATUS=$?
+
+# Signal the watcher that generation is over, then wait for the remaining uploads
+touch "$STOP_FILE"
+wait $EXPORT_PID || { echo "Failed to export videos to S3"; exit 1; }
+if [ $DEPLOY_STATUS -ne 0 ]; then
+    echo "Failed to run inference for model: $MODEL"
+    exit 1
+fi
+echo "Completed inference for model: $MODEL"
@@ -1,81 +1,498 @@
 import argparse
 import os
 import glob
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from s3_utils import upload_file_to_s3
+from hls import HLS_LADDER, make_hls_jobs, make_hls_renditions
+from mp4_faststart import prepare_faststart
+from previews import POSTER_FORMATS, make_preview_jobs, make_previews
+from resume import is_output_file_name, parse_shard, read_done_marker
+from s3_utils import (configure_s3_client, get_s3_json, get_s3_objects_info, make_transfer_config, model_manifest_name,
+                      put_s3_json, shard_manifest_name, summarize_uploads, upload_file_with_retries, upload_files_to_s3)
 from dotenv import load_dotenv
 
-if __name__ == "__main__":
 
-    load_dotenv("/home/ubuntu/text2vid-viewer/.env")
-     
-    # Parse `model` argument
-    parser = argparse.ArgumentParser(description="Send generated videos to S3")
-    parser.add_argument("--model", type=str, required=True, help="Name of the model configuration to use")
-    parser.add_argument("--prompt_csv", type=str, required=True, help="Path to the prompt csv file")
-    
-    args = parser.parse_args()
-    model = args.model
-    prompt_csv = args.prompt_csv
+def load_prompts(prompt_csv):
+    """
+    Read the prompt CSV.
 
-    # Read prompt CSV and create a mapping of prompt to base_prompt
+    :param prompt_csv: Path to a CSV file with 'prompt' and 'base_prompt' columns.
+    :return: The list of prompts and the list of matching base prompts.
+    """
     if not os.path.exists(prompt_csv):
         raise FileNotFoundError(f"Prompt CSV file not found: {prompt_csv}")
-    
+
     df = pd.read_csv(prompt_csv)  # Read CSV with header
     df['base_prompt'] = df['base_prompt'].fillna('')  # Fill NaN values in 'base_prompt' with empty string
-    # Assuming CSV contains 'prompt' and 'base_prompt' columns
-    prompts = df['prompt'].tolist()  # Get the 'prompt' column
-    base_prompts = df['base_prompt'].tolist()  # Get the 'base_prompt' column
-
-    print("prompts")
-    print(prompts)
-    print()
-    print("base_prompts")
-    print(base_prompts)
-    print()
-
-    # Export to S3
-    generated_files = glob.glob(os.path.join(f"/home/ubuntu/data/{model}", '*.mp4'))
-
-    print("generated_files")
-    print(generated_files)
-    print()
-    
-    for generated_file_path in generated_files:
+    return df['prompt'].tolist(), df['base_prompt'].tolist()
+
+
+def get_upload_job(generated_file_path, model, prompts, base_prompts, base_prompt_map):
+    """
+    Map a generated video to its S3 object name and metadata.
+
+    Videos are named after the fingerprint of their generation parameters and
+    their prompt and parameters are read from the `.done` marker the runner wrote
+    next to them (see resume.py). Files without a marker fall back to the legacy
+    `sample_<index>.mp4` naming, indexed like the prompts.
+
+    :param generated_file_path: Path to the generated video.
+    :param model: Name of the model that generated the video.
+    :param prompts: List of prompts.
+    :param base_prompts: List of base prompts matching `prompts`.
+    :param base_prompt_map: Dict of prompt -> base prompt, built once from `prompts` and `base_prompts`.
+    :return: An upload job dict, or None if the file cannot be mapped to a prompt.
+    """
+    filename = os.path.basename(generated_file_path)
+    marker = read_done_marker(generated_file_path)
+
+    if marker is not None and marker.get("params", {}).get("prompt"):
+        prompt = marker["params"]["prompt"]
+        base_prompt = base_prompt_map.get(prompt, "")
+        params = marker["params"]
+    else:
         # Extract the index from the file path (e.g., "sample_001.mp4" -> 001)
-        filename = os.path.basename(generated_file_path)
         index_str = filename.split('_')[-1].split('.mp4')[0]
-        
+
         try:
             index = int(index_str)  # Convert index string to int (index starts from 0)
         except ValueError:
             print(f"Error: Could not extract valid index from filename: {filename}")
-            continue
+            return None
 
         if index < 0 or index >= len(prompts):
             print(f"Error: Index {index} out of range for available prompts.")
-            continue
+            return None
 
         prompt = prompts[index]  # Retrieve the original prompt based on the index
         base_prompt = base_prompts[index]  # Retrieve the corresponding base_prompt
-        bucket_name = "text2videoviewer"
-        object_name = f"{model}/{prompt}.mp4"  # Corrected the object name
+        params = load_generation_params(generated_file_path)
 
-        metadata = {
+    return {
+        "file_name": generated_file_path,
+        "object_name": f"{model}/{prompt}.mp4",
+        "fingerprint": (marker or {}).get("fingerprint", ""),
+        "metadata": {
             "model": model,
             "prompt": prompt,
             "base_prompt": base_prompt  # Include base_prompt in the metadata
+        },
+        "params": params,
+    }
+
+
+def load_uploaded_fingerprints(bucket_name, model):
+    """
+    :param bucket_name: Name of the S3 bucket.
+    :param model: Name of the model.
+    :return: Dict of object name -> fingerprint of the videos recorded in the model manifest.
+    """
+    manifest = get_s3_json(bucket_name, model_manifest_name(model)) or {"videos": {}}
+    return {name: video.get("fingerprint", "") for name, video in manifest["videos"].items()}
+
+
+# Function to check whether the same video (same generation parameters) was already uploaded under the same name
+def is_uploaded(job, uploaded_fingerprints):
+    return bool(job.get("fingerprint")) and uploaded_fingerprints.get(job["object_name"]) == job["fingerprint"]
+
+
+def load_generation_params(generated_file_path):
+    """
+    Read the generation parameters saved next to a legacy video without `.done` marker (e.g. "sample_0.json").
+
+    :param generated_file_path: Path to the generated video.
+    :return: The parameters, or an empty dict if there is no sidecar file.
+    """
+    sidecar_path = os.path.splitext(generated_file_path)[0] + ".json"
+    if not os.path.exists(sidecar_path):
+        return {}
+
+    try:
+        with open(sidecar_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading generation parameters from {sidecar_path}: {e}")
+        return {}
+
+
+def update_model_manifest(bucket_name, model, jobs, manifest_name=None):
+    """
+    Record the uploaded videos in the model's manifest object.
+
+    Entries of videos uploaded by earlier runs are kept; entries of `jobs`
+    are added or replaced. refresh_db can then build the catalog of a model
+    from a single GET instead of one HEAD per video.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param model: Name of the model.
+    :param jobs: Upload jobs that were uploaded.
+    :param manifest_name: S3 object name of the manifest (default: the model manifest). Shards
+        of a sharded run each write their own manifest, merged afterwards by shard.py.
+    """
+    if not jobs and manifest_name is None:
+        return  # A shard manifest is written even if empty: it tells shard.py that the shard has finished
+
+    manifest_name = manifest_name or model_manifest_name(model)
+    manifest = get_s3_json(bucket_name, manifest_name) or {"model": model, "videos": {}}
+
+    # Posters, previews and HLS playlists are recorded with their video, only if they were uploaded too
+    uploaded_names = {job["object_name"] for job in jobs}
+    jobs = [job for job in jobs if "source" not in job]
+
+    info = get_s3_objects_info(bucket_name, [job["object_name"] for job in jobs])
+    for job, obj in zip(jobs, info):
+        if obj is None:
+            continue
+        manifest["videos"][job["object_name"]] = {
+            "object_name": job["object_name"],
+            "prompt": job["metadata"]["prompt"],
+            "base_prompt": job["metadata"]["base_prompt"],
+            "poster_name": job.get("poster_name") if job.get("poster_name") in uploaded_names else "",
+            "preview_name": job.get("preview_name") if job.get("preview_name") in uploaded_names else "",
+            "hls_name": job.get("hls_name") if job.get("hls_name") in uploaded_names else "",
+            "size": obj["Size"],
+            "etag": obj["ETag"],
+            "params": job.get("params", {}),
+            "fingerprint": job.get("fingerprint", ""),  # Used to skip prompts and uploads already done
+            "faststart": job.get("faststart"),
         }
 
-        print("SENDING TO S3")
-        print(f"prompt: {prompt}")
-        print(f"base_prompt: {base_prompt}")
-        print(f"bucket_name: {bucket_name}")
-        print(f"object_name: {object_name}")
-        print()
+    if put_s3_json(bucket_name, manifest_name, manifest) is not None:
+        print(f"Recorded {len(jobs)} videos in {manifest_name} ({len(manifest['videos'])} in total).")
+
+
+def find_completed_files(data_dir, sizes, settle_seconds, final=False):
+    """
+    Return the generated videos in `data_dir` that are fully written.
+
+    A file is complete once a `<file>.done` marker exists next to it. Legacy
+    `sample_<index>.mp4` files, written without marker, are also complete once
+    their size has not changed since the previous poll and they have not been
+    modified for `settle_seconds`. Content-addressed files are only complete with
+    their marker: they can be moved into `data_dir` (keeping an old mtime) before
+    the runner marks them done.
+
+    :param data_dir: Directory the model writes its videos to.
+    :param sizes: Dict of file path -> size seen at the previous poll (updated in place).
+    :param settle_seconds: Minimum age of the last modification of a complete file.
+    :param final: Generation has finished, so every non-empty file is complete.
+    :return: List of (file path, size, mtime) tuples.
+    """
+    completed = []
+    now = time.time()
+
+    for path in glob.glob(os.path.join(data_dir, '*.mp4')):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue  # Removed between listing and stat
+
+        previous_size = sizes.get(path)
+        sizes[path] = stat.st_size
+
+        if stat.st_size == 0:
+            continue
+
+        if os.path.exists(f"{path}.done"):
+            completed.append((path, stat.st_size, stat.st_mtime))
+            continue
+        if is_output_file_name(os.path.basename(path)):
+            continue  # Not marked done yet (or interrupted before)
+
+        stable = previous_size == stat.st_size and now - stat.st_mtime >= settle_seconds
+        if final or stable:
+            completed.append((path, stat.st_size, stat.st_mtime))
+
+    return completed
+
+
+def find_latest_outputs(data_dir, markers):
+    """
+    Find the most recently generated video of each prompt, among the videos with a `.done` marker.
+
+    A data directory can hold several videos of a prompt (one per OpenSora config of a
+    `--model all` run, or videos of earlier runs with other generation parameters). They
+    all map to the same S3 object, so only the latest one is exported; uploading each of
+    them would leave a random one in S3 and change the manifest fingerprint on every run.
+
+    :param data_dir: Directory the model writes its videos to.
+    :param markers: Dict of marker path -> (mtime, prompt) read at the previous scans (updated in place).
+    :return: Dict of prompt -> path of its latest video.
+    """
+    latest = {}
+    for marker_path in glob.glob(os.path.join(data_dir, '*.mp4.done')):
+        try:
+            mtime = os.stat(marker_path).st_mtime
+        except FileNotFoundError:
+            continue  # Cleared before a regeneration
+
+        video_path = marker_path[:-len(".done")]
+        if markers.get(marker_path, (None, None))[0] != mtime:
+            marker = read_done_marker(video_path) or {}
+            markers[marker_path] = (mtime, (marker.get("params") or {}).get("prompt"))
+
+        _, prompt = markers[marker_path]
+        if prompt and (prompt not in latest or (mtime, video_path) > latest[prompt]):
+            latest[prompt] = (mtime, video_path)
+
+    return {prompt: video_path for prompt, (_, video_path) in latest.items()}
+
+
+# Function to check whether a newer video of the same prompt supersedes the video of a job
+def is_superseded(job, latest_outputs):
+    if not job.get("fingerprint"):
+        return False  # Legacy file without marker
+    return latest_outputs.get(job["metadata"]["prompt"], job["file_name"]) != job["file_name"]
+
+
+def summarize_faststart(jobs):
+    """
+    Print how many videos had to be remuxed to faststart and the bytes players now need before the first frame.
+
+    :param jobs: Upload jobs checked by `mp4_faststart.prepare_faststart`.
+    """
+    stats = [job["faststart"] for job in jobs if job.get("faststart")]
+    if not stats:
+        return
+
+    remuxed = [s for s in stats if s["remuxed"]]
+    print(f"Checked the mp4 layout of {len(stats)} videos: {len(remuxed)} remuxed to faststart.")
+    if remuxed:
+        before = sum(s["startup_bytes_before"] for s in remuxed)
+        after = sum(s["startup_bytes"] for s in remuxed)
+        print(f"Bytes before the first frame of the remuxed videos: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB.")
+
+
+def export_video(job, bucket_name, transfer_config=None, max_retries=3, preview_options=None, hls_options=None,
+                 faststart_dir=None):
+    """
+    Make a video faststart and upload it, then generate and upload its poster, preview and HLS renditions.
+
+    :param job: Upload job of the video.
+    :param bucket_name: Name of the S3 bucket.
+    :param transfer_config: Optional TransferConfig applied to every file.
+    :param max_retries: Number of attempts per file.
+    :param preview_options: Keyword arguments of `previews.make_preview_jobs`, or None to skip previews.
+    :param hls_options: Keyword arguments of `hls.make_hls_jobs`, or None to skip HLS renditions.
+    :param faststart_dir: Directory of the videos remuxed to faststart, or None to upload videos as they are.
+    :return: List of (job, uploaded) tuples, the video first.
+    """
+    if faststart_dir is not None:
+        prepare_faststart(job, faststart_dir)
+
+    results = [(job, upload_file_with_retries(job, bucket_name, transfer_config, max_retries))]
+    if not results[0][1]:
+        return results
+
+    derived_jobs = []
+    if preview_options is not None:
+        derived_jobs += make_preview_jobs(job, **preview_options)
+    if hls_options is not None:
+        derived_jobs += make_hls_jobs(job, **hls_options)
+
+    for derived_job in derived_jobs:
+        results.append((derived_job, upload_file_with_retries(derived_job, bucket_name, transfer_config, max_retries)))
+
+    return results
+
+
+def watch_and_upload(data_dir, model, prompts, base_prompts, bucket_name, stop_file,
+                     max_workers=4, transfer_config=None, max_retries=3, poll_interval=5, settle_seconds=10,
+                     preview_options=None, hls_options=None, faststart_dir=None, uploaded_fingerprints=None):
+    """
+    Upload videos as soon as they are fully written, while the model is still generating.
+
+    Watching stops once `stop_file` exists. A last scan then uploads every
+    remaining file, since the generator is no longer writing.
+
+    :param data_dir: Directory the model writes its videos to.
+    :param model: Name of the model.
+    :param prompts: List of prompts, indexed like the generated files.
+    :param base_prompts: List of base prompts matching `prompts`.
+    :param bucket_name: Name of the S3 bucket.
+    :param stop_file: Path of the file created when generation has finished.
+    :param max_workers: Number of files uploaded at the same time.
+    :param transfer_config: Optional TransferConfig applied to every file.
+    :param max_retries: Number of attempts per file.
+    :param poll_interval: Seconds between two scans of `data_dir`.
+    :param settle_seconds: Minimum age of the last modification of a complete file.
+    :param preview_options: Keyword arguments of `previews.make_preview_jobs`, or None to skip previews.
+    :param hls_options: Keyword arguments of `hls.make_hls_jobs`, or None to skip HLS renditions.
+    :param faststart_dir: Directory of the videos remuxed to faststart, or None to upload videos as they are.
+    :param uploaded_fingerprints: Dict of object name -> fingerprint of the videos already uploaded
+        (see `load_uploaded_fingerprints`); they are not uploaded again.
+    :return: A dict with the 'uploaded' and 'failed' jobs, total 'bytes' and 'seconds'.
+    """
+    uploaded_fingerprints = uploaded_fingerprints or {}
+    base_prompt_map = dict(zip(prompts, base_prompts))
+    sizes = {}
+    markers = {}
+    submitted = {}  # file path -> (size, mtime) of the version that was submitted
+    futures = []
+    start = time.perf_counter()
+
+    print(f"Watching {data_dir} for generated videos (stop file: {stop_file}).")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            finished = os.path.exists(stop_file)
+            completed = find_completed_files(data_dir, sizes, settle_seconds, final=finished)
+            latest_outputs = find_latest_outputs(data_dir, markers)
+
+            for path, size, mtime in completed:
+                if submitted.get(path) == (size, mtime):
+                    continue  # This version was already uploaded
+
+                job = get_upload_job(path, model, prompts, base_prompts, base_prompt_map)
+                if job is None and not os.path.basename(path).startswith("sample_"):
+                    continue  # Its marker may still come: look at it again at the next poll
+                if job is None or is_uploaded(job, uploaded_fingerprints) or is_superseded(job, latest_outputs):
+                    submitted[path] = (size, mtime)
+                    continue
+
+                print(f"Uploading {os.path.basename(path)}.")
+                submitted[path] = (size, mtime)
+                futures.append(executor.submit(export_video, job, bucket_name, transfer_config, max_retries, preview_options, hls_options, faststart_dir))
+
+            if finished:
+                break
+            time.sleep(poll_interval)
+
+    results = [result for future in futures for result in future.result()]
+    summarize_faststart([job for job, _ in results])
+    uploaded = [job for job, ok in results if ok]
+    failed = [job for job, ok in results if not ok]
+
+    return summarize_uploads(uploaded, failed, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+
+    load_dotenv("/home/ubuntu/text2vid-viewer/.env")
+
+    # Parse `model` argument
+    parser = argparse.ArgumentParser(description="Send generated videos to S3")
+    parser.add_argument("--model", type=str, required=True, help="Name of the model configuration to use")
+    parser.add_argument("--prompt_csv", type=str, required=True, help="Path to the prompt csv file")
+    parser.add_argument("--bucket_name", type=str, default="text2videoviewer", help="Name of the S3 bucket")
+    parser.add_argument("--max_workers", type=int, default=4, help="Number of files uploaded at the same time")
+    parser.add_argument("--max_concurrency", type=int, default=8, help="Number of parts of one file uploaded in parallel")
+    parser.add_argument("--multipart_threshold_mb", type=int, default=16, help="Files larger than this are uploaded in parts")
+    parser.add_argument("--multipart_chunksize_mb", type=int, default=16, help="Size of each multipart part")
+    parser.add_argument("--max_retries", type=int, default=3, help="Number of upload attempts per file")
+    parser.add_argument("--data_dir", type=str, default=None, help="Directory of the generated videos (default: /home/ubuntu/data/<model>)")
+    parser.add_argument("--watch", action="store_true", help="Upload videos as they are generated, until --stop_file exists")
+    parser.add_argument("--stop_file", type=str, default=None, help="File created when generation has finished (default: <data_dir>/.inference_done)")
+    parser.add_argument("--poll_interval", type=float, default=5, help="Seconds between two scans of the data directory in --watch mode")
+    parser.add_argument("--settle_seconds", type=float, default=10, help="A file unchanged for this long is considered fully written")
+    parser.add_argument("--skip_faststart", action="store_true", help="Upload videos as they are, without moving their moov box to the front")
+    parser.add_argument("--faststart_dir", type=str, default=None, help="Directory of the videos remuxed to faststart (default: <data_dir>/faststart)")
+    parser.add_argument("--previews", action="store_true", help="Also upload a poster frame and a small looping preview of each video")
+    parser.add_argument("--preview_dir", type=str, default=None, help="Directory of the generated posters and previews (default: <data_dir>/previews)")
+    parser.add_argument("--poster_format", type=str, default="jpg", choices=POSTER_FORMATS, help="Image format of the posters")
+    parser.add_argument("--poster_width", type=int, default=480, help="Width of the posters")
+    parser.add_argument("--preview_width", type=int, default=320, help="Width of the previews")
+    parser.add_argument("--hls", action="store_true", help="Also upload an HLS rendition ladder of each video for adaptive streaming")
+    parser.add_argument("--hls_dir", type=str, default=None, help="Directory of the generated HLS renditions (default: <data_dir>/hls)")
+    parser.add_argument("--hls_segment_seconds", type=int, default=2, help="Duration of an HLS segment")
+    parser.add_argument("--reupload", action="store_true", help="Upload videos that are already in the model manifest with the same generation parameters")
+    parser.add_argument("--shard", type=str, default=None, help="Shard of the prompts generated on this node, <index>/<count> (e.g. 0/4); uploads are recorded in a shard manifest")
+
+    args = parser.parse_args()
+    model = args.model
+    shard_index, shard_count = parse_shard(args.shard)
+
+    # Read prompt CSV and create a mapping of prompt to base_prompt
+    prompts, base_prompts = load_prompts(args.prompt_csv)
+
+    # Every file can have up to max_concurrency parts in flight
+    configure_s3_client(max_pool_connections=args.max_workers * args.max_concurrency)
+    transfer_config = make_transfer_config(
+        multipart_threshold_mb=args.multipart_threshold_mb,
+        multipart_chunksize_mb=args.multipart_chunksize_mb,
+        max_concurrency=args.max_concurrency,
+    )
+
+    data_dir = args.data_dir or f"/home/ubuntu/data/{model}"
+
+    faststart_dir = None if args.skip_faststart else args.faststart_dir or os.path.join(data_dir, "faststart")
+
+    if args.previews:
+        preview_options = {
+            "output_dir": args.preview_dir or os.path.join(data_dir, "previews"),
+            "poster_format": args.poster_format,
+            "poster_width": args.poster_width,
+            "preview_width": args.preview_width,
+        }
+    else:
+        preview_options = None
+
+    if args.hls:
+        hls_options = {
+            "output_dir": args.hls_dir or os.path.join(data_dir, "hls"),
+            "ladder": HLS_LADDER,
+            "segment_seconds": args.hls_segment_seconds,
+        }
+    else:
+        hls_options = None
+
+    # Videos generated with the same parameters as an uploaded one are skipped
+    uploaded_fingerprints = {} if args.reupload else load_uploaded_fingerprints(args.bucket_name, model)
+
+    if args.watch:
+        stop_file = args.stop_file or os.path.join(data_dir, ".inference_done")
+        os.makedirs(data_dir, exist_ok=True)
+        results = watch_and_upload(
+            data_dir, model, prompts, base_prompts, args.bucket_name, stop_file,
+            max_workers=args.max_workers,
+            transfer_config=transfer_config,
+            max_retries=args.max_retries,
+            poll_interval=args.poll_interval,
+            settle_seconds=args.settle_seconds,
+            preview_options=preview_options,
+            hls_options=hls_options,
+            faststart_dir=faststart_dir,
+            uploaded_fingerprints=uploaded_fingerprints,
+        )
+    else:
+        # Export to S3
+        generated_files = glob.glob(os.path.join(data_dir, '*.mp4'))
+        print(f"Found {len(generated_files)} generated files for model {model}.")
+
+        base_prompt_map = dict(zip(prompts, base_prompts))
+        jobs = [get_upload_job(path, model, prompts, base_prompts, base_prompt_map) for path in generated_files]
+        jobs = [job for job in jobs if job is not None]
+        latest_outputs = find_latest_outputs(data_dir, {})
+        superseded = [job for job in jobs if is_superseded(job, latest_outputs)]
+        if superseded:
+            print(f"Skipping {len(superseded)} videos superseded by a more recent video of the same prompt.")
+            jobs = [job for job in jobs if not is_superseded(job, latest_outputs)]
+        skipped = [job for job in jobs if is_uploaded(job, uploaded_fingerprints)]
+        if skipped:
+            print(f"Skipping {len(skipped)} videos already uploaded with the same generation parameters.")
+            jobs = [job for job in jobs if not is_uploaded(job, uploaded_fingerprints)]
+
+        if faststart_dir is not None:
+            for job in jobs:
+                prepare_faststart(job, faststart_dir)
+            summarize_faststart(jobs)
+
+        videos = list(jobs)
+        if preview_options is not None:
+            jobs += make_previews(videos, max_workers=args.max_workers, **preview_options)
+        if hls_options is not None:
+            jobs += make_hls_renditions(videos, max_workers=args.max_workers, **hls_options)
 
+        results = upload_files_to_s3(
+            jobs,
+            args.bucket_name,
+            max_workers=args.max_workers,
+            transfer_config=transfer_config,
+            max_retries=args.max_retries,
+        )
 
-        response = upload_file_to_s3(generated_file_path, bucket_name, object_name, metadata)
-        if response is None:
-            print(f"File upload failed for {generated_file_path}.")
+    # Shards run concurrently on several nodes: each one writes its own manifest, merged by shard.py
+    manifest_name = shard_manifest_name(model, shard_index, shard_count) if args.shard else None
+    update_model_manifest(args.bucket_name, model, results["uploaded"], manifest_name=manifest_name)
@@ -1,29 +1,93 @@
-import pandas as pd
-import csv
 import boto3
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+import json
+import mimetypes
 import os
+import queue
+import threading
+import time
+
+# Settings of the shared S3 client. Defaults can be overridden through the environment
+# (S3_MAX_POOL_CONNECTIONS, S3_MAX_ATTEMPTS, AWS_REGION, S3_ENDPOINT_URL) or with
+# `configure_s3_client` before the first S3 call.
+_s3_client_settings = {
+    "max_pool_connections": int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32)),
+    "max_attempts": int(os.getenv("S3_MAX_ATTEMPTS", 10)),
+    "region_name": os.getenv("AWS_REGION", "us-east-1"),
+    "endpoint_url": os.getenv("S3_ENDPOINT_URL") or None,
+}
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def configure_s3_client(**settings):
+    """
+    Update the settings of the shared S3 client. The client is rebuilt on next use.
+
+    :param settings: Any of max_pool_connections, max_attempts, region_name, endpoint_url.
+    """
+    global _s3_client
+
+    unknown = set(settings) - set(_s3_client_settings)
+    if unknown:
+        raise ValueError(f"Unknown S3 client settings: {', '.join(sorted(unknown))}")
+
+    with _s3_client_lock:
+        _s3_client_settings.update(settings)
+        _s3_client = None
+
+
+def get_s3_client():
+    """
+    Return the shared S3 client, creating it on first use.
 
-def upload_file_to_s3(file_name, bucket_name, object_name, metadata={}):
+    The client is thread-safe and keeps a pool of connections alive, so every
+    helper in this module reuses the same credentials and TLS connections.
+    Retries use botocore's adaptive mode, which also rate-limits the client
+    when S3 starts throttling.
+
+    :return: A boto3 S3 client.
+    """
+    global _s3_client
+
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                config = Config(
+                    max_pool_connections=_s3_client_settings["max_pool_connections"],
+                    retries={"mode": "adaptive", "max_attempts": _s3_client_settings["max_attempts"]},
+                )
+                _s3_client = boto3.client('s3',
+                    region_name=_s3_client_settings["region_name"],
+                    endpoint_url=_s3_client_settings["endpoint_url"],
+                    config=config)
+    return _s3_client
+
+
+def upload_file_to_s3(file_name, bucket_name, object_name, metadata={}, transfer_config=None):
     """
     Uploads a file to an S3 bucket.
 
     :param file_name: Path to the file to upload.
     :param bucket_name: Name of the S3 bucket.
     :param object_name: S3 object name. If not specified, file_name is used.
+    :param transfer_config: Optional boto3 TransferConfig (multipart threshold, part size, concurrency).
     :return: The S3 object name if the file was uploaded successfully, else None.
     """
 
-    # Create an S3 client
-    s3_client = boto3.client('s3',
-        region_name='us-east-1',
-        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"])
+    s3_client = get_s3_client()
 
     try:
         # Upload the file
-        s3_client.upload_file(file_name, bucket_name, object_name, ExtraArgs={'Metadata': metadata})
+        extra_args = {'Metadata': metadata}
+        content_type = mimetypes.guess_type(object_name)[0]
+        if content_type is not None:
+            extra_args['ContentType'] = content_type  # So browsers and CloudFront get e.g. video/mp4, image/jpeg
+        s3_client.upload_file(file_name, bucket_name, object_name, ExtraArgs=extra_args, Config=transfer_config)
         print(f"File {file_name} uploaded to {bucket_name}/{object_name}.")
         return object_name
     except FileNotFoundError:
@@ -40,37 +104,166 @@ def upload_file_to_s3(file_name, bucket_name, object_name, metadata={}):
         return None
 
 
-def list_s3_bucket_items(bucket_name):
+def make_transfer_config(multipart_threshold_mb=16, multipart_chunksize_mb=16, max_concurrency=8):
     """
-    List all items in an S3 bucket.
+    Build the TransferConfig used for uploads.
+
+    :param multipart_threshold_mb: Files larger than this are uploaded in parts.
+    :param multipart_chunksize_mb: Size of each part.
+    :param max_concurrency: Number of parts of one file uploaded in parallel.
+    :return: A boto3 TransferConfig.
+    """
+    return TransferConfig(
+        multipart_threshold=multipart_threshold_mb * 1024 * 1024,
+        multipart_chunksize=multipart_chunksize_mb * 1024 * 1024,
+        max_concurrency=max_concurrency,
+        use_threads=True,
+    )
+
+
+def upload_file_with_retries(job, bucket_name, transfer_config=None, max_retries=3):
+    """
+    Upload one job, retrying with exponential backoff.
 
+    :param job: Dict with 'file_name', 'object_name' and 'metadata'.
     :param bucket_name: Name of the S3 bucket.
-    :return: A list of object keys in the bucket.
+    :param transfer_config: Optional TransferConfig.
+    :param max_retries: Number of attempts.
+    :return: True if the file was uploaded, else False.
+    """
+    for attempt in range(max_retries):
+        if upload_file_to_s3(job['file_name'], bucket_name, job['object_name'], job['metadata'], transfer_config) is not None:
+            return True
+        if attempt < max_retries - 1:
+            time.sleep(2 ** attempt)
+
+    print(f"File upload failed for {job['file_name']} after {max_retries} attempts.")
+    return False
+
+
+def summarize_uploads(uploaded, failed, seconds):
+    """
+    Print and return aggregate statistics of a batch of uploads.
+
+    :param uploaded: Jobs that were uploaded.
+    :param failed: Jobs that failed.
+    :param seconds: Wall time of the batch.
+    :return: A dict with the 'uploaded' and 'failed' jobs, total 'bytes' and 'seconds'.
+    """
+    total_bytes = sum(os.path.getsize(job['file_name']) for job in uploaded)
+
+    rate = total_bytes / seconds if seconds > 0 else 0
+    print(f"Uploaded {len(uploaded)} files ({total_bytes / 1e6:.1f} MB) in {seconds:.1f}s, {rate / 1e6:.1f} MB/s.")
+    if failed:
+        print(f"{len(failed)} files failed to upload.")
+
+    return {"uploaded": uploaded, "failed": failed, "bytes": total_bytes, "seconds": seconds}
+
+
+def upload_files_to_s3(jobs, bucket_name, max_workers=4, transfer_config=None, max_retries=3):
+    """
+    Upload many files concurrently.
+
+    Each job is retried on its own with exponential backoff, so a failing file
+    never holds up the rest of the batch.
+
+    :param jobs: List of dicts with 'file_name', 'object_name' and 'metadata'.
+    :param bucket_name: Name of the S3 bucket.
+    :param max_workers: Number of files uploaded at the same time.
+    :param transfer_config: Optional TransferConfig applied to every file.
+    :param max_retries: Number of attempts per file.
+    :return: A dict with the 'uploaded' and 'failed' jobs, total 'bytes' and 'seconds'.
+    """
+    uploaded, failed = [], []
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(upload_file_with_retries, job, bucket_name, transfer_config, max_retries): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            (uploaded if future.result() else failed).append(job)
+
+    return summarize_uploads(uploaded, failed, time.perf_counter() - start)
+
+
+def iter_s3_bucket_objects(bucket_name, prefixes=None):
     """
-    # Create an S3 client
-    s3_client = boto3.client('s3',
-        region_name='us-east-1',
-        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"])
+    Yield the objects of an S3 bucket as listing pages arrive.
 
-    # List to store all object keys
-    object_keys = []
+    One paginator runs per prefix, all at the same time, so listing a few model
+    prefixes never pages through unrelated objects and the caller can start
+    processing keys before the listing is complete. Objects of different
+    prefixes are interleaved in arrival order.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param prefixes: Key prefixes to list (e.g. ["cog/", "mochi/"]). None lists the whole bucket.
+    :return: A generator of dicts with 'Key', 'ETag', 'LastModified' (ISO 8601) and 'Size'.
+    """
+    s3_client = get_s3_client()
+    prefixes = [""] if not prefixes else list(prefixes)
+    pages = queue.Queue()
+    done = object()  # Marks the end of one prefix
+    stop = threading.Event()
+
+    def list_prefix(prefix):
+        try:
+            paginator = s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                if stop.is_set():
+                    break
+                pages.put(page.get('Contents', []))
+        except Exception as e:
+            print(f"An error occurred while listing prefix '{prefix}': {e}")
+        finally:
+            pages.put(done)
+
+    executor = ThreadPoolExecutor(max_workers=len(prefixes))
+    for prefix in prefixes:
+        executor.submit(list_prefix, prefix)
 
     try:
-        # Pagination to handle large number of objects
-        paginator = s3_client.get_paginator('list_objects_v2')
-        pages = paginator.paginate(Bucket=bucket_name)
+        remaining = len(prefixes)
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+                continue
+            for obj in page:
+                yield {
+                    'Key': obj['Key'],
+                    'ETag': obj['ETag'],
+                    'LastModified': obj['LastModified'].isoformat(),
+                    'Size': obj['Size'],
+                }
+    finally:
+        # Let the paginators wind down if the caller stops early
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def list_s3_bucket_objects(bucket_name, prefixes=None):
+    """
+    List all objects in an S3 bucket along with their ETag and LastModified.
 
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    object_keys.append(obj['Key'])
-                    #print(obj['Key'])  # Print each object's key
+    :param bucket_name: Name of the S3 bucket.
+    :param prefixes: Key prefixes to list. None lists the whole bucket.
+    :return: A list of dicts with 'Key', 'ETag', 'LastModified' (ISO 8601) and 'Size'.
+    """
+    return list(iter_s3_bucket_objects(bucket_name, prefixes))
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
 
-    return object_keys
+def list_s3_bucket_items(bucket_name, prefixes=None):
+    """
+    List all items in an S3 bucket.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param prefixes: Key prefixes to list. None lists the whole bucket.
+    :return: A list of object keys in the bucket.
+    """
+    return [obj['Key'] for obj in iter_s3_bucket_objects(bucket_name, prefixes)]
 
 # import re
 # def make_safe_filename(s: str) -> str:
@@ -128,8 +321,7 @@ def list_s3_bucket_items(bucket_name):
 
 
 def get_s3_object_metadata(bucket_name, object_name):
-    # Initialize S3 client
-    s3_client = boto3.client('s3')
+    s3_client = get_s3_client()
     
     try:
         # Get the object's metadata
@@ -143,6 +335,145 @@ def get_s3_object_metadata(bucket_name, object_name):
         return {}
 
 
+def get_s3_objects_info(bucket_name, object_names, max_workers=16, progress=None):
+    """
+    HEAD many objects concurrently.
+
+    All requests share the pooled S3 client, so TLS connections are reused
+    across HEAD calls. Keep `max_workers` at or below `max_pool_connections`.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_names: Iterable of object keys.
+    :param max_workers: Maximum number of HEAD requests in flight.
+    :param progress: Optional callable invoked once per completed object.
+    :return: A list of dicts with 'ETag', 'Size' and 'Metadata' (None for objects
+        that could not be read), in the same order as `object_names`.
+    """
+    object_names = list(object_names)
+    s3_client = get_s3_client()
+
+    def fetch(object_name):
+        try:
+            response = s3_client.head_object(Bucket=bucket_name, Key=object_name)
+            return {
+                "ETag": response["ETag"],
+                "Size": response["ContentLength"],
+                "Metadata": response.get("Metadata", {}),
+            }
+        except Exception as e:
+            print(f"Error retrieving metadata for object {object_name} in bucket {bucket_name}: {str(e)}")
+            return None
+        finally:
+            if progress is not None:
+                progress()
+
+    # executor.map yields results in input order regardless of completion order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fetch, object_names))
+
+
+def get_s3_objects_metadata(bucket_name, object_names, max_workers=16, progress=None):
+    """
+    Fetch the metadata of many objects concurrently.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_names: Iterable of object keys.
+    :param max_workers: Maximum number of HEAD requests in flight.
+    :param progress: Optional callable invoked once per completed object.
+    :return: A list of metadata dicts, in the same order as `object_names`.
+    """
+    info = get_s3_objects_info(bucket_name, object_names, max_workers=max_workers, progress=progress)
+    return [{} if obj is None else obj["Metadata"] for obj in info]
+
+
+def get_s3_json(bucket_name, object_name):
+    """
+    Read a JSON object.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_name: S3 object name.
+    :return: The decoded JSON, or None if the object does not exist or cannot be read.
+    """
+    s3_client = get_s3_client()
+
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_name)
+        return json.loads(response["Body"].read())
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    except Exception as e:
+        print(f"Error reading {object_name} in bucket {bucket_name}: {str(e)}")
+        return None
+
+
+def put_s3_json(bucket_name, object_name, data):
+    """
+    Write a JSON object.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param object_name: S3 object name.
+    :param data: JSON-serializable data.
+    :return: The S3 object name if the object was written, else None.
+    """
+    s3_client = get_s3_client()
+
+    try:
+        s3_client.put_object(Bucket=bucket_name, Key=object_name, Body=json.dumps(data).encode("utf-8"),
+                             ContentType="application/json")
+        return object_name
+    except Exception as e:
+        print(f"Error writing {object_name} in bucket {bucket_name}: {str(e)}")
+        return None
+
+
+def model_manifest_name(model):
+    """
+    Name of the per-model manifest written by s3_export.
+
+    The manifest maps every video object of the model to its prompt,
+    base_prompt, size, ETag and generation parameters.
+
+    :param model: Name of the model (S3 prefix).
+    :return: The S3 object name of the manifest.
+    """
+    return f"{model}/_manifest.json"
+
+
+def shard_manifest_name(model, index, count):
+    """
+    Name of the manifest written by s3_export for one shard of the prompts (`--shard`).
+    Shard manifests are merged into the model manifest by shard.py.
+
+    :param model: Name of the model (S3 prefix).
+    :param index: Index of the shard.
+    :param count: Number of shards.
+    :return: The S3 object name of the shard manifest.
+    """
+    return f"{model}/_manifest.shard-{index}-of-{count}.json"
+
+
+def parse_object_name(obj):
+    """
+    Split a video object name of the form "<model>/<prompt>.mp4" into model and prompt.
+
+    :param obj: S3 object name.
+    :return: A (model, prompt) tuple, or None if the object is not a video.
+    """
+    # Split the object name into model and prompt using the provided pattern
+    parts = obj.rsplit("/", 1)
+    if len(parts) != 2:
+        return None  # Skip if the object name doesn't match the expected pattern
+
+    model = parts[0]  # model is before the "/"
+    prompt_with_extension = parts[1]  # prompt with the ".mp4" extension
+
+    # Remove the file extension (.mp4) to extract the prompt
+    if not prompt_with_extension.endswith(".mp4"):
+        return None  # Skip if the object name doesn't end with .mp4
+
+    return model, prompt_with_extension[:-4]  # Remove the ".mp4" extension
+
+
 def clean_prompt(prompt):
     """
     Cleans up the prompt by stripping leading/trailing newlines or quotation marks.
@@ -157,116 +488,48 @@ def clean_prompt(prompt):
     prompt = prompt.replace("'", "")
     return prompt.strip().strip('"').strip("'")
 
-def rename_s3_objects(bucket_name):
+def copy_s3_object(bucket_name, source_key, target_key):
     """
-    Renames all objects in the specified S3 bucket to ensure the 'prompt' part 
-    of the key does not contain trailing or leading newline characters or 
-    quotation marks.
-    
+    Copy an object server-side, keeping its metadata.
+
     :param bucket_name: Name of the S3 bucket.
+    :param source_key: Key of the object to copy.
+    :param target_key: Key of the copy.
+    :return: True if the object was copied, else False.
     """
+    s3_client = get_s3_client()
 
-    # Initialize S3 client
-    s3_client = boto3.client('s3',
-        region_name='us-east-1',
-        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"])
-
-    # List all objects in the bucket
-    response = s3_client.list_objects_v2(Bucket=bucket_name)
-    
-    if 'Contents' not in response:
-        print(f"No objects found in bucket {bucket_name}.")
-        return
-
-    for obj in response['Contents']:
-        old_key = obj['Key']
-        
-        # Assuming object keys follow the format <bucket-name>/<model-name>/prompt
-        parts = old_key.split('/')
-        if len(parts) < 2:
-            print(f"Skipping object with key: {old_key}. Invalid format.")
-            continue
-        
-        # Clean the prompt part of the key
-        model_name = parts[0]
-        prompt = parts[1]
-        cleaned_prompt = clean_prompt(prompt)
-        
-        if cleaned_prompt != prompt:
-            # Create the new object key
-            new_key = f"{model_name}/{cleaned_prompt}"
-            
-            # Copy the object to the new key
-            #s3_client.copy_object(Bucket=bucket_name, CopySource={'Bucket': bucket_name, 'Key': old_key}, Key=new_key)
-            
-            # Check if new key exists
-            response = s3_client.list_objects_v2(Bucket=bucket_name)
-            if new_key in [obj['Key'] for obj in response['Contents']]:
-                s3_client.delete_object(Bucket=bucket_name, Key=old_key)
-
-            else:
-                print(f"Need to rename {old_key} to {new_key}.")
-                response = input(f"ok? (y/n): ", default='y')
-            
-            #print(f"Renamed {old_key} to {new_key}.")
-        else:
-            print(f"No renaming needed for {old_key}.")
-
+    try:
+        s3_client.copy_object(Bucket=bucket_name, CopySource={'Bucket': bucket_name, 'Key': source_key}, Key=target_key)
+        return True
+    except Exception as e:
+        print(f"Error copying {source_key} to {target_key}: {e}")
+        return False
 
 
-def list_model_prompts_in_s3(bucket_name, model_name):
+def delete_s3_objects(bucket_name, object_names, batch_size=1000):
     """
-    List all prompts for a specific model in the S3 bucket.
+    Delete objects with batched DeleteObjects requests.
 
     :param bucket_name: Name of the S3 bucket.
-    :param model_name: Name of the model to filter objects by.
-    :return: A list of prompts for the model.
+    :param object_names: List of object keys to delete.
+    :param batch_size: Keys per request (S3 accepts at most 1000).
+    :return: A generator yielding the list of deleted keys after each batch.
     """
-    s3_client = boto3.client('s3',
-        region_name='us-east-1',
-        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"])
-
-    # List to store the prompts
-    prompts = []
-
-    # List all objects in the bucket
-    paginator = s3_client.get_paginator('list_objects_v2')
-    pages = paginator.paginate(Bucket=bucket_name, Prefix=model_name)
-
-    for page in pages:
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                prompt = obj['Key'].split("/")[1].split(".")[0]
-                prompt = prompt.strip().strip('"').strip("'").strip('\n')
-                prompts.append(prompt)
-
-    return prompts
+    s3_client = get_s3_client()
+
+    for i in range(0, len(object_names), batch_size):
+        batch = object_names[i:i + batch_size]
+        try:
+            response = s3_client.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': False},
+            )
+        except Exception as e:
+            print(f"Error deleting a batch of {len(batch)} objects: {e}")
+            yield []
+            continue
 
-def compare_prompts(bucket_name, model_a, model_b):
-    """
-    Compares the prompts in two models and returns the differences.
-    
-    :param bucket_name: S3 bucket name.
-    :param model_a: Name of the first model.
-    :param model_b: Name of the second model.
-    :return: Two lists of prompts. One not in Model A and one not in Model B.
-    """
-    # Get prompts from both models
-    prompts_a = set(list_model_prompts_in_s3(bucket_name, model_a))
-    prompts_b = set(list_model_prompts_in_s3(bucket_name, model_b))
-
-    # Find prompts that are not in each model
-    prompts_not_in_a = list(prompts_b - prompts_a)
-    prompts_not_in_b = list(prompts_a - prompts_b)
-
-    print("Prompt in", model_a, "but not in", model_b, ":\n")
-    for p in prompts_not_in_b:
-        print(p)
-
-    print("\n")
-    print("Prompt in", model_b, "but not in", model_a, ":\n")
-    print()
-    for p in prompts_not_in_a:
-        print(p)
\ No newline at end of file
+        for error in response.get('Errors', []):
+            print(f"Error deleting {error['Key']}: {error.get('Message')}")
+        yield [deleted['Key'] for deleted in response.get('Deleted', [])]
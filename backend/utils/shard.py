@@ -0,0 +1,105 @@
+import argparse
+import sys
+from dotenv import load_dotenv
+from resume import prompt_object_name, shard_prompts
+from s3_export import load_prompts
+from s3_utils import delete_s3_objects, get_s3_json, model_manifest_name, put_s3_json, shard_manifest_name
+
+# Coordinator of sharded runs: the prompt set is split across N nodes, each running
+#   /bin/bash run_inference.sh --model <model> --shard <index>/<N>
+# Every node generates and uploads its shard and records it in its own shard manifest
+# (<model>/_manifest.shard-<index>-of-<N>.json). Once all nodes have finished, `merge`
+# folds the shard manifests into the model manifest, which refresh_db reads.
+
+
+def plan_shards(prompts, num_shards):
+    """
+    :param prompts: List of prompts.
+    :param num_shards: Number of shards.
+    :return: List of the prompts of each shard.
+    """
+    return [shard_prompts(prompts, f"{index}/{num_shards}") for index in range(num_shards)]
+
+
+def merge_shard_manifests(bucket_name, model, num_shards, keep_shards=False):
+    """
+    Merge the shard manifests of a model into its model manifest.
+
+    Entries of the shards are added to (or replace) the entries of the model
+    manifest. Merged shard manifests are deleted, so merging again after a
+    missing shard has finished only adds that shard.
+
+    :param bucket_name: Name of the S3 bucket.
+    :param model: Name of the model.
+    :param num_shards: Number of shards of the run.
+    :param keep_shards: Keep the shard manifests after merging them.
+    :return: The merged model manifest and the list of the indices of the shards that have not finished.
+    """
+    manifest_name = model_manifest_name(model)
+    manifest = get_s3_json(bucket_name, manifest_name) or {"model": model, "videos": {}}
+
+    merged, missing = [], []
+    for index in range(num_shards):
+        shard_manifest = get_s3_json(bucket_name, shard_manifest_name(model, index, num_shards))
+        if shard_manifest is None:
+            missing.append(index)
+            continue
+        manifest["videos"].update(shard_manifest["videos"])
+        merged.append(index)
+        print(f"Shard {index}/{num_shards} of {model}: {len(shard_manifest['videos'])} videos.")
+
+    if merged:
+        if put_s3_json(bucket_name, manifest_name, manifest) is None:
+            raise RuntimeError(f"Failed to write {manifest_name}")
+        if not keep_shards:
+            for _ in delete_s3_objects(bucket_name, [shard_manifest_name(model, index, num_shards) for index in merged]):
+                pass
+        print(f"Merged {len(merged)} shards into {manifest_name} ({len(manifest['videos'])} videos in total).")
+
+    return manifest, missing
+
+
+if __name__ == "__main__":
+
+    load_dotenv("/home/ubuntu/text2vid-viewer/.env")
+
+    parser = argparse.ArgumentParser(description="Split the prompts of a run across nodes and merge the manifests of the shards")
+    parser.add_argument("action", choices=["plan", "merge"], help="plan: print the shards and the command of each node; merge: merge the shard manifests")
+    parser.add_argument("--num_shards", type=int, required=True, help="Number of shards (nodes)")
+    parser.add_argument("--models", type=str, nargs="+", default=["all"], help="Models of the run")
+    parser.add_argument("--prompt_csv", type=str, default="/home/ubuntu/text2vid-viewer/prompts.csv", help="Path to the prompt csv file")
+    parser.add_argument("--bucket_name", type=str, default="text2videoviewer", help="Name of the S3 bucket")
+    parser.add_argument("--keep_shards", action="store_true", help="Keep the shard manifests after merging them")
+    args = parser.parse_args()
+
+    if args.num_shards < 1:
+        raise ValueError("--num_shards must be at least 1")
+
+    prompts, _ = load_prompts(args.prompt_csv)
+    shards = plan_shards(prompts, args.num_shards)
+
+    if args.action == "plan":
+        for model in args.models:
+            for index, shard in enumerate(shards):
+                print(f"# Node {index}: {len(shard)} prompts")
+                print(f"/bin/bash run_inference.sh --model {model} --shard {index}/{args.num_shards}")
+        print(f"# Then: python backend/utils/shard.py merge --num_shards {args.num_shards} --models <models>")
+
+    else:
+        if "all" in args.models:
+            parser.error("merge needs the model names (--models cog mochi ...)")
+
+        incomplete = False
+        for model in args.models:
+            manifest, missing = merge_shard_manifests(args.bucket_name, model, args.num_shards, keep_shards=args.keep_shards)
+
+            # Prompts of each shard that are not in the model manifest (shards merged earlier have no manifest left)
+            for index, shard in enumerate(shards):
+                absent = [prompt for prompt in shard if prompt_object_name(model, prompt) not in manifest["videos"]]
+                if absent:
+                    status = "has not finished" if index in missing else "finished"
+                    print(f"Shard {index}/{args.num_shards} of {model} {status}, {len(absent)} prompts missing.")
+                    incomplete = True
+
+        if incomplete:
+            sys.exit(1)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The utils are scripts importing each other by module name (run from backend/utils)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
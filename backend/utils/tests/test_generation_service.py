@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from generation_service import GenerationServer, GenerationService
+from resume import ResumeIndex, output_file_name
+
+
+class StubPipeline:
+    """
+    Stands in for the model: writes a small file per prompt, fails on prompts containing "boom",
+    and waits for `release` so tests can fill the queue while a job is running.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def generate(self, prompt, output_path, params):
+        self.release.wait(timeout=10)
+        self.calls.append(prompt)
+        if "boom" in prompt:
+            raise RuntimeError("stub failure")
+        with open(output_path, "wb") as f:
+            f.write(b"video")
+
+
+def make_params(prompt, options):
+    if set(options) - {"seed"}:
+        raise ValueError(f"Unknown options: {', '.join(sorted(set(options) - {'seed'}))}")
+    return {"model": "cog", "prompt": prompt, "seed": int(options.get("seed", 42))}
+
+
+@pytest.fixture
+def service(tmp_path):
+    pipeline = StubPipeline()
+    service = GenerationService(
+        "cog", pipeline.generate, make_params,
+        output_path=lambda params: str(tmp_path / output_file_name(params)),
+        max_queue=2,
+        resume_index=ResumeIndex("cog", check_s3=False),
+    )
+    server = GenerationServer(("127.0.0.1", 0), service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    service.pipeline = pipeline
+    service.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield service
+    pipeline.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def call(service, method, path, body=None):
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(service.url + path, method=method, data=data)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def wait_for(service, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        _, job = call(service, "GET", f"/jobs/{job_id}")
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise TimeoutError(job_id)
+
+
+def wait_until_running(service):
+    deadline = time.time() + 5
+    while service.stats()["running"] is None:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_job_runs_and_reports_outputs(service):
+    status, job = call(service, "POST", "/generate", {"model": "cog", "prompt": ["a cat", "a dog"]})
+    assert status == 200 and job["status"] == "queued"
+    assert [output["prompt"] for output in job["outputs"]] == ["a cat", "a dog"]
+
+    service.pipeline.release.set()
+    job = wait_for(service, job["job_id"])
+    assert job["status"] == "succeeded" and job["error"] is None
+    assert all(output["status"] == "succeeded" and os.path.exists(output["path"]) for output in job["outputs"])
+    assert all(os.path.exists(f"{output['path']}.done") for output in job["outputs"])
+
+    # Prompts already generated with the same parameters are not generated again
+    _, again = call(service, "POST", "/generate", {"prompt": "a cat"})
+    again = wait_for(service, again["job_id"])
+    assert again["outputs"][0]["status"] == "cached"
+    assert service.pipeline.calls == ["a cat", "a dog"]
+
+
+def test_full_queue_is_rejected_and_health_reports_it(service):
+    _, running = call(service, "POST", "/generate", {"prompt": ["a cat"]})
+    wait_until_running(service)
+    assert call(service, "POST", "/generate", {"prompt": ["a dog"]})[0] == 200
+    assert call(service, "POST", "/generate", {"prompt": ["a fox"]})[0] == 200
+
+    status, body = call(service, "POST", "/generate", {"prompt": ["a cow"]})
+    assert status == 503 and "queue is full" in body["error"]
+
+    status, health = call(service, "GET", "/health")
+    assert status == 200
+    assert health == {"model": "cog", "queued": 2, "max_queue": 2, "running": running["job_id"]}
+
+    service.pipeline.release.set()
+    wait_for(service, running["job_id"])
+
+
+def test_invalid_requests(service):
+    assert call(service, "POST", "/generate", {"model": "mochi", "prompt": ["a cat"]})[0] == 400
+    assert call(service, "POST", "/generate", {"prompt": []})[0] == 400
+    assert call(service, "POST", "/generate", {"prompt": ["a cat"], "steps": 3})[0] == 400
+    assert call(service, "POST", "/generate", ["a cat"])[0] == 400
+    assert call(service, "GET", "/jobs/unknown")[0] == 404
+    assert call(service, "GET", "/nope")[0] == 404
+
+
+def test_failures_fail_the_job_not_the_worker(service):
+    service.pipeline.release.set()
+
+    _, job = call(service, "POST", "/generate", {"prompt": ["boom", "a cat"]})
+    job = wait_for(service, job["job_id"])
+    assert job["status"] == "failed" and job["error"] == "stub failure"
+    assert [output["status"] for output in job["outputs"]] == ["failed", "succeeded"]
+
+    # An error outside of generate (here in the resume check) fails the job; the worker keeps running
+    def broken_find_completed(output_path, params):
+        raise OSError("disk error")
+
+    find_completed = service.resume_index.find_completed
+    service.resume_index.find_completed = broken_find_completed
+    _, job = call(service, "POST", "/generate", {"prompt": ["a dog"]})
+    job = wait_for(service, job["job_id"])
+    assert job["status"] == "failed" and job["error"] == "disk error"
+    assert job["outputs"][0]["status"] == "failed"
+
+    service.resume_index.find_completed = find_completed
+    _, job = call(service, "POST", "/generate", {"prompt": ["a dog"]})
+    assert wait_for(service, job["job_id"])["status"] == "succeeded"
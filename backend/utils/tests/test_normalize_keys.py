@@ -0,0 +1,39 @@
+from normalize_keys import plan_renames, rewrite_manifest
+
+
+def test_renditions_and_manifest_are_planned_with_their_video():
+    plan = plan_renames([
+        "cog/_manifest.json", "cog/A dog, running!.mp4", "cog/poster/A dog, running!.jpg",
+        "cog/hls/A dog, running!/240p/seg_000.ts", "mochi/_manifest.json", "mochi/clean.mp4",
+    ])
+    assert [(step["old_key"], step["new_key"], step["action"]) for step in plan] == [
+        ("cog/A dog, running!.mp4", "cog/A dog running!.mp4", "rename"),
+        ("cog/hls/A dog, running!/240p/seg_000.ts", "cog/hls/A dog running!/240p/seg_000.ts", "rename"),
+        ("cog/poster/A dog, running!.jpg", "cog/poster/A dog running!.jpg", "rename"),
+        ("cog/_manifest.json", "cog/_manifest.json", "manifest"),  # mochi has nothing to rename
+    ]
+
+
+def test_duplicates_are_deleted():
+    plan = plan_renames(["cog/'x'.mp4", "cog/x.mp4", "cog/poster/'x'.jpg"])
+    assert [step["action"] for step in plan] == ["delete", "rename"]
+
+
+def test_rewrite_manifest():
+    manifest = {"videos": {
+        "cog/a, b.mp4": {"object_name": "cog/a, b.mp4", "prompt": "a, b", "poster_name": "cog/poster/a, b.jpg",
+                         "preview_name": "", "hls_name": "cog/hls/a, b/master.m3u8", "fingerprint": "f1"},
+        "cog/'x'.mp4": {"object_name": "cog/'x'.mp4", "prompt": "'x'", "fingerprint": "f2"},
+        "cog/x.mp4": {"object_name": "cog/x.mp4", "prompt": "x", "fingerprint": "f3"},
+    }}
+    steps = plan_renames(list(manifest["videos"]) + ["cog/poster/a, b.jpg", "cog/hls/a, b/master.m3u8"])
+
+    assert rewrite_manifest(manifest, steps) == 2
+    assert manifest["videos"] == {
+        "cog/a b.mp4": {"object_name": "cog/a b.mp4", "prompt": "a b", "poster_name": "cog/poster/a b.jpg",
+                        "preview_name": "", "hls_name": "cog/hls/a b/master.m3u8", "fingerprint": "f1"},
+        "cog/x.mp4": {"object_name": "cog/x.mp4", "prompt": "x", "fingerprint": "f3"},
+    }
+
+    # Rewriting again (a resumed run) changes nothing
+    assert rewrite_manifest(manifest, steps) == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from offload import GB, apply_offload_policy, choose_offload_policy, choose_vae_tiling
+
+# Weights of CogVideoX-5b in bfloat16
+COMPONENTS = {"text_encoder": 9.5 * GB, "transformer": 11 * GB, "vae": 0.4 * GB}
+
+
+class FakeVae:
+    def __init__(self):
+        self.slicing = self.tiling = False
+
+    def enable_slicing(self):
+        self.slicing = True
+
+    def enable_tiling(self):
+        self.tiling = True
+
+
+class FakePipeline:
+    def __init__(self):
+        self.vae = FakeVae()
+        self.placement = None
+
+    def to(self, device):
+        self.placement = device
+
+    def enable_model_cpu_offload(self):
+        self.placement = "model"
+
+    def enable_sequential_cpu_offload(self):
+        self.placement = "sequential"
+
+
+@pytest.mark.parametrize("free_gb, policy", [
+    (80, "none"),
+    (20.9 + 8, "none"),  # Exactly fits
+    (28, "model"),
+    (11 + 8, "model"),
+    (18.9, "sequential"),
+    (4, "sequential"),
+])
+def test_offload_thresholds(free_gb, policy):
+    assert choose_offload_policy(free_gb * GB, COMPONENTS, 8 * GB)[0] == policy
+
+
+def test_vae_tiling_only_when_decoding_does_not_fit():
+    assert choose_vae_tiling("none", 80 * GB, COMPONENTS, 24 * GB)[0] is False
+    assert choose_vae_tiling("none", 40 * GB, COMPONENTS, 24 * GB)[0] is True
+    assert choose_vae_tiling("model", 28 * GB, COMPONENTS, 24 * GB)[0] is False  # Only the VAE is on the device
+    assert choose_vae_tiling("model", 20 * GB, COMPONENTS, 24 * GB)[0] is True
+    assert choose_vae_tiling("sequential", 80 * GB, COMPONENTS, 24 * GB)[0] is True
+    assert choose_vae_tiling("none", 80 * GB, COMPONENTS, None)[0] is True
+
+
+@pytest.mark.parametrize("free_gb, placement, tiling", [
+    (80, "cuda", False),
+    (40, "cuda", True),
+    (28, "model", False),
+    (12, "sequential", True),
+])
+def test_apply_with_mocked_memory_probe(free_gb, placement, tiling, capsys):
+    pipe = FakePipeline()
+    policy, tiled = apply_offload_policy(pipe, decode_bytes=24 * GB, memory_probe=lambda: free_gb * GB,
+                                         size_probe=lambda pipe: COMPONENTS)
+
+    assert pipe.placement == placement and tiled is tiling
+    assert pipe.vae.slicing is tiling and pipe.vae.tiling is tiling
+    assert f"Offload policy: {policy} (" in capsys.readouterr().out
+
+
+def test_command_line_overrides():
+    pipe = FakePipeline()
+    policy, tiled = apply_offload_policy(pipe, "sequential", vae_tiling="off", memory_probe=lambda: 80 * GB,
+                                         size_probe=lambda pipe: COMPONENTS)
+    assert (policy, tiled, pipe.placement, pipe.vae.tiling) == ("sequential", False, "sequential", False)
+
+    with pytest.raises(ValueError):
+        apply_offload_policy(FakePipeline(), "gpu", memory_probe=lambda: 80 * GB, size_probe=lambda pipe: COMPONENTS)
@@ -0,0 +1,88 @@
+import os
+from orchestrate import load_state, pick_gpus, run_jobs, save_state
+
+MODEL_GPUS = {"cog": 1, "pyramidflow": 1, "opensora": 1, "mochi": 4}
+
+
+def fake_command(out_dir, fail=()):
+    """
+    Command of a fake model runner: records its GPUs and start/end times, sleeps, and fails for the models in `fail`.
+    """
+    checks = "".join(f"test {{model}} != {model} && " for model in fail)
+    return (f'sh -c "date +%s%N > {out_dir}/{{model}}.start; echo $CUDA_VISIBLE_DEVICES > {out_dir}/{{model}}.gpus; '
+            f'sleep 0.3; date +%s%N > {out_dir}/{{model}}.end; {checks}true"')
+
+
+def read_run(out_dir, model):
+    def read(extension):
+        with open(os.path.join(out_dir, f"{model}.{extension}")) as f:
+            return f.read().strip()
+    return int(read("start")), int(read("end")), {int(gpu) for gpu in read("gpus").split(",")}
+
+
+def run(tmp_path, models, gpus, fail=(), rerun=False):
+    state_fpath = str(tmp_path / "state.json")
+    state = load_state(state_fpath, models, MODEL_GPUS, rerun=rerun)
+    return run_jobs(state, state_fpath, gpus, fake_command(tmp_path, fail), str(tmp_path / "logs"), poll_interval=0.05)
+
+
+def test_pick_gpus():
+    assert pick_gpus([0, 1, 2, 5], 3) == [0, 1, 2]
+    assert pick_gpus([0, 1], 4) is None
+
+
+def test_jobs_run_concurrently_on_disjoint_gpus(tmp_path):
+    models = ["cog", "pyramidflow", "opensora", "mochi"]
+    state = run(tmp_path, models, gpus=list(range(6)))
+
+    assert all(job["status"] == "succeeded" for job in state.values())
+    runs = {model: read_run(tmp_path, model) for model in models}
+
+    # The largest job is started first, on the first GPUs
+    assert runs["mochi"][2] == {0, 1, 2, 3}
+    assert all(len(runs[model][2]) == 1 for model in ["cog", "pyramidflow", "opensora"])
+
+    # Jobs running at the same time never share a GPU, and the 7 GPUs needed did not all run at once
+    overlapping = 0
+    for i, a in enumerate(models):
+        for b in models[i + 1:]:
+            (start_a, end_a, gpus_a), (start_b, end_b, gpus_b) = runs[a], runs[b]
+            if start_a < end_b and start_b < end_a:
+                overlapping += 1
+                assert not gpus_a & gpus_b, (a, b)
+    assert 0 < overlapping < 6
+
+
+def test_rerun_resumes_failed_jobs_only(tmp_path):
+    models = ["cog", "opensora", "mochi"]
+    state = run(tmp_path, models, gpus=list(range(4)), fail=["opensora"])
+    assert {model: job["status"] for model, job in state.items()} == \
+        {"cog": "succeeded", "opensora": "failed", "mochi": "succeeded"}
+
+    for model in models:
+        os.remove(tmp_path / f"{model}.start")
+    state = run(tmp_path, models, gpus=list(range(4)))
+
+    assert all(job["status"] == "succeeded" for job in state.values())
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".start")) == ["opensora.start"]
+    assert state["opensora"]["attempts"] == 2 and state["cog"]["attempts"] == 1
+
+    # --rerun runs every model again
+    state = run(tmp_path, models, gpus=list(range(4)), rerun=True)
+    assert [state[model]["attempts"] for model in models] == [2, 3, 2]
+
+
+def test_interrupted_jobs_are_pending_again(tmp_path):
+    state_fpath = str(tmp_path / "state.json")
+    state = load_state(state_fpath, ["cog", "mochi"], MODEL_GPUS)
+    state["cog"].update(status="running", gpus=[0], attempts=1)  # The orchestrator was killed while cog was running
+    save_state(state_fpath, state)
+
+    state = load_state(state_fpath, ["cog", "mochi"], MODEL_GPUS)
+    assert state["cog"]["status"] == "pending" and state["cog"]["attempts"] == 1
+
+
+def test_job_needing_more_gpus_than_available_fails(tmp_path):
+    state = run(tmp_path, ["cog", "mochi"], gpus=[0, 1])
+    assert state["mochi"]["status"] == "failed" and state["mochi"]["attempts"] == 0
+    assert state["cog"]["status"] == "succeeded"
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from s3_utils import get_s3_client
+
+
+class VideoCache:
+    """
+    Size-capped LRU cache of S3 objects on local disk, used by the frontend server's /video/ route.
+
+    Objects are stored under the SHA-256 of their name (keeping the extension
+    for the Content-Type). Concurrent requests for the same missing object
+    share a single download. When the cache grows past `max_bytes`, the least
+    recently used objects are deleted; clients still reading a deleted file
+    are not affected.
+    """
+
+    def __init__(self, cache_dir, bucket_name="text2videoviewer", max_bytes=20 * 1024 ** 3, max_workers=4):
+        """
+        :param cache_dir: Directory of the cached objects. Objects already in it are reused.
+        :param bucket_name: Name of the S3 bucket.
+        :param max_bytes: Maximum total size of the cached objects.
+        :param max_workers: Number of background downloads (see `fill_async`).
+        """
+        self.cache_dir = cache_dir
+        self.bucket_name = bucket_name
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self._size = 0
+        self._inflight = {}  # object name -> Event set when its download finishes
+        self._pending = set()  # object names submitted by `fill_async` and not finished yet
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._stats = {"hits": 0, "misses": 0, "fetches": 0, "fetched_bytes": 0, "evictions": 0, "failed_fills": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Reuse the objects of a previous run, oldest access first
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # Interrupted download
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_atime, name, stat.st_size))
+
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        self._evict()
+
+    def file_name(self, object_name):
+        return hashlib.sha256(object_name.encode("utf-8")).hexdigest() + os.path.splitext(object_name)[1]
+
+    def lookup(self, object_name):
+        """
+        Return the cached copy of an object, counting the request as a hit or a miss.
+
+        :param object_name: S3 object name.
+        :return: Path to the cached file, or None if the object is not cached.
+        """
+        name = self.file_name(object_name)
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self._stats["hits"] += 1
+                return os.path.join(self.cache_dir, name)
+            self._stats["misses"] += 1
+            return None
+
+    def fill(self, object_name):
+        """
+        Download an object into the cache, unless it is already cached or being downloaded.
+
+        :param object_name: S3 object name.
+        :return: Path to the cached file.
+        :raises FileNotFoundError: The object does not exist in the bucket.
+        """
+        name = self.file_name(object_name)
+        path = os.path.join(self.cache_dir, name)
+
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                return path
+            event = self._inflight.get(object_name)
+            owner = event is None
+            if owner:
+                event = self._inflight[object_name] = threading.Event()
+                event.error = None
+
+        if not owner:
+            # Another request is downloading the object; wait for it and share its result
+            event.wait()
+            if event.error is not None:
+                raise event.error
+            return path
+
+        try:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                get_s3_client().download_file(self.bucket_name, object_name, tmp_path)
+            except ClientError as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                    raise FileNotFoundError(object_name) from e
+                raise
+            os.replace(tmp_path, path)
+
+            size = os.path.getsize(path)
+            with self._lock:
+                self._entries[name] = size
+                self._size += size
+                self._stats["fetches"] += 1
+                self._stats["fetched_bytes"] += size
+                self._evict(keep=name)
+            return path
+        except Exception as e:
+            event.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[object_name]
+            event.set()
+
+    def fill_async(self, object_name):
+        """
+        Start downloading an object in the background (see `fill`). An object that is already
+        cached, submitted or being downloaded is not submitted again, so repeated Range requests
+        for a cold object do not take several workers. A failed download is printed and counted
+        in the 'failed_fills' stat; the next request for the object retries it.
+        """
+        with self._lock:
+            if self.file_name(object_name) in self._entries:
+                return
+            if object_name in self._pending or object_name in self._inflight:
+                return
+            self._pending.add(object_name)
+        future = self._executor.submit(self.fill, object_name)
+        future.add_done_callback(lambda f: self._report_fill(object_name, f))
+
+    def _report_fill(self, object_name, future):
+        with self._lock:
+            self._pending.discard(object_name)
+        error = future.exception()
+        if error is None:
+            return
+        print(f"Background download of {object_name} failed: {error!r}")
+        with self._lock:
+            self._stats["failed_fills"] += 1
+
+    def _evict(self, keep=None):
+        # Called with the lock held (or before the cache is shared)
+        while self._size > self.max_bytes and self._entries:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break  # A single object larger than the cache is kept until the next insertion
+            del self._entries[name]
+            self._size -= size
+            self._stats["evictions"] += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """
+        :return: A dict with the 'hits', 'misses', 'hit_ratio', 'fetches', 'fetched_bytes',
+            'evictions', 'failed_fills', 'objects', 'bytes' and 'max_bytes' of the cache.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            requests = stats["hits"] + stats["misses"]
+            stats["hit_ratio"] = stats["hits"] / requests if requests else 0.0
+            stats["objects"] = len(self._entries)
+            stats["bytes"] = self._size
+            stats["max_bytes"] = self.max_bytes
+        return stats
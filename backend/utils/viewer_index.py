@@ -0,0 +1,71 @@
+import json
+import os
+
+# Columns of every row in the index, in order
+INDEX_COLUMNS = ["model", "prompt", "base_prompt", "object_name", "poster_name", "preview_name", "hls_name"]
+
+
+def build_viewer_index(rows):
+    """
+    Build the pre-indexed catalog loaded by the viewer (frontend/index.html).
+
+    Rows are stored once as arrays; every lookup the viewer needs refers to
+    them by position:
+    - "models": model -> row ids, in catalog order.
+    - "prompts": prompt -> row ids, in catalog order.
+    - "pairs": model -> [row id A, row id B] where A's prompt is B's base_prompt,
+      deduplicated by object name. This is the "Prompt side-by-side" table.
+
+    :param rows: Iterable of dicts with 'model', 'prompt', 'base_prompt' and 'object_name', and
+        optionally 'poster_name', 'preview_name' and 'hls_name'.
+    :return: The index as a JSON-serializable dict.
+    """
+    index = {"columns": INDEX_COLUMNS, "rows": [], "models": {}, "prompts": {}, "pairs": {}}
+    by_base_prompt = {}  # (model, base_prompt) -> row ids
+
+    for row in rows:
+        values = [_clean(row.get(column)) for column in INDEX_COLUMNS]
+        model, prompt, base_prompt = values[:3]
+        row_id = len(index["rows"])
+
+        index["rows"].append(values)
+        index["models"].setdefault(model, []).append(row_id)
+        index["prompts"].setdefault(prompt, []).append(row_id)
+        if base_prompt:
+            by_base_prompt.setdefault((model, base_prompt), []).append(row_id)
+
+    object_name = INDEX_COLUMNS.index("object_name")
+    for model, row_ids in index["models"].items():
+        pairs = []
+        seen = set()
+        for a in row_ids:
+            prompt = index["rows"][a][1]
+            for b in by_base_prompt.get((model, prompt), []):
+                key = (index["rows"][a][object_name], index["rows"][b][object_name])
+                if key not in seen:
+                    seen.add(key)
+                    pairs.append([a, b])
+        index["pairs"][model] = pairs
+
+    return index
+
+
+def write_viewer_index(index, index_fpath):
+    """
+    Write the index compactly. The file is written next to its final path and
+    then renamed, so the server never serves a half-written index.
+
+    :param index: Index from `build_viewer_index`.
+    :param index_fpath: Path to the output JSON file.
+    """
+    tmp_fpath = f"{index_fpath}.tmp"
+    with open(tmp_fpath, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_fpath, index_fpath)
+
+
+def _clean(value):
+    # Missing CSV/DataFrame values (None, NaN) become empty strings
+    if value is None or value != value:
+        return ""
+    return str(value).strip()
@@ -36,14 +36,9 @@ venv/bin/python3 -m pip install --upgrade pip || { echo "Failed to upgrade pip";
 
 
 # Install dependencies in the virtual environment
-venv/bin/python3 -m pip install flatbuffers boto3 python-dotenv pandas tqdm || { echo "Failed to install dependencies"; exit 1; }
+venv/bin/python3 -m pip install flatbuffers boto3 python-dotenv pandas tqdm brotli || { echo "Failed to install dependencies"; exit 1; }
 echo "Installed dependencies"
 
-# Refresh db.csv
-venv/bin/python3 backend/utils/refresh_db.py || { echo "Failed to refresh db.csv"; exit 1; }
-echo "Refreshed db.csv"
-
-# Run frontend server
+# Run frontend server; it serves the last known db.csv right away and refreshes it hourly in the background
 echo "Running frontend server"
-cd frontend
-../venv/bin/python3 -m http.server 8000
+venv/bin/python3 backend/utils/frontend_server.py --directory frontend --port 8000 --refresh_interval 3600
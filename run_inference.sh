@@ -15,6 +15,12 @@ while [[ $# -gt 0 ]]; do
             shift # past argument
             shift # past value
             ;;
+        --shard)
+            # Shard of the prompts generated on this node, <index>/<count> (e.g. 0/4); see backend/utils/shard.py
+            export SHARD="$2"
+            shift # past argument
+            shift # past value
+            ;;
         *)
             echo "Unknown argument: $1"
             exit 1
@@ -29,19 +35,12 @@ if [ "$MODEL" != "all" ] && [ ! -d "/home/ubuntu/text2vid-viewer/backend/models/
     exit 1
 fi
 
-echo "Model set to: $MODEL"
+if [ -n "$SHARD" ] && ! [[ "$SHARD" =~ ^[0-9]+/[0-9]+$ ]]; then
+    echo "Invalid shard (expected <index>/<count>, e.g. 0/4): $SHARD"
+    exit 1
+fi
 
-# Function to run inference for a single model (and export to S3)
-run_inference() {
-    MODEL="$1"
-    echo "Running inference for model: $MODEL"
-    DEPLOY_SCRIPT="/home/ubuntu/text2vid-viewer/backend/models/$MODEL/deploy.sh"
-    /bin/bash "${DEPLOY_SCRIPT}" || { echo "Failed to run inference for model: $MODEL"; exit 1; }
-    python /home/ubuntu/text2vid-viewer/backend/utils/s3_export.py --model "$MODEL" --prompt_csv "$PROMPT_CSV_PATH" || { echo "Failed to export videos to S3"; exit 1; }
-    echo "Completed inference for model: $MODEL"
-    echo "-----------------------------------"
-    echo ""
-}
+echo "Model set to: $MODEL${SHARD:+ (shard $SHARD)}"
 
 # Load environment variables from the .env file
 if [ -f $ENV_PATH ]; then
@@ -76,14 +75,15 @@ pip install boto3 python-dotenv pandas || { echo "Failed to install dependencies
 # Create log and data directories owned by ubuntu
 mkdir -p /home/ubuntu/logs /home/ubuntu/data
 
+# Models run concurrently on disjoint sets of GPUs; a failed model does not stop the others.
+# The job state is kept in /home/ubuntu/logs/inference_state.json: rerunning resumes the models that did not succeed.
 if [ "$MODEL" == "all" ]; then
     echo "Running inference for all models..."
-    for model in $(ls -d /home/ubuntu/text2vid-viewer/backend/models/*/ | xargs -n 1 basename); do
-        mkdir -p /home/ubuntu/data/"$model"
-        run_inference "$model"
-    done
+    python /home/ubuntu/text2vid-viewer/backend/utils/orchestrate.py \
+        --models $(ls -d /home/ubuntu/text2vid-viewer/backend/models/*/ | xargs -n 1 basename) \
+        || { echo "Failed to run inference for some models"; exit 1; }
 else
-    run_inference "$MODEL"
+    /bin/bash /home/ubuntu/text2vid-viewer/backend/utils/run_model.sh "$MODEL" || exit 1
 fi
 
 echo "Completed run_inference.sh"
\ No newline at end of file